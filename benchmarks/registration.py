@@ -0,0 +1,65 @@
+"""Registration (startup) time benchmark
+
+Register a few hundred documents and embedded documents, with and without
+lazy registration, then instantiate each document once.
+
+    python benchmarks/registration.py [--documents 400]
+"""
+import argparse
+import time
+
+from umongo import Document, EmbeddedDocument, fields
+from umongo.frameworks import PyMongoInstance
+
+
+def make_templates(count):
+    """Generate `count` documents, each with its own embedded document,
+    and a child document for every tenth one"""
+    templates = []
+    for i in range(count):
+        embedded = type('Embedded%s' % i, (EmbeddedDocument, ), {
+            'name': fields.StrField(),
+            'value': fields.IntField(),
+            'tags': fields.ListField(fields.StrField()),
+        })
+        doc = type('Doc%s' % i, (Document, ), {
+            'name': fields.StrField(required=True),
+            'created': fields.DateTimeField(),
+            'count': fields.IntField(default=0),
+            'scores': fields.DictField(values=fields.FloatField()),
+            'emb': fields.EmbeddedField(embedded),
+            'embs': fields.ListField(fields.EmbeddedField(embedded)),
+        })
+        templates += [embedded, doc]
+        if i % 10 == 0:
+            templates.append(type('ChildDoc%s' % i, (doc, ), {'extra': fields.StrField()}))
+    return templates
+
+
+def run(templates, lazy):
+    instance = PyMongoInstance(lazy=lazy)
+    start = time.perf_counter()
+    implementations = [instance.register(template) for template in templates]
+    registered = time.perf_counter()
+    for impl in implementations:
+        impl()
+    used = time.perf_counter()
+    return registered - start, used - registered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=400)
+    args = parser.parse_args()
+
+    templates = make_templates(args.documents)
+    print('%d templates' % len(templates))
+    print('%-8s %14s %14s' % ('mode', 'register (ms)', 'first use (ms)'))
+    for lazy in (False, True):
+        register, first_use = run(templates, lazy)
+        print('%-8s %14.1f %14.1f' % (
+            'lazy' if lazy else 'eager', register * 1000, first_use * 1000))
+
+
+if __name__ == '__main__':
+    main()
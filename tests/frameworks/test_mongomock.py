@@ -1,7 +1,13 @@
 import datetime as dt
+from unittest import mock
 
 import pytest
 
+from pymongo.errors import BulkWriteError, OperationFailure
+import marshmallow as ma
+
+from umongo import Document, fields, exceptions
+
 from ..common import TEST_DB
 
 DEP_ERROR = 'Missing mongomock'
@@ -16,6 +22,7 @@ else:
 
 if not dep_error:  # Make sure the module is valid by importing it
     from umongo.frameworks import mongomock  # noqa
+    from umongo.frameworks import MongoMockInstance
 
 
 def make_db():
@@ -42,3 +49,247 @@ def test_mongomock(classroom_model):
     assert john2._data == john._data
     johns = Student.find()
     assert list(johns) == [john]
+
+
+@pytest.mark.skipif(dep_error, reason=DEP_ERROR)
+def test_watch(db):
+    mongomock.reset_change_events()
+    instance = MongoMockInstance(db)
+
+    @instance.register
+    class Animal(Document):
+        name = fields.StrField(attribute='n')
+        age = fields.IntField()
+
+        class Meta:
+            allow_inheritance = True
+
+    @instance.register
+    class Dog(Animal):
+        pass
+
+    Animal.collection.drop()
+    db.checkpoints.drop()
+    Animal(name='Garfield').commit()
+    # Only the changes made once watched are provided
+    events = Animal.watch()
+    dog_events = Dog.watch(filter={'age': {'$gt': 2}})
+    rex = Dog(name='Rex', age=1)
+    rex.commit()
+    rex.age = 3
+    del rex.name
+    rex.commit()
+    rex.commit(replace=True)
+    rex.delete()
+
+    insert, update, replace, delete = list(events)
+    assert insert.operation_type == 'insert'
+    assert insert.document_id == rex.id
+    assert isinstance(insert.document, Dog)
+    assert insert.document.age == 1
+    assert insert.update_description is None
+    assert update.operation_type == 'update'
+    assert update.update_description.updated_fields == {'age': 3}
+    assert update.update_description.removed_fields == ['name']
+    # Document looked up when read
+    assert update.document is None
+    assert replace.operation_type == 'replace'
+    assert replace.document.age == 3
+    assert delete.operation_type == 'delete'
+    assert delete.document is None
+    assert delete.document_id == rex.id
+    # Filter applies to the changed document, mapped to the database names
+    assert [e.operation_type for e in dog_events] == ['replace']
+
+    # Child documents only get their own events
+    events = Dog.watch(full_document=None)
+    cat = Animal(name='Tom')
+    cat.commit()
+    rex = Dog(name='Rex')
+    rex.commit()
+    cat.delete()
+    assert [e.operation_type for e in events] == ['insert', 'delete']
+
+    # Resume after the last processed event, the one provided last not being
+    # processed until the next one is requested
+    events = Animal.watch(checkpoint_collection='checkpoints')
+    Animal(name='Felix').commit()
+    Animal(name='Sylvester').commit()
+    assert next(events).document.name == 'Felix'
+    assert next(events).document.name == 'Sylvester'
+    events.close()
+    felix = Animal.find_one({'name': 'Felix'})
+    felix.age = 2
+    felix.commit()
+    assert db.checkpoints.find_one({'_id': 'animal'})['resume_token'] is not None
+    events = Animal.watch(checkpoint_collection='checkpoints')
+    sylvester, event = list(events)
+    assert sylvester.document.name == 'Sylvester'
+    assert event.document.name == 'Felix'
+    assert event.document.age == 2
+
+    # Pipeline paths of the changed document use the fields' name
+    events = Animal.watch(pipeline=[{'$match': {'fullDocument.name': 'Rex'}}])
+    Animal(name='Felix').commit()
+    Dog(name='Rex').commit()
+    assert [e.document.name for e in events] == ['Rex']
+
+
+@pytest.mark.skipif(dep_error, reason=DEP_ERROR)
+def test_watch_events_by_client(db):
+    mongomock.reset_change_events()
+    other_db = make_db()
+    instance = MongoMockInstance(db)
+    other_instance = MongoMockInstance(other_db)
+
+    class Cat(Document):
+        name = fields.StrField()
+        version = fields.IntField()
+
+        class Meta:
+            version_field = 'version'
+
+    Cat = instance.register(Cat)
+    OtherCat = other_instance.register(Cat)
+    events = Cat.watch()
+    # The other client, with the same address, has its own events
+    OtherCat(name='Garfield').commit()
+    # Written payload recorded, without reading the document back
+    tom = Cat(name='Tom')
+    with mock.patch.object(type(Cat.collection), 'find_one') as find_one:
+        tom.commit()
+        tom.name = 'Thomas'
+        tom.commit()
+    find_one.assert_not_called()
+    insert, update = list(events)
+    assert insert.document.name == 'Tom'
+    assert insert.document.version == 1
+    assert update.update_description.updated_fields == {'name': 'Thomas', 'version': 2}
+
+    # Only the last events are kept
+    with mock.patch.object(mongomock, 'CHANGE_EVENTS_MAX', 2):
+        mongomock.reset_change_events()
+        events = Cat.watch(full_document=None)
+        for name in ('Felix', 'Garfield', 'Sylvester'):
+            Cat(name=name).commit()
+    assert [e.document.name for e in events] == ['Garfield', 'Sylvester']
+
+
+class FakeSession:
+    """Session recording the transactions and failing their commits"""
+
+    def __init__(self, *commit_errors):
+        self.calls = []
+        self.commit_errors = list(commit_errors)
+
+    def start_transaction(self, **kwargs):
+        self.calls.append('start')
+
+    def commit_transaction(self):
+        self.calls.append('commit')
+        if self.commit_errors:
+            raise OperationFailure(
+                'Commit failed', details={'errorLabels': [self.commit_errors.pop(0)]})
+
+    def abort_transaction(self):
+        self.calls.append('abort')
+
+
+@pytest.mark.skipif(dep_error, reason=DEP_ERROR)
+def test_transaction(db):
+    instance = MongoMockInstance(db)
+
+    @instance.register
+    class Account(Document):
+        name = fields.StrField()
+        balance = fields.IntField(attribute='b')
+
+        class Meta:
+            version_field = 'version'
+
+    @instance.register
+    class Log(Document):
+        message = fields.StrField()
+
+    Account.collection.drop()
+    Log.collection.drop()
+    alice = Account(name='Alice', balance=10)
+    alice.commit()
+    bob = Account(name='Bob', balance=0)
+    bob.commit()
+
+    # Writes are queued and written together on exit
+    session = FakeSession()
+    with instance.transaction(session, backoff=0) as transaction:
+        alice.balance -= 5
+        transaction.commit(alice)
+        bob.balance += 5
+        transaction.commit(bob)
+        log = Log(message='Transfer')
+        transaction.commit(log)
+        assert Log.count_documents() == 0
+        assert session.calls == []
+    assert session.calls == ['start', 'commit']
+    assert log.is_created
+    assert Log.find_one(log.id).message == 'Transfer'
+    assert not alice.is_modified()
+    assert alice.version == 2
+    assert db.account.find_one(alice.id) == {
+        '_id': alice.id, 'name': 'Alice', 'b': 5, 'version': 2}
+    assert db.account.find_one(bob.id)['b'] == 5
+
+    # Commit retried when its result is unknown
+    session = FakeSession('UnknownTransactionCommitResult')
+    with instance.transaction(session, backoff=0) as transaction:
+        transaction.delete(log)
+    assert session.calls == ['start', 'commit', 'commit']
+    assert not log.is_created
+    assert Log.count_documents() == 0
+
+    # Transaction started over on transient errors
+    # (mongomock doesn't roll back the writes, so only replay updates)
+    log = Log(message='Transfer')
+    log.commit()
+    session = FakeSession('TransientTransactionError', 'TransientTransactionError')
+    log.message = 'Retried'
+    with instance.transaction(session, backoff=0) as transaction:
+        transaction.commit(log)
+    assert session.calls == ['start', 'commit'] * 3
+    assert Log.find_one(log.id).message == 'Retried'
+    session = FakeSession(*['TransientTransactionError'] * 3)
+    log.message = 'Failed'
+    with pytest.raises(OperationFailure):
+        with instance.transaction(session, max_retries=2, backoff=0) as transaction:
+            transaction.commit(log)
+    assert session.calls == ['start', 'commit'] * 3
+    assert log.is_modified()
+
+    # Conditions not satisfied
+    session = FakeSession()
+    alice.balance = 0
+    with pytest.raises(exceptions.UpdateError):
+        with instance.transaction(session) as transaction:
+            transaction.commit(alice, conditions={'b': 42})
+    assert session.calls == ['start', 'abort']
+    assert alice.is_modified()
+
+    # Nothing written on error within the context
+    session = FakeSession()
+    with pytest.raises(RuntimeError):
+        with instance.transaction(session) as transaction:
+            transaction.commit(Log(message='Lost'))
+            raise RuntimeError()
+    assert session.calls == []
+    assert Log.count_documents({'message': 'Lost'}) == 0
+
+    # Duplicate keys are reported like with commit
+    session = FakeSession()
+    error = BulkWriteError({'writeErrors': [
+        {'index': 1, 'code': 11000, 'keyPattern': {'name': 1}, 'errmsg': 'E11000'}]})
+    with mock.patch.object(mongomock.MongoMockTransaction, '_bulk_write', side_effect=error):
+        with pytest.raises(ma.ValidationError) as exc:
+            with instance.transaction(session) as transaction:
+                transaction.commit(Account(name='Carol'))
+                transaction.commit(Account(name='Alice'))
+    assert exc.value.messages == {'name': 'Field value must be unique.'}
+    assert session.calls == ['start', 'abort']
@@ -1,5 +1,6 @@
 import asyncio
 import datetime as dt
+import gc
 
 from unittest import mock
 import pytest
@@ -7,8 +8,10 @@ import pytest
 from bson import ObjectId
 import marshmallow as ma
 
-from pymongo.results import InsertOneResult, UpdateResult, DeleteResult
+from pymongo.results import InsertOneResult, UpdateResult, DeleteResult, BulkWriteResult
 from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from pymongo.operations import InsertOne
 from umongo import (
     Document, EmbeddedDocument, MixinDocument, fields, exceptions, Reference
 )
@@ -173,6 +176,15 @@ class TestMotorAsyncIO(BaseDBTest):
             await john.reload()
             assert john.name == 'William Doe'
 
+            # Only reload some fields, the others keep their modified state
+            john2.name = 'Jack Doe'
+            await john2.commit()
+            john.birthday = dt.datetime(1990, 1, 1)
+            await john.reload(fields=['name'])
+            assert john.name == 'Jack Doe'
+            assert john.to_mongo(update=True) == {
+                '$set': {'birthday': dt.datetime(1990, 1, 1)}}
+
         loop.run_until_complete(do_test())
 
     def test_cursor(self, loop, classroom_model):
@@ -251,6 +263,215 @@ class TestMotorAsyncIO(BaseDBTest):
 
         loop.run_until_complete(do_test())
 
+    def test_cursor_batches(self, loop, classroom_model):
+        Student = classroom_model.Student
+
+        async def do_test():
+            await Student.collection.drop()
+
+            for i in range(10):
+                await Student(name='student-%s' % i).commit()
+
+            names = []
+            async for batch in Student.find(skip=1).batches(size=4):
+                assert 0 < len(batch) <= 4
+                assert all(isinstance(elem, Student) for elem in batch)
+                names += [elem.name for elem in batch]
+            assert sorted(names) == sorted('student-%s' % i for i in range(1, 10))
+
+            # Started cursor keeps its batch size, default size
+            cursor = Student.find()
+            first = await cursor.to_list(length=3)
+            names = [elem.name for elem in first]
+            async for batch in cursor.batches():
+                names += [elem.name for elem in batch]
+            assert sorted(names) == sorted('student-%s' % i for i in range(10))
+
+            # to_list is a native coroutine
+            coro = Student.find().to_list(length=2)
+            assert asyncio.iscoroutine(coro)
+            assert len(await coro) == 2
+
+        loop.run_until_complete(do_test())
+
+    def test_cursor_prefetch(self, loop, classroom_model):
+        Student = classroom_model.Student
+
+        async def do_test():
+            await Student.collection.drop()
+
+            for i in range(10):
+                await Student(name='student-%s' % i).commit()
+
+            cursor = Student.find(prefetch=True, batch_size=3)
+            calls = []
+            raw_to_list = cursor.raw_cursor.to_list
+
+            async def to_list(length):
+                calls.append(length)
+                return await raw_to_list(length)
+
+            cursor.raw_cursor.to_list = to_list
+            first = await cursor.__anext__()
+            assert isinstance(first, Student)
+            # Next batch is requested while the first one is consumed
+            assert calls == [3, 3]
+            names = [first.name] + [elem.name async for elem in cursor]
+            assert sorted(names) == sorted('student-%s' % i for i in range(10))
+            assert len(calls) == 5
+
+            sizes = []
+            names = []
+            async for batch in Student.find(prefetch=True, batch_size=4).batches():
+                sizes.append(len(batch))
+                names += [elem.name for elem in batch]
+            assert sizes == [4, 4, 2]
+            assert sorted(names) == sorted('student-%s' % i for i in range(10))
+
+            # Other accessors consume the prefetched batches as well
+            cursor = Student.find(prefetch=True, batch_size=3, sort=[('name', 1)])
+            first = await cursor.__anext__()
+            second = cursor.next_object()
+            rest = await cursor.to_list(None)
+            assert [elem.name for elem in [first, second, *rest]] == [
+                'student-%s' % i for i in range(10)]
+            assert cursor.next_object() is None
+
+            results = []
+            done = asyncio.get_event_loop().create_future()
+
+            def callback(elem, error):
+                if elem is None:
+                    done.set_result(error)
+                else:
+                    results.append(elem.name)
+
+            Student.find(prefetch=True, batch_size=3).each(callback)
+            assert await done is None
+            assert sorted(results) == sorted('student-%s' % i for i in range(10))
+
+            # Closing the cursor cancels the batch requested in background
+            cursor = Student.find(prefetch=True, batch_size=3)
+            await cursor.__anext__()
+            assert cursor._next_batch is not None
+            await cursor.close()
+            assert cursor._next_batch is None
+
+        loop.run_until_complete(do_test())
+
+    def test_cursor_prefetch_early_exit(self, loop, classroom_model):
+        Student = classroom_model.Student
+        errors = []
+
+        async def do_test():
+            await Student.collection.drop()
+
+            for i in range(10):
+                await Student(name='student-%s' % i).commit()
+
+            def failing_cursor(pending=False):
+                cursor = Student.find(prefetch=True, batch_size=3)
+                raw_to_list = cursor.raw_cursor.to_list
+                calls = []
+
+                async def to_list(length):
+                    calls.append(length)
+                    if len(calls) > 1:
+                        if pending:
+                            await asyncio.sleep(10)
+                        raise RuntimeError('Request failed')
+                    return await raw_to_list(length)
+
+                cursor.raw_cursor.to_list = to_list
+                return cursor
+
+            # Closing cancels and awaits the failed request
+            cursor = failing_cursor()
+            await cursor.__anext__()
+            next_batch = cursor._next_batch
+            assert next_batch.done()
+            await cursor.close()
+            assert cursor._next_batch is None
+            del next_batch
+
+            # Pending request is cancelled and awaited as well
+            cursor = failing_cursor(pending=True)
+            await cursor.__anext__()
+            next_batch = cursor._next_batch
+            assert not next_batch.done()
+            await cursor.close()
+            assert next_batch.cancelled()
+            del next_batch
+
+            # Leaving batches early discards the request
+            cursor = failing_cursor()
+            agen = cursor.batches()
+            assert len(await agen.__anext__()) == 3
+            assert cursor._next_batch is not None
+            await agen.aclose()
+            assert cursor._next_batch is None
+
+            # As does a callback stopping each
+            done = asyncio.get_event_loop().create_future()
+            cursor = failing_cursor()
+
+            def callback(elem, error):
+                done.set_result(elem)
+                return False
+
+            cursor.each(callback)
+            assert isinstance(await done, Student)
+            await asyncio.sleep(0)
+            assert cursor._next_batch is None
+
+            # A cursor dropped without being closed doesn't leak the error either
+            cursor = failing_cursor()
+            await cursor.__anext__()
+            del cursor
+
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        try:
+            loop.run_until_complete(do_test())
+            gc.collect()
+            loop.run_until_complete(asyncio.sleep(0))
+            gc.collect()
+        finally:
+            loop.set_exception_handler(None)
+        assert errors == []
+
+    def test_scan(self, loop, instance):
+
+        @instance.register
+        class ScanParent(Document):
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class ScanChild(ScanParent):
+            pass
+
+        async def do_test():
+            await ScanParent.collection.drop()
+            for i in range(50):
+                await ScanParent(value=i).commit()
+            for i in range(50, 60):
+                await ScanChild(value=i).commit()
+
+            for partitions in (1, 4, 100):
+                batches = [
+                    batch async for batch in ScanParent.scan(
+                        partitions=partitions, batch_size=7)]
+                assert all(len(batch) <= 7 for batch in batches)
+                assert sorted(d.value for batch in batches for d in batch) == list(range(60))
+
+            batches = [
+                batch async for batch in ScanParent.scan(
+                    filter={'value': {'$gte': 40}}, partitions=3)]
+            assert sorted(d.value for batch in batches for d in batch) == list(range(40, 60))
+            batches = [batch async for batch in ScanChild.scan(partitions=3, raw=True)]
+            assert sorted(d['v'] for batch in batches for d in batch) == list(range(50, 60))
+
+        loop.run_until_complete(do_test())
+
     def test_classroom(self, loop, classroom_model):
 
         async def do_test():
@@ -532,6 +753,58 @@ class TestMotorAsyncIO(BaseDBTest):
 
         loop.run_until_complete(do_test())
 
+    @pytest.mark.parametrize("field_concurrency", (None, 3))
+    def test_io_validate_concurrency(self, loop, db, field_concurrency):
+
+        instance = framework.MotorAsyncIOInstance(db, io_validate_concurrency=2)
+        expected = field_concurrency or 2
+
+        async def do_test():
+
+            running = 0
+            max_running = 0
+            called = []
+
+            async def io_validate(field, value):
+                nonlocal running, max_running
+                running += 1
+                max_running = max(max_running, running)
+                await asyncio.sleep(0)
+                running -= 1
+                called.append(value)
+                if value == 5:
+                    raise ma.ValidationError('Bad value')
+
+            @instance.register
+            class IODoc(Document):
+                list_field = fields.ListField(
+                    fields.IntField(io_validate=io_validate),
+                    io_validate_concurrency=field_concurrency,
+                )
+                dict_field = fields.DictField(
+                    values=fields.IntField(io_validate=io_validate),
+                    io_validate_concurrency=field_concurrency,
+                )
+
+            values = list(range(10))
+            doc = IODoc(list_field=values)
+            with pytest.raises(ma.ValidationError) as exc:
+                await doc.io_validate()
+            assert exc.value.messages == {'list_field': {5: ['Bad value']}}
+            assert sorted(called) == values
+            assert max_running == expected
+
+            called.clear()
+            max_running = 0
+            doc = IODoc(dict_field={str(v): v for v in values})
+            with pytest.raises(ma.ValidationError) as exc:
+                await doc.io_validate()
+            assert exc.value.messages == {'dict_field': {'5': {'value': ['Bad value']}}}
+            assert sorted(called) == values
+            assert max_running == expected
+
+        loop.run_until_complete(do_test())
+
     def test_io_validate_embedded(self, loop, instance, classroom_model):
         Student = classroom_model.Student
 
@@ -622,6 +895,82 @@ class TestMotorAsyncIO(BaseDBTest):
 
         loop.run_until_complete(do_test())
 
+    def test_ensure_indexes_diff(self, loop, instance):
+
+        @instance.register
+        class DiffIndexDoc(Document):
+            a = fields.StrField()
+            b = fields.IntField(unique=True)
+
+            class Meta:
+                indexes = ['a']
+
+        @instance.register
+        class DiffIndexChildDoc(DiffIndexDoc):
+            c = fields.IntField()
+
+            class Meta:
+                indexes = ['c']
+
+        async def do_test():
+
+            await DiffIndexDoc.collection.drop()
+            await DiffIndexDoc.collection.create_index('a')
+            await DiffIndexDoc.collection.create_index('stale')
+
+            ret = await DiffIndexDoc.ensure_indexes(diff=True)
+            assert [index.document['name'] for index in ret.missing] == ['b_1']
+            # Child indexes are not stale
+            assert ret.stale == ['stale_1']
+            indexes = await DiffIndexDoc.collection.index_information()
+            assert set(indexes) == {'_id_', 'a_1', 'b_1', 'stale_1'}
+
+            ret = await DiffIndexChildDoc.ensure_indexes(diff=True)
+            assert sorted(index.document['name'] for index in ret.missing) == [
+                '_cls_1', 'b_1__cls_1', 'c_1__cls_1']
+            indexes = await DiffIndexDoc.collection.index_information()
+            assert set(indexes) == {
+                '_id_', 'a_1', 'b_1', 'stale_1', 'c_1__cls_1', '_cls_1', 'b_1__cls_1'}
+
+            ret = await DiffIndexDoc.ensure_indexes(drop_stale=True)
+            assert ret.missing == []
+            assert ret.stale == ['stale_1']
+            indexes = await DiffIndexDoc.collection.index_information()
+            assert 'stale_1' not in indexes
+
+        loop.run_until_complete(do_test())
+
+    def test_ensure_all_indexes(self, loop, instance):
+
+        @instance.register
+        class AllIndexesDoc1(Document):
+            a = fields.StrField(unique=True)
+
+        @instance.register
+        class AllIndexesDoc2(Document):
+            b = fields.StrField(unique=True)
+
+        @instance.register
+        class AbstractAllIndexesDoc(Document):
+
+            class Meta:
+                abstract = True
+
+        async def do_test():
+
+            await AllIndexesDoc1.collection.drop()
+            await AllIndexesDoc2.collection.drop()
+
+            ret = await instance.ensure_all_indexes(diff=True)
+            assert set(ret) == {'AllIndexesDoc1', 'AllIndexesDoc2'}
+            assert [i.document['name'] for i in ret['AllIndexesDoc1'].missing] == ['a_1']
+            assert 'a_1' in await AllIndexesDoc1.collection.index_information()
+            assert 'b_1' in await AllIndexesDoc2.collection.index_information()
+            ret = await instance.ensure_all_indexes(diff=True)
+            assert ret['AllIndexesDoc1'].missing == ret['AllIndexesDoc2'].missing == []
+
+        loop.run_until_complete(do_test())
+
     def test_unique_index(self, loop, instance):
 
         async def do_test():
@@ -905,6 +1254,267 @@ class TestMotorAsyncIO(BaseDBTest):
 
         loop.run_until_complete(do_test())
 
+    def test_aggregate(self, loop, instance):
+
+        @instance.register
+        class AggregateParent(Document):
+            name = fields.StrField(attribute='n')
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class AggregateChild(AggregateParent):
+            extra = fields.IntField()
+
+        async def do_test():
+
+            await AggregateParent.collection.drop()
+            for i in range(4):
+                await AggregateParent(name='parent', value=i).commit()
+            for i in range(3):
+                await AggregateChild(name='child', value=i, extra=i).commit()
+
+            res = await AggregateParent.aggregate([
+                {'$group': {'_id': '$name', 'total': {'$sum': '$value'}}},
+                {'$sort': {'_id': 1}},
+            ]).to_list(length=None)
+            assert res == [{'_id': 'child', 'total': 3}, {'_id': 'parent', 'total': 6}]
+
+            # Child documents are filtered on _cls
+            res = await AggregateChild.aggregate([
+                {'$group': {'_id': None, 'total': {'$sum': '$value'}}},
+            ]).to_list(length=None)
+            assert res == [{'_id': None, 'total': 3}]
+
+            # Hydrate documents
+            cursor = AggregateParent.aggregate([
+                {'$match': {'value': {'$gte': 1}}},
+                {'$sort': {'name': 1, 'value': -1}},
+            ], hydrate=True)
+            res = [doc async for doc in cursor]
+            assert [(type(d), d.value) for d in res] == [
+                (AggregateChild, 2), (AggregateChild, 1),
+                (AggregateParent, 3), (AggregateParent, 2), (AggregateParent, 1),
+            ]
+            cursor = AggregateChild.aggregate([{'$sort': {'value': 1}}], hydrate=True)
+            res = [doc async for doc in cursor]
+            assert [d.extra for d in res] == [0, 1, 2]
+
+        loop.run_until_complete(do_test())
+
+    def test_insert_many(self, loop, instance):
+
+        @instance.register
+        class BulkInsert(Document):
+            name = fields.StrField(required=True, attribute='n')
+            birthday = fields.DateTimeField()
+            count = fields.IntField(default=0)
+
+        @instance.register
+        class BulkInsertChild(BulkInsert):
+            pass
+
+        def generate(count):
+            for i in range(count):
+                yield {'name': 'John %s' % i, 'birthday': '2000-01-%02dT00:00:00' % (i + 1)}
+
+        async def do_test():
+
+            await BulkInsert.collection.drop()
+            ids = await BulkInsert.insert_many(generate(5), batch_size=2)
+            assert len(ids) == 5
+            assert await BulkInsert.collection.find_one({'_id': ids[4]}, {'_id': False}) == {
+                'n': 'John 4', 'birthday': dt.datetime(2000, 1, 5), 'count': 0}
+
+            ids = await BulkInsertChild.insert_many([{'name': 'Jane'}], validate='required')
+            assert isinstance(await BulkInsert.find_one({'_id': ids[0]}), BulkInsertChild)
+
+            with pytest.raises(ma.ValidationError) as exc:
+                await BulkInsert.insert_many([{'name': 'Jack'}, {'count': 'dummy'}])
+            assert exc.value.messages == {1: {'count': ['Not a valid integer.']}}
+            assert await BulkInsert.count_documents() == 6
+
+        loop.run_until_complete(do_test())
+
+    def test_update_delete_many(self, loop, instance):
+
+        @instance.register
+        class BulkParent(Document):
+            name = fields.StrField(attribute='n')
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class BulkChild(BulkParent):
+            pass
+
+        callbacks = []
+
+        @instance.register
+        class BulkHooks(Document):
+            value = fields.IntField()
+
+            async def pre_delete(self):
+                callbacks.append(('pre_delete', self.value))
+
+            async def post_delete(self, ret):
+                callbacks.append(('post_delete', self.value, ret.deleted_count))
+
+        async def do_test():
+
+            await BulkParent.collection.drop()
+            for i in range(4):
+                await BulkParent(name='parent', value=i).commit()
+            for i in range(3):
+                await BulkChild(name='child', value=i).commit()
+
+            # Child documents are filtered on _cls
+            ret = await BulkChild.update_many({'value': {'$gte': 1}}, set={'name': 'updated'})
+            assert ret.modified_count == 2
+            assert await BulkParent.count_documents({'name': 'updated'}) == 2
+
+            with pytest.raises(ma.ValidationError) as exc:
+                await BulkParent.update_many({}, set={'value': 'dummy'})
+            assert exc.value.messages == {'value': ['Not a valid integer.']}
+
+            ret = await BulkChild.delete_many({'value': {'$lt': 2}})
+            assert ret.deleted_count == 2
+            assert await BulkParent.count_documents() == 5
+
+            # Run hooks by batches
+            await BulkHooks.collection.drop()
+            for i in range(5):
+                await BulkHooks(value=i).commit()
+            rets = await BulkHooks.delete_many({'value': {'$gte': 1}}, hooks=True, batch_size=2)
+            assert [ret.deleted_count for ret in rets] == [2, 2]
+            assert callbacks == [
+                ('pre_delete', 1), ('pre_delete', 2),
+                ('post_delete', 1, 2), ('post_delete', 2, 2),
+                ('pre_delete', 3), ('pre_delete', 4),
+                ('post_delete', 3, 2), ('post_delete', 4, 2),
+            ]
+            assert [d.value async for d in BulkHooks.find()] == [0]
+
+        loop.run_until_complete(do_test())
+
+    def test_find_one_and_update_delete(self, loop, instance):
+
+        @instance.register
+        class Parent(Document):
+            name = fields.StrField(attribute='n')
+            count = fields.IntField(attribute='c')
+
+        @instance.register
+        class Child(Parent):
+            pass
+
+        async def do_test():
+
+            await Parent.collection.drop()
+            parent = Parent(name='parent', count=0)
+            await parent.commit()
+            await Child(name='child', count=0).commit()
+
+            doc = await Parent.find_one_and_update({'name': 'parent'}, {'$inc': {'count': 2}})
+            assert isinstance(doc, Parent)
+            assert doc.pk == parent.pk
+            assert doc.count == 2
+            doc = await Parent.find_one_and_update(
+                {'name': 'parent'}, {'$set': {'count': 5}}, return_document='before')
+            assert doc.count == 2
+            ret = await Child.find_one_and_update({'name': 'parent'}, {'$inc': {'count': 1}})
+            assert ret is None
+
+            assert await Child.find_one_and_delete({'name': 'parent'}) is None
+            doc = await Parent.find_one_and_delete({'name': 'child'})
+            assert isinstance(doc, Child)
+            assert not doc.is_created
+            assert await Parent.count_documents() == 1
+
+        loop.run_until_complete(do_test())
+
+    def test_schema_version(self, loop, instance):
+
+        @instance.register
+        class Versioned(Document):
+            first_name = fields.StrField()
+            last_name = fields.StrField()
+
+            class Meta:
+                schema_version = 1
+
+        @Versioned.upgrade(0)
+        def split_name(data):
+            data['first_name'], data['last_name'] = data.pop('name').split(' ', 1)
+            return data
+
+        async def do_test():
+
+            await Versioned.collection.drop()
+            await Versioned.collection.insert_many([{'name': 'John Doe%s' % i} for i in range(5)])
+            ret = await Versioned(first_name='Jane').commit()
+            raw = await Versioned.collection.find_one(ret.inserted_id)
+            assert raw['_schema_version'] == 1
+
+            # Upgraded on read and written back on commit
+            doc = await Versioned.find_one({'first_name': {'$exists': False}})
+            assert doc.last_name == 'Doe0'
+            await doc.commit()
+            raw = await Versioned.collection.find_one(doc.pk, {'_id': False})
+            assert raw == {'first_name': 'John', 'last_name': 'Doe0', '_schema_version': 1}
+            assert not doc.is_modified()
+
+            # Remaining documents upgraded in bulk
+            progress = []
+            stats = await Versioned.migrate_schema(
+                batch_size=3, progress=lambda s: progress.append(s[:2]))
+            assert progress == [(3, 3), (4, 4)]
+            assert stats[:2] == (4, 4)
+            assert await Versioned.collection.count_documents({'_schema_version': 1}) == 6
+            stats = await Versioned.migrate_schema()
+            assert stats[:2] == (0, 0)
+
+        loop.run_until_complete(do_test())
+
+    def test_version_field(self, loop, instance):
+
+        @instance.register
+        class Counter(Document):
+            count = fields.IntField(default=0)
+
+            class Meta:
+                version_field = 'version'
+
+        async def do_test():
+
+            doc = Counter()
+            await doc.commit()
+            assert doc.version == 1
+            concurrent = await Counter.find_one(doc.pk)
+            doc.count = 1
+            await doc.commit()
+            assert doc.version == 2
+            # Concurrent update is rejected
+            concurrent.count = 2
+            with pytest.raises(exceptions.UpdateError):
+                await concurrent.commit()
+
+            # Concurrent modification between load and commit is retried
+            calls = []
+
+            async def increment(counter):
+                if not calls:
+                    await Counter.collection.update_one(
+                        {'_id': counter.pk}, {'$inc': {'version': 1}})
+                calls.append(counter.version)
+                counter.count += 1
+
+            doc = await Counter.modify_with_retry(doc.pk, increment, backoff=0)
+            assert calls == [2, 3]
+            assert doc.version == 4
+            raw = await Counter.collection.find_one(doc.pk, {'_id': False})
+            assert raw == {'count': 2, 'version': 4}
+
+        loop.run_until_complete(do_test())
+
     def test_pre_post_hooks(self, loop, instance):
 
         async def do_test():
@@ -1160,6 +1770,70 @@ class TestMotorAsyncIO(BaseDBTest):
 
         loop.run_until_complete(do_test())
 
+    def test_transaction(self, loop, instance):
+        """Test queued writes are bulk written in a retried transaction"""
+
+        coll_mock = mock.Mock(Collection, wraps=instance.db['Doc'])
+
+        class MockMetaDocumentImplementation(MetaDocumentImplementation):
+            @property
+            def collection(cls):
+                return coll_mock
+
+        @instance.register
+        class Doc(Document):
+            s = fields.StringField()
+
+        Doc.__class__ = MockMetaDocumentImplementation
+
+        class FakeSession:
+
+            def __init__(self, *commit_errors):
+                self.calls = []
+                self.commit_errors = list(commit_errors)
+
+            def start_transaction(self, **kwargs):
+                self.calls.append('start')
+
+            async def commit_transaction(self):
+                self.calls.append('commit')
+                if self.commit_errors:
+                    raise OperationFailure(
+                        'Commit failed', details={'errorLabels': [self.commit_errors.pop(0)]})
+
+            async def abort_transaction(self):
+                self.calls.append('abort')
+
+        async def do_test():
+
+            doc = Doc(s='test')
+            coll_mock.bulk_write = mock.AsyncMock(
+                return_value=BulkWriteResult({'nMatched': 0, 'nRemoved': 0}, True))
+            session = FakeSession('UnknownTransactionCommitResult')
+            async with instance.transaction(session, backoff=0) as transaction:
+                assert framework.SESSION.get() is session
+                transaction.commit(doc)
+                assert not doc.is_created
+            assert session.calls == ['start', 'commit', 'commit']
+            coll_mock.bulk_write.assert_called_once()
+            assert coll_mock.bulk_write.call_args[0][0] == [InsertOne({'_id': doc.id, 's': 'test'})]
+            assert coll_mock.bulk_write.call_args[1]['session'] is session
+            assert doc.is_created
+
+            coll_mock.bulk_write = mock.AsyncMock(side_effect=[
+                OperationFailure(
+                    'Write failed', details={'errorLabels': ['TransientTransactionError']}),
+                BulkWriteResult({'nMatched': 0, 'nRemoved': 1}, True),
+            ])
+            session = FakeSession()
+            async with instance.transaction(session, backoff=0) as transaction:
+                transaction.delete(doc)
+            assert session.calls == ['start', 'abort', 'start', 'commit']
+            assert coll_mock.bulk_write.call_count == 2
+            assert not doc.is_created
+
+        loop.run_until_complete(do_test())
+
     def test_2_to_3_migration(self, loop, db):
 
         instance = framework.MotorAsyncIOMigrationInstance(db)
@@ -1234,3 +1908,57 @@ class TestMotorAsyncIO(BaseDBTest):
             assert res == child_doc_umongo_3
 
         loop.run_until_complete(do_test())
+
+    def test_2_to_3_migration_batches(self, loop, db):
+
+        instance = framework.MotorAsyncIOMigrationInstance(db)
+
+        @instance.register
+        class ConcreteEmbeddedDoc(EmbeddedDocument):
+            f = fields.IntField()
+
+        @instance.register
+        class Doc(Document):
+            ec = fields.EmbeddedField(ConcreteEmbeddedDoc)
+
+        class Interrupt(Exception):
+            pass
+
+        def interrupt(collection_name, stats):
+            assert collection_name == 'doc'
+            raise Interrupt()
+
+        async def do_test():
+
+            await instance.db.doc.drop()
+            await instance.db.migrations.drop()
+            # Half of the documents are already migrated
+            await instance.db.doc.insert_many([
+                {'ec': {'f': i, '_cls': 'ConcreteEmbeddedDoc'} if i % 2 else {'f': i}}
+                for i in range(20)
+            ])
+
+            with pytest.raises(Interrupt):
+                await instance.migrate_2_to_3(
+                    partitions=1, batch_size=5, checkpoint_collection='migrations',
+                    progress=interrupt)
+            assert await instance.db.doc.count_documents({'ec._cls': {'$exists': True}}) == 8
+
+            # Migration is resumed after the first batch
+            progress = []
+            stats = await instance.migrate_2_to_3(
+                partitions=1, batch_size=5, checkpoint_collection='migrations',
+                progress=lambda name, stats: progress.append(stats[:2]))
+            assert progress == [(5, 3), (10, 5), (15, 8)]
+            assert stats['doc'][:2] == (15, 8)
+            assert await instance.db.doc.count_documents({'ec._cls': {'$exists': True}}) == 0
+            assert [d.ec.f async for d in Doc.find(sort=[('_id', 1)])] == list(range(20))
+
+            # Migration is done
+            stats = await instance.migrate_2_to_3(checkpoint_collection='migrations')
+            assert stats['doc'][:2] == (0, 0)
+            # Unchanged documents are not written
+            stats = await instance.migrate_2_to_3(partitions=3)
+            assert stats['doc'][:2] == (20, 0)
+
+        loop.run_until_complete(do_test())
@@ -1,10 +1,13 @@
 import datetime as dt
+import multiprocessing
 
 from unittest import mock
 import pytest
 
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, ReadPreference
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Secondary
 from pymongo.results import InsertOneResult, UpdateResult, DeleteResult
 from pymongo.collection import Collection
 import marshmallow as ma
@@ -14,6 +17,7 @@ from umongo import (
 )
 from umongo.document import MetaDocumentImplementation
 from umongo.frameworks import pymongo as framework_pymongo  # noqa
+from umongo.frameworks.tools import cook_aggregate_pipeline, cook_scan_filters, diff_indexes
 
 from .common import strip_indexes, name_sorted
 from ..common import BaseDBTest, TEST_DB
@@ -32,6 +36,11 @@ def db():
     return make_db()
 
 
+def student_summary(student):
+    assert type(student).__name__ == 'Student'
+    return (student.name, student.birthday)
+
+
 class TestPymongo(BaseDBTest):
 
     def test_create(self, classroom_model):
@@ -138,6 +147,21 @@ class TestPymongo(BaseDBTest):
         john.reload()
         assert john.name == 'William Doe'
 
+        # Only reload some fields, the others keep their modified state
+        john2.name = 'Jack Doe'
+        john2.commit()
+        john.birthday = dt.datetime(1990, 1, 1)
+        john.reload(fields=['name'])
+        assert john.name == 'Jack Doe'
+        assert john.to_mongo(update=True) == {'$set': {'birthday': dt.datetime(1990, 1, 1)}}
+        john.commit()
+        Student.collection.update_one({'_id': john.id}, {'$unset': {'birthday': ''}})
+        john.name = 'John Doe'
+        john.reload(fields=['name', 'birthday'])
+        assert john.name == 'Jack Doe'
+        assert john.birthday is None
+        assert not john.is_modified()
+
     def test_cursor(self, classroom_model):
         Student = classroom_model.Student
         Student.collection.drop()
@@ -173,6 +197,85 @@ class TestPymongo(BaseDBTest):
         assert len(students) == 1
         assert students[0].name == 'student-0'
 
+    def test_cursor_parallel_map(self, classroom_model):
+        Student = classroom_model.Student
+        Student.collection.drop()
+        for i in range(10):
+            Student(name='student-%s' % i, birthday=dt.datetime(2000, 1, i + 1)).commit()
+        expected = [
+            ('student-%s' % i, dt.datetime(2000, 1, i + 1)) for i in range(10)]
+        # Test classes are not importable, use fork to share them with workers
+        mp_context = multiprocessing.get_context('fork')
+
+        cursor = Student.find(sort=[('name', 1)])
+        res = cursor.parallel_map(
+            student_summary, workers=2, chunk_size=3, mp_context=mp_context)
+        assert list(res) == expected
+
+        res = Student.find().parallel_map(
+            student_summary, workers=3, ordered=False, chunk_size=2, mp_context=mp_context)
+        assert sorted(res) == expected
+
+        # Query run by the document with the BSON sent as is
+        res = Student.parallel_map(
+            student_summary, {'name': {'$ne': 'student-0'}}, sort=[('name', 1)], skip=1,
+            limit=5, workers=2, chunk_size=2, mp_context=mp_context)
+        assert list(res) == expected[2:7]
+
+        # Closing the generator early cancels the remaining chunks
+        res = Student.parallel_map(
+            student_summary, sort=[('name', 1)], workers=1, chunk_size=1,
+            mp_context=mp_context)
+        assert next(res) == expected[0]
+        res.close()
+
+        # Arguments checked when called
+        with pytest.raises(TypeError):
+            Student.parallel_map(None)
+        with pytest.raises(ValueError):
+            Student.find().parallel_map(student_summary, workers=-1)
+        with pytest.raises(ValueError):
+            Student.parallel_map(student_summary, chunk_size=0)
+
+    def test_scan(self, instance):
+
+        @instance.register
+        class ScanParent(Document):
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class ScanChild(ScanParent):
+            pass
+
+        ScanParent.collection.drop()
+        for i in range(50):
+            ScanParent(value=i).commit()
+        for i in range(50, 60):
+            ScanChild(value=i).commit()
+
+        for partitions in (1, 4, 100):
+            batches = list(ScanParent.scan(partitions=partitions, batch_size=7))
+            assert all(len(batch) <= 7 for batch in batches)
+            assert sorted(d.value for batch in batches for d in batch) == list(range(60))
+
+        batches = list(ScanParent.scan(filter={'value': {'$gte': 40}}, partitions=3))
+        assert sorted(d.value for batch in batches for d in batch) == list(range(40, 60))
+        batches = list(ScanChild.scan(partitions=3, raw=True))
+        assert sorted(d['v'] for batch in batches for d in batch) == list(range(50, 60))
+
+        # Scan can be interrupted
+        scan = ScanParent.scan(partitions=4, batch_size=1)
+        next(scan)
+        scan.close()
+
+        samples = [{'_id': i} for i in (5, 1, 3, 7, 3, 9)]
+        assert cook_scan_filters({'_cls': 'ScanChild'}, samples, 3) == [
+            {'$and': [{'_cls': 'ScanChild'}, {'_id': {'$lt': 3}}]},
+            {'$and': [{'_cls': 'ScanChild'}, {'_id': {'$gte': 3, '$lt': 7}}]},
+            {'$and': [{'_cls': 'ScanChild'}, {'_id': {'$gte': 7}}]},
+        ]
+        assert cook_scan_filters({}, [], 3) == [{}]
+
     def test_classroom(self, classroom_model):
         student = classroom_model.Student(name='Marty McFly', birthday=dt.datetime(1968, 6, 9))
         student.commit()
@@ -462,6 +565,130 @@ class TestPymongo(BaseDBTest):
         indexes = list(SimpleIndexDoc.collection.list_indexes())
         assert strip_indexes(indexes) == expected_indexes
 
+    def test_ensure_indexes_diff(self, instance):
+
+        @instance.register
+        class DiffIndexDoc(Document):
+            a = fields.StrField()
+            b = fields.IntField(unique=True)
+
+            class Meta:
+                indexes = ['a']
+
+        @instance.register
+        class DiffIndexChildDoc(DiffIndexDoc):
+            c = fields.IntField()
+
+            class Meta:
+                indexes = ['c']
+
+        DiffIndexDoc.collection.drop()
+        DiffIndexDoc.collection.create_index('a')
+        DiffIndexDoc.collection.create_index('stale')
+
+        ret = DiffIndexDoc.ensure_indexes(diff=True)
+        assert [index.document['name'] for index in ret.missing] == ['b_1']
+        # Child indexes are not stale
+        assert ret.stale == ['stale_1']
+        assert set(DiffIndexDoc.collection.index_information()) == {
+            '_id_', 'a_1', 'b_1', 'stale_1'}
+
+        ret = DiffIndexChildDoc.ensure_indexes(diff=True)
+        assert sorted(index.document['name'] for index in ret.missing) == [
+            '_cls_1', 'b_1__cls_1', 'c_1__cls_1']
+        assert set(DiffIndexDoc.collection.index_information()) == {
+            '_id_', 'a_1', 'b_1', 'stale_1', 'c_1__cls_1', '_cls_1', 'b_1__cls_1'}
+
+        ret = DiffIndexDoc.ensure_indexes(drop_stale=True)
+        assert ret.missing == []
+        assert ret.stale == ['stale_1']
+        assert 'stale_1' not in DiffIndexDoc.collection.index_information()
+
+        # Same key with other options is reported as conflicting
+        DiffIndexDoc.collection.drop_index('a_1')
+        DiffIndexDoc.collection.create_index('a', unique=True)
+        ret = DiffIndexDoc.ensure_indexes(diff=True)
+        assert ret.missing == []
+        assert ret.stale == []
+        assert [(name, index.document['name']) for name, index in ret.conflicting] == [
+            ('a_1', 'a_1')]
+        assert DiffIndexDoc.collection.index_information()['a_1']['unique']
+        # and recreated along with the stale indexes drop
+        ret = DiffIndexDoc.ensure_indexes(drop_stale=True)
+        assert len(ret.conflicting) == 1
+        assert 'unique' not in DiffIndexDoc.collection.index_information()['a_1']
+        assert DiffIndexDoc.ensure_indexes(diff=True).conflicting == []
+
+    def test_ensure_indexes_server_options(self, instance):
+
+        @instance.register
+        class TextIndexDoc(Document):
+            kind = fields.StrField()
+            title = fields.StrField()
+            body = fields.StrField()
+            location = fields.DictField()
+
+            class Meta:
+                indexes = [
+                    ('kind', '$title', '$body'),
+                    {'key': [('location', '2dsphere')]},
+                ]
+
+        # Indexes as returned by the server, with the options it adds
+        index_information = {
+            '_id_': {'key': [('_id', 1)], 'v': 2},
+            'kind_1_title_text_body_text': {
+                'key': [('kind', 1), ('_fts', 'text'), ('_ftsx', 1)], 'v': 2,
+                'weights': {'body': 1, 'title': 1}, 'default_language': 'english',
+                'language_override': 'language', 'textIndexVersion': 3},
+            'location_2dsphere': {
+                'key': [('location', '2dsphere')], 'v': 2, '2dsphereIndexVersion': 3},
+        }
+        assert diff_indexes(TextIndexDoc, index_information) == ([], [], [])
+        index_information['kind_1_title_text_body_text']['weights'] = {'body': 1, 'title': 2}
+        ret = diff_indexes(TextIndexDoc, index_information)
+        assert ret.missing == ret.stale == []
+        assert [name for name, _ in ret.conflicting] == ['kind_1_title_text_body_text']
+
+        # Not recreated on each run
+        TextIndexDoc.collection.drop()
+        TextIndexDoc.ensure_indexes(drop_stale=True)
+        with mock.patch.object(Collection, 'create_indexes') as create_indexes:
+            assert TextIndexDoc.ensure_indexes(drop_stale=True) == ([], [], [])
+        create_indexes.assert_not_called()
+
+    def test_ensure_all_indexes(self, instance):
+
+        @instance.register
+        class AllIndexesDoc1(Document):
+            a = fields.StrField(unique=True)
+
+        @instance.register
+        class AllIndexesDoc2(Document):
+            b = fields.StrField(unique=True)
+
+        @instance.register
+        class AbstractAllIndexesDoc(Document):
+
+            class Meta:
+                abstract = True
+
+        AllIndexesDoc1.collection.drop()
+        AllIndexesDoc2.collection.drop()
+
+        ret = instance.ensure_all_indexes(diff=True)
+        assert set(ret) == {'AllIndexesDoc1', 'AllIndexesDoc2'}
+        assert [i.document['name'] for i in ret['AllIndexesDoc1'].missing] == ['a_1']
+        assert 'a_1' in AllIndexesDoc1.collection.index_information()
+        assert 'b_1' in AllIndexesDoc2.collection.index_information()
+        # Documents grouped by collection once
+        with mock.patch.object(
+                framework_pymongo, 'documents_by_collection',
+                wraps=framework_pymongo.documents_by_collection) as grouped:
+            ret = instance.ensure_all_indexes(diff=True)
+        assert grouped.call_count == 1
+        assert ret['AllIndexesDoc1'].missing == ret['AllIndexesDoc2'].missing == []
+
     def test_unique_index(self, instance):
 
         @instance.register
@@ -719,6 +946,556 @@ class TestPymongo(BaseDBTest):
         assert Book.count_documents(
             {'chapters.name': {'$all': ['Roast Mutton', 'A Short Rest']}}) == 1
 
+    def test_aggregate(self, instance):
+
+        @instance.register
+        class AggregateParent(Document):
+            name = fields.StrField(attribute='n')
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class AggregateChild(AggregateParent):
+            extra = fields.IntField()
+
+        AggregateParent.collection.drop()
+        for i in range(4):
+            AggregateParent(name='parent', value=i).commit()
+        for i in range(3):
+            AggregateChild(name='child', value=i, extra=i).commit()
+
+        res = list(AggregateParent.aggregate([
+            {'$group': {'_id': '$name', 'total': {'$sum': '$value'}}},
+            {'$sort': {'_id': 1}},
+        ]))
+        assert res == [{'_id': 'child', 'total': 3}, {'_id': 'parent', 'total': 6}]
+
+        # Child documents are filtered on _cls
+        res = list(AggregateChild.aggregate([
+            {'$group': {'_id': None, 'total': {'$sum': '$value'}}},
+        ]))
+        assert res == [{'_id': None, 'total': 3}]
+
+        # Hydrate documents
+        cursor = AggregateParent.aggregate([
+            {'$match': {'value': {'$gte': 1}}},
+            {'$sort': {'name': 1, 'value': -1}},
+        ], hydrate=True)
+        res = list(cursor)
+        assert [(type(d), d.value) for d in res] == [
+            (AggregateChild, 2), (AggregateChild, 1),
+            (AggregateParent, 3), (AggregateParent, 2), (AggregateParent, 1),
+        ]
+        res = list(AggregateChild.aggregate([{'$sort': {'value': 1}}], hydrate=True))
+        assert [d.extra for d in res] == [0, 1, 2]
+
+        # No _cls filter on statistics, after the stages that must come first
+        assert cook_aggregate_pipeline(AggregateChild, [{'$indexStats': {}}]) == [
+            {'$indexStats': {}}]
+        assert cook_aggregate_pipeline(AggregateChild, [{'$geoNear': {}}]) == [
+            {'$geoNear': {}}, {'$match': {'_cls': 'AggregateChild'}}]
+
+    def test_insert_many(self, instance):
+
+        @instance.register
+        class BulkInsert(Document):
+            name = fields.StrField(required=True, attribute='n')
+            birthday = fields.DateTimeField()
+            count = fields.IntField(default=0)
+
+            def pre_insert(self):
+                assert False, 'Hooks should not be called'
+
+        @instance.register
+        class BulkInsertChild(BulkInsert):
+            pass
+
+        BulkInsert.collection.drop()
+
+        def generate(count):
+            for i in range(count):
+                yield {'name': 'John %s' % i, 'birthday': '2000-01-%02dT00:00:00' % (i + 1)}
+
+        ids = BulkInsert.insert_many(generate(5), batch_size=2)
+        assert len(ids) == 5
+        assert BulkInsert.collection.find_one({'_id': ids[4]}, {'_id': False}) == {
+            'n': 'John 4', 'birthday': dt.datetime(2000, 1, 5), 'count': 0}
+
+        # Child documents get their _cls
+        ids = BulkInsertChild.insert_many(
+            [{'name': 'Jane', 'birthday': dt.datetime(2000, 1, 1)}], validate='required')
+        doc = BulkInsert.find_one({'_id': ids[0]})
+        assert isinstance(doc, BulkInsertChild)
+        assert doc.birthday == dt.datetime(2000, 1, 1)
+        assert BulkInsert.count_documents() == 6
+
+        # Errors are reported by index in the input
+        with pytest.raises(ma.ValidationError) as exc:
+            BulkInsert.insert_many(
+                [{'name': 'Jack'}, {'name': 'Jack'}, {'name': 'Jack', 'count': 'dummy'}],
+                batch_size=2)
+        assert exc.value.messages == {2: {'count': ['Not a valid integer.']}}
+        with pytest.raises(ma.ValidationError) as exc:
+            BulkInsert.insert_many(
+                [{'count': 1}, {'name': 'Jack', 'dummy': 2}], validate='required')
+        assert exc.value.messages == {
+            0: {'name': ['Missing data for required field.']},
+            1: {'dummy': ['Unknown field.']},
+        }
+        # First batch is inserted before the error
+        assert BulkInsert.count_documents() == 8
+
+        ids = BulkInsert.insert_many([{'count': 1}], validate='none')
+        assert BulkInsert.collection.find_one({'_id': ids[0]}, {'_id': False}) == {'count': 1}
+        with pytest.raises(ValueError):
+            BulkInsert.insert_many([], validate='dummy')
+
+    def test_update_delete_many(self, instance):
+
+        @instance.register
+        class BulkParent(Document):
+            name = fields.StrField(attribute='n')
+            value = fields.IntField(attribute='v')
+            birthday = fields.DateTimeField()
+
+        @instance.register
+        class BulkChild(BulkParent):
+            pass
+
+        BulkParent.collection.drop()
+        for i in range(4):
+            BulkParent(name='parent', value=i).commit()
+        for i in range(3):
+            BulkChild(name='child', value=i).commit()
+
+        # Child documents are filtered on _cls
+        ret = BulkChild.update_many(
+            {'value': {'$gte': 1}}, set={'name': 'updated', 'birthday': '2020-01-01T00:00:00'})
+        assert ret.modified_count == 2
+        assert BulkParent.count_documents({'name': 'updated'}) == 2
+        doc = BulkChild.find_one({'value': 2})
+        assert doc.birthday == dt.datetime(2020, 1, 1)
+        ret = BulkParent.update_many({'name': 'updated'}, unset=['birthday'])
+        assert ret.modified_count == 2
+        assert BulkParent.collection.count_documents({'birthday': {'$exists': True}}) == 0
+
+        # Values are validated
+        with pytest.raises(ma.ValidationError) as exc:
+            BulkParent.update_many({}, set={'value': 'dummy', 'unknown': 42})
+        assert exc.value.messages == {
+            'value': ['Not a valid integer.'], 'unknown': ['Unknown field.']}
+
+        ret = BulkChild.delete_many({'value': {'$lt': 2}})
+        assert ret.deleted_count == 2
+        assert BulkParent.count_documents() == 5
+
+        # Run hooks by batches
+        callbacks = []
+
+        @instance.register
+        class BulkHooks(Document):
+            value = fields.IntField()
+
+            def pre_delete(self):
+                callbacks.append(('pre_delete', self.value))
+                if self.value == 3:
+                    # Additional filter preventing deletion
+                    return {'value': 42}
+                return None
+
+            def post_delete(self, ret):
+                callbacks.append(('post_delete', self.value, ret.deleted_count))
+
+        BulkHooks.collection.drop()
+        for i in range(5):
+            BulkHooks(value=i).commit()
+        rets = BulkHooks.delete_many({'value': {'$gte': 1}}, hooks=True, batch_size=2)
+        assert [ret.deleted_count for ret in rets] == [2, 1]
+        assert callbacks == [
+            ('pre_delete', 1), ('pre_delete', 2),
+            ('post_delete', 1, 2), ('post_delete', 2, 2),
+            ('pre_delete', 3), ('pre_delete', 4),
+            ('post_delete', 3, 1), ('post_delete', 4, 1),
+        ]
+        assert [d.value for d in BulkHooks.find()] == [0, 3]
+
+    def test_find_one_and_update_delete(self, instance):
+
+        @instance.register
+        class Parent(Document):
+            name = fields.StrField(attribute='n')
+            count = fields.IntField(attribute='c')
+            birthday = fields.DateTimeField()
+
+        @instance.register
+        class Child(Parent):
+            pass
+
+        Parent.collection.drop()
+        parent = Parent(name='parent', count=0)
+        parent.commit()
+        child = Child(name='child', count=0)
+        child.commit()
+
+        # Fields are mapped, values serialized and result hydrated
+        doc = Parent.find_one_and_update(
+            {'name': 'parent'},
+            {'$set': {'birthday': '2020-01-01T00:00:00'}, '$inc': {'count': 2}})
+        assert isinstance(doc, Parent)
+        assert doc.pk == parent.pk
+        assert doc.count == 2
+        assert doc.birthday == dt.datetime(2020, 1, 1)
+        assert not doc.is_modified()
+        doc = Parent.find_one_and_update(
+            {'name': 'parent'}, {'$unset': ['birthday']}, return_document='before')
+        assert doc.birthday == dt.datetime(2020, 1, 1)
+        assert Parent.collection.find_one(parent.pk) == {'_id': parent.pk, 'n': 'parent', 'c': 2}
+        with pytest.raises(ma.ValidationError) as exc:
+            Parent.find_one_and_update({}, {'$set': {'count': 'dummy'}})
+        assert exc.value.messages == {'count': ['Not a valid integer.']}
+
+        # Child documents are filtered on _cls
+        assert Child.find_one_and_update({'name': 'parent'}, {'$inc': {'count': 1}}) is None
+        doc = Parent.find_one_and_update({'name': 'child'}, {'$inc': {'count': 1}})
+        assert isinstance(doc, Child)
+        assert doc.count == 1
+
+        assert Child.find_one_and_delete({'name': 'parent'}) is None
+        doc = Child.find_one_and_delete({'count': 1})
+        assert isinstance(doc, Child)
+        assert doc.name == 'child'
+        assert not doc.is_created
+        assert Parent.count_documents() == 1
+
+    def test_find_one_and_update_operators(self, instance):
+
+        @instance.register
+        class Event(EmbeddedDocument):
+            date = fields.DateTimeField(attribute='d')
+
+        @instance.register
+        class Agenda(Document):
+            main = fields.EmbeddedField(Event, attribute='m')
+            events = fields.ListField(fields.EmbeddedField(Event), attribute='e')
+            dates = fields.ListField(fields.DateTimeField())
+
+            class Meta:
+                version_field = 'version'
+
+        Agenda.collection.drop()
+        agenda = Agenda(main={'date': dt.datetime(2020, 1, 1)}, events=[{}])
+        agenda.commit()
+
+        # Dotted paths and items of other operators are mapped and serialized
+        doc = Agenda.find_one_and_update({}, {
+            '$set': {'main.date': '2021-01-01T00:00:00', 'events.0.date': '2021-01-02T00:00:00'},
+            '$push': {'dates': {'$each': ['2021-01-03T00:00:00']}},
+            '$addToSet': {'events': {'date': '2021-01-04T00:00:00'}},
+        })
+        assert doc.main.date == dt.datetime(2021, 1, 1)
+        assert [e.date for e in doc.events] == [dt.datetime(2021, 1, 2), dt.datetime(2021, 1, 4)]
+        assert doc.dates == [dt.datetime(2021, 1, 3)]
+        assert Agenda.collection.find_one(agenda.pk)['e'][1] == {'d': dt.datetime(2021, 1, 4)}
+        # Version is incremented
+        assert doc.version == 2
+        doc = Agenda.find_one_and_update(
+            {}, {'$pull': {'events': {'date': dt.datetime(2021, 1, 4)}}})
+        assert len(doc.events) == 1
+        assert doc.version == 3
+
+        with pytest.raises(ma.ValidationError) as exc:
+            Agenda.find_one_and_update({}, {
+                '$set': {'main.unknown': 1},
+                '$push': {'dates': 'dummy', 'main': {}},
+                '$bit': {'version': {'and': 1}},
+            })
+        assert exc.value.messages == {
+            'main.unknown': ['Unknown field.'],
+            'dates': ['Not a valid datetime.'],
+            'main': ['Not a list field.'],
+            '$bit': ['Unsupported update operator.'],
+        }
+
+    def test_schema_version(self, instance):
+
+        @instance.register
+        class Versioned(Document):
+            first_name = fields.StrField()
+            last_name = fields.StrField()
+
+            class Meta:
+                schema_version = 1
+
+        @Versioned.upgrade(0)
+        def split_name(data):
+            data['first_name'], data['last_name'] = data.pop('name').split(' ', 1)
+            return data
+
+        Versioned.collection.drop()
+        Versioned.collection.insert_many([{'name': 'John Doe%s' % i} for i in range(5)])
+        new_id = Versioned(first_name='Jane').commit().inserted_id
+        assert Versioned.collection.find_one(new_id)['_schema_version'] == 1
+        ids = Versioned.insert_many([{'first_name': 'Jim'}])
+        assert Versioned.collection.find_one(ids[0])['_schema_version'] == 1
+
+        # Upgraded on read and written back on commit
+        doc = Versioned.find_one({'first_name': {'$exists': False}})
+        assert doc.last_name == 'Doe0'
+        doc.commit()
+        assert Versioned.collection.find_one(doc.pk, {'_id': False}) == {
+            'first_name': 'John', 'last_name': 'Doe0', '_schema_version': 1}
+        assert not doc.is_modified()
+        doc.reload()
+        assert not doc.is_modified()
+
+        # Partial reload of an outdated document written back as well
+        Versioned.collection.replace_one({'_id': doc.pk}, {'name': 'Jack Doe'})
+        doc.reload(fields=['first_name'])
+        assert doc.first_name == 'Jack'
+        doc.commit()
+        assert Versioned.collection.find_one(doc.pk, {'_id': False}) == {
+            'first_name': 'Jack', 'last_name': 'Doe0', '_schema_version': 1}
+        assert not doc.is_modified()
+
+        # Remaining documents upgraded in bulk
+        progress = []
+        stats = Versioned.migrate_schema(batch_size=3, progress=lambda s: progress.append(s[:2]))
+        assert progress == [(3, 3), (4, 4)]
+        assert stats[:2] == (4, 4)
+        assert Versioned.collection.count_documents({'_schema_version': 1}) == 7
+        assert sorted(d.last_name for d in Versioned.find({'first_name': 'John'})) == [
+            'Doe%s' % i for i in range(1, 5)]
+        assert Versioned.migrate_schema()[:2] == (0, 0)
+
+    def test_diff_updates(self, instance):
+
+        @instance.register
+        class Diffed(Document):
+            name = fields.StrField()
+            scores = fields.DictField()
+
+            class Meta:
+                diff_updates = True
+
+        doc = Diffed(name='John', scores={'a': 1, 'b': 2})
+        doc.commit()
+        doc = Diffed.find_one(doc.pk)
+        # Value set back to its original issues no write
+        doc.name = 'John'
+        assert doc.is_modified()
+        assert doc.commit() is None
+        assert not doc.is_modified()
+        doc.scores['a'] = 3
+        assert doc.to_mongo(update=True) == {'$set': {'scores.a': 3}}
+        doc.commit()
+        assert Diffed.collection.find_one(doc.pk)['scores'] == {'a': 3, 'b': 2}
+        # Snapshot follows the committed state
+        doc.scores['a'] = 1
+        assert doc.to_mongo(update=True) == {'$set': {'scores.a': 1}}
+
+        # Conditions are checked and hooks run even with nothing to write
+        callbacks = []
+
+        @instance.register
+        class DiffedHooks(Diffed):
+            birthday = fields.AwareDateTimeField()
+
+            def pre_update(self):
+                callbacks.append('pre_update')
+
+            def post_update(self, ret):
+                callbacks.append('post_update')
+
+        doc = DiffedHooks(name='John', birthday=dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc))
+        doc.commit()
+        doc = DiffedHooks.find_one(doc.pk)
+        doc.name = 'John'
+        with pytest.raises(exceptions.UpdateError):
+            doc.commit(conditions={'name': 'Jane'})
+        assert callbacks == ['pre_update']
+        doc.commit(conditions={'name': 'John'})
+        assert callbacks == ['pre_update', 'pre_update', 'post_update']
+        # Aware datetimes are compared to the naive ones loaded from database
+        doc.birthday = dt.datetime(2020, 1, 1, 1, tzinfo=dt.timezone(dt.timedelta(hours=1)))
+        assert doc.to_mongo(update=True) is None
+
+    def test_version_field(self, instance):
+
+        @instance.register
+        class Counter(Document):
+            count = fields.IntField(default=0)
+
+            class Meta:
+                version_field = 'version'
+
+        doc = Counter()
+        doc.commit()
+        assert doc.version == 1
+        concurrent = Counter.find_one(doc.pk)
+        doc.count = 1
+        doc.commit()
+        assert doc.version == 2
+        assert Counter.collection.find_one(doc.pk)['version'] == 2
+        # Concurrent update is rejected
+        concurrent.count = 2
+        with pytest.raises(exceptions.UpdateError):
+            concurrent.commit()
+        with pytest.raises(exceptions.DeleteError):
+            concurrent.delete()
+
+        # Document stored without version
+        Counter.collection.insert_one({'_id': 'legacy', 'count': 0})
+        legacy = Counter.find_one('legacy')
+        legacy.count = 1
+        legacy.commit()
+        assert Counter.collection.find_one('legacy')['version'] == 1
+
+        # Concurrent modification between load and commit is retried
+        calls = []
+
+        def increment(counter):
+            if not calls:
+                Counter.collection.update_one({'_id': counter.pk}, {'$inc': {'version': 1}})
+            calls.append(counter.version)
+            counter.count += 1
+
+        doc = Counter.modify_with_retry(doc.pk, increment, backoff=0)
+        assert calls == [2, 3]
+        assert doc.version == 4
+        assert Counter.collection.find_one(doc.pk, {'_id': False}) == {'count': 2, 'version': 4}
+
+        def always_concurrent(counter):
+            Counter.collection.update_one({'_id': counter.pk}, {'$inc': {'version': 1}})
+            calls.append(counter.version)
+            counter.count += 1
+
+        calls = []
+        with pytest.raises(exceptions.UpdateError):
+            Counter.modify_with_retry(doc.pk, always_concurrent, max_retries=2, backoff=0)
+        assert len(calls) == 3
+        assert Counter.modify_with_retry(ObjectId(), increment) is None
+
+        # Bulk updates increment the version as well
+        version = Counter.find_one(doc.pk).version
+        Counter.update_many({'_id': doc.pk}, set={'count': 10})
+        assert Counter.collection.find_one(doc.pk)['version'] == version + 1
+        with pytest.raises(ma.ValidationError):
+            Counter.update_many({}, set={'version': 1})
+
+    def test_routing(self, instance):
+
+        other_db = TEST_DB + '_other'
+
+        @instance.register
+        class Routed(Document):
+            name = fields.StrField()
+
+            class Meta:
+                database = other_db
+                read_preference = ReadPreference.SECONDARY_PREFERRED
+
+        @instance.register
+        class RoutedChild(Routed):
+            pass
+
+        @instance.register
+        class NotRouted(Document):
+            pass
+
+        assert Routed.collection.database.name == other_db
+        assert Routed.collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+        assert RoutedChild.collection.database.name == other_db
+        assert NotRouted.collection.database.name == TEST_DB
+        assert NotRouted.collection.read_preference == ReadPreference.PRIMARY
+        with pytest.raises(exceptions.DocumentDefinitionError):
+            @instance.register
+            class ImpossibleChild(Routed):
+                class Meta:
+                    database = TEST_DB
+
+        Routed.collection.drop()
+        doc = Routed(name='John')
+        doc.commit()
+        assert instance.db.client[other_db].routed.find_one(doc.pk)['name'] == 'John'
+        assert Routed.find_one(doc.pk).name == 'John'
+
+        # Overridden in the context
+        majority = ReadConcern('majority')
+        with instance.routing(read_preference=ReadPreference.SECONDARY, read_concern=majority):
+            assert NotRouted.collection.read_preference == ReadPreference.SECONDARY
+            assert NotRouted.collection.read_concern == majority
+            assert Routed.collection.read_preference == ReadPreference.SECONDARY
+            with instance.routing(database=other_db):
+                assert NotRouted.collection.database.name == other_db
+                assert NotRouted.collection.read_preference == ReadPreference.SECONDARY
+            assert NotRouted.collection.database.name == TEST_DB
+        assert NotRouted.collection.read_preference == ReadPreference.PRIMARY
+        assert Routed.collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+
+        # Other instances' documents are not overridden
+        other_instance = type(instance)(instance.db)
+
+        @other_instance.register
+        class OtherInstanceDoc(Document):
+            pass
+
+        with instance.routing(database=other_db):
+            assert NotRouted.collection.database.name == other_db
+            assert OtherInstanceDoc.collection.database.name == TEST_DB
+
+    def test_tenant_collection(self, db):
+        instance = framework_pymongo.PyMongoInstance(db, collection_cache_size=2)
+
+        @instance.register
+        class Invoice(Document):
+            number = fields.IntField(unique=True)
+
+            class Meta:
+                collection_name = 'invoice_{}'.format
+
+        @instance.register
+        class Shared(Document):
+            pass
+
+        with pytest.raises(exceptions.NoTenantError):
+            Invoice.collection
+        with instance.tenant('acme'):
+            assert Invoice.collection_name == 'invoice_acme'
+            # Handles are cached
+            assert Invoice.collection is Invoice.collection
+            Invoice.collection.drop()
+            Invoice(number=1).commit()
+            with instance.tenant('globex'):
+                Invoice.collection.drop()
+                assert Invoice.count_documents() == 0
+            assert Invoice.count_documents() == 1
+        assert db.invoice_acme.count_documents({}) == 1
+
+        # Least recently used handles are dropped
+        for tenant in ('acme', 'globex', 'initech'):
+            with instance.tenant(tenant):
+                Invoice.collection
+        assert [key[0] for key in instance._collections] == ['invoice_globex', 'invoice_initech']
+
+        # Tenant documents' indexes are only ensured within a tenant
+        with mock.patch('umongo.frameworks.tools.logger') as logger:
+            assert set(instance.ensure_all_indexes()) == {'Shared'}
+        logger.warning.assert_called_once()
+        # Tenant is specific to the instance
+        other_instance = type(instance)(db)
+        with other_instance.tenant('globex'):
+            with pytest.raises(exceptions.NoTenantError):
+                Invoice.collection
+        # Read options are compared by value
+        with instance.routing(read_preference=Secondary(tag_sets=[{'dc': 'east'}])):
+            collection = Shared.collection
+        with instance.routing(read_preference=Secondary(tag_sets=[{'dc': 'east'}])):
+            assert Shared.collection is collection
+        with instance.tenant('globex'):
+            assert set(instance.ensure_all_indexes()) == {'Shared', 'Invoice'}
+            assert Invoice.ensure_indexes(diff=True).missing == []
+        assert 'number_1' in db.invoice_globex.index_information()
+        assert 'number_1' not in db.invoice_initech.index_information()
+
     def test_pre_post_hooks(self, instance):
 
         callbacks = []
@@ -992,3 +1769,54 @@ class TestPymongo(BaseDBTest):
         assert res == doc_umongo_3
         res = instance.db.doc.find_one(child_doc_umongo_3['_id'])
         assert res == child_doc_umongo_3
+
+    def test_2_to_3_migration_batches(self, db):
+
+        instance = framework_pymongo.PyMongoMigrationInstance(db)
+
+        @instance.register
+        class ConcreteEmbeddedDoc(EmbeddedDocument):
+            f = fields.IntField()
+
+        @instance.register
+        class Doc(Document):
+            ec = fields.EmbeddedField(ConcreteEmbeddedDoc)
+
+        instance.db.doc.drop()
+        instance.db.migrations.drop()
+        # Half of the documents are already migrated
+        instance.db.doc.insert_many([
+            {'ec': {'f': i, '_cls': 'ConcreteEmbeddedDoc'} if i % 2 else {'f': i}}
+            for i in range(20)
+        ])
+
+        class Interrupt(Exception):
+            pass
+
+        def interrupt(collection_name, stats):
+            assert collection_name == 'doc'
+            raise Interrupt()
+
+        with pytest.raises(Interrupt):
+            instance.migrate_2_to_3(
+                partitions=1, batch_size=5, checkpoint_collection='migrations',
+                progress=interrupt)
+        assert instance.db.doc.count_documents({'ec._cls': {'$exists': True}}) == 8
+
+        # Migration is resumed after the first batch
+        progress = []
+        stats = instance.migrate_2_to_3(
+            partitions=1, batch_size=5, checkpoint_collection='migrations',
+            progress=lambda name, stats: progress.append(stats[:2]))
+        assert progress == [(5, 3), (10, 5), (15, 8)]
+        assert stats['doc'][:2] == (15, 8)
+        assert stats['doc'].throughput > 0
+        assert instance.db.doc.count_documents({'ec._cls': {'$exists': True}}) == 0
+        assert [d.ec.f for d in Doc.find(sort=[('_id', 1)])] == list(range(20))
+
+        # Migration is done
+        stats = instance.migrate_2_to_3(checkpoint_collection='migrations')
+        assert stats['doc'][:2] == (0, 0)
+        # Unchanged documents are not written
+        stats = instance.migrate_2_to_3(partitions=3)
+        assert stats['doc'][:2] == (20, 0)
@@ -171,6 +171,14 @@ class TestTxMongo(BaseDBTest):
         yield john.reload()
         assert john.name == 'William Doe'
 
+        # Only reload some fields, the others keep their modified state
+        john2.name = 'Jack Doe'
+        yield john2.commit()
+        john.birthday = dt.datetime(1990, 1, 1)
+        yield john.reload(fields=['name'])
+        assert john.name == 'Jack Doe'
+        assert john.to_mongo(update=True) == {'$set': {'birthday': dt.datetime(1990, 1, 1)}}
+
     @pytest_inlineCallbacks
     def test_find_no_cursor(self, classroom_model):
         Student = classroom_model.Student
@@ -212,6 +220,35 @@ class TestTxMongo(BaseDBTest):
         assert len(batch1) == 1
         assert batch1[0].name == 'student-0'
 
+    @pytest_inlineCallbacks
+    def test_scan(self, instance):
+
+        @instance.register
+        class ScanParent(Document):
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class ScanChild(ScanParent):
+            pass
+
+        yield ScanParent.collection.drop()
+        for i in range(50):
+            yield ScanParent(value=i).commit()
+        for i in range(50, 60):
+            yield ScanChild(value=i).commit()
+
+        for partitions in (1, 4, 100):
+            batches = []
+            yield ScanParent.scan(batches.append, partitions=partitions, batch_size=7)
+            assert sorted(d.value for batch in batches for d in batch) == list(range(60))
+
+        batches = []
+        yield ScanParent.scan(batches.append, filter={'value': {'$gte': 40}}, partitions=3)
+        assert sorted(d.value for batch in batches for d in batch) == list(range(40, 60))
+        batches = []
+        yield ScanChild.scan(batches.append, partitions=3, raw=True)
+        assert sorted(d['v'] for batch in batches for d in batch) == list(range(50, 60))
+
     @pytest_inlineCallbacks
     def test_classroom(self, classroom_model):
         student = classroom_model.Student(name='Marty McFly', birthday=dt.datetime(1968, 6, 9))
@@ -547,6 +584,70 @@ class TestTxMongo(BaseDBTest):
         indexes = list(con[TEST_DB].simple_index_doc.list_indexes())
         assert name_sorted(strip_indexes(indexes)) == name_sorted(expected_indexes)
 
+    @pytest_inlineCallbacks
+    def test_ensure_indexes_diff(self, instance):
+
+        @instance.register
+        class DiffIndexDoc(Document):
+            a = fields.StrField()
+            b = fields.IntField(unique=True)
+
+            class Meta:
+                indexes = ['a']
+
+        @instance.register
+        class DiffIndexChildDoc(DiffIndexDoc):
+            c = fields.IntField()
+
+            class Meta:
+                indexes = ['c']
+
+        yield DiffIndexDoc.collection.drop()
+        con[TEST_DB].diff_index_doc.create_index('a')
+        con[TEST_DB].diff_index_doc.create_index('stale')
+
+        ret = yield DiffIndexDoc.ensure_indexes(diff=True)
+        assert [index.document['name'] for index in ret.missing] == ['b_1']
+        # Child indexes are not stale
+        assert ret.stale == ['stale_1']
+        indexes = con[TEST_DB].diff_index_doc.index_information()
+        assert set(indexes) == {'_id_', 'a_1', 'b_1', 'stale_1'}
+
+        ret = yield DiffIndexChildDoc.ensure_indexes(diff=True)
+        assert sorted(index.document['name'] for index in ret.missing) == [
+            '_cls_1', 'b_1__cls_1', 'c_1__cls_1']
+        indexes = con[TEST_DB].diff_index_doc.index_information()
+        assert set(indexes) == {
+            '_id_', 'a_1', 'b_1', 'stale_1', 'c_1__cls_1', '_cls_1', 'b_1__cls_1'}
+
+        ret = yield DiffIndexDoc.ensure_indexes(drop_stale=True)
+        assert ret.missing == []
+        assert ret.stale == ['stale_1']
+        indexes = con[TEST_DB].diff_index_doc.index_information()
+        assert 'stale_1' not in indexes
+
+    @pytest_inlineCallbacks
+    def test_ensure_all_indexes(self, instance):
+
+        @instance.register
+        class AllIndexesDoc1(Document):
+            a = fields.StrField(unique=True)
+
+        @instance.register
+        class AllIndexesDoc2(Document):
+            b = fields.StrField(unique=True)
+
+        yield AllIndexesDoc1.collection.drop()
+        yield AllIndexesDoc2.collection.drop()
+
+        ret = yield instance.ensure_all_indexes(diff=True)
+        assert set(ret) == {'AllIndexesDoc1', 'AllIndexesDoc2'}
+        assert [i.document['name'] for i in ret['AllIndexesDoc1'].missing] == ['a_1']
+        assert 'a_1' in con[TEST_DB].all_indexes_doc1.index_information()
+        assert 'b_1' in con[TEST_DB].all_indexes_doc2.index_information()
+        ret = yield instance.ensure_all_indexes(diff=True)
+        assert ret['AllIndexesDoc1'].missing == ret['AllIndexesDoc2'].missing == []
+
     @pytest_inlineCallbacks
     def test_unique_index(self, instance):
 
@@ -821,6 +922,208 @@ class TestTxMongo(BaseDBTest):
         res = yield Book.find({'chapters.name': {'$all': ['Roast Mutton', 'A Short Rest']}})
         assert len(res) == 1
 
+    @pytest_inlineCallbacks
+    def test_insert_many(self, instance):
+
+        @instance.register
+        class BulkInsert(Document):
+            name = fields.StrField(required=True, attribute='n')
+            birthday = fields.DateTimeField()
+            count = fields.IntField(default=0)
+
+        @instance.register
+        class BulkInsertChild(BulkInsert):
+            pass
+
+        def generate(count):
+            for i in range(count):
+                yield {'name': 'John %s' % i, 'birthday': '2000-01-%02dT00:00:00' % (i + 1)}
+
+        yield BulkInsert.collection.drop()
+        ids = yield BulkInsert.insert_many(generate(5), batch_size=2)
+        assert len(ids) == 5
+        res = yield BulkInsert.collection.find_one({'_id': ids[4]}, {'_id': False})
+        assert res == {'n': 'John 4', 'birthday': dt.datetime(2000, 1, 5), 'count': 0}
+
+        ids = yield BulkInsertChild.insert_many([{'name': 'Jane'}], validate='required')
+        res = yield BulkInsert.find_one({'_id': ids[0]})
+        assert isinstance(res, BulkInsertChild)
+
+        with pytest.raises(ma.ValidationError) as exc:
+            yield BulkInsert.insert_many([{'name': 'Jack'}, {'count': 'dummy'}])
+        assert exc.value.messages == {1: {'count': ['Not a valid integer.']}}
+        res = yield BulkInsert.count()
+        assert res == 6
+
+    @pytest_inlineCallbacks
+    def test_update_delete_many(self, instance):
+
+        @instance.register
+        class BulkParent(Document):
+            name = fields.StrField(attribute='n')
+            value = fields.IntField(attribute='v')
+
+        @instance.register
+        class BulkChild(BulkParent):
+            pass
+
+        yield BulkParent.collection.drop()
+        for i in range(4):
+            yield BulkParent(name='parent', value=i).commit()
+        for i in range(3):
+            yield BulkChild(name='child', value=i).commit()
+
+        # Child documents are filtered on _cls
+        ret = yield BulkChild.update_many({'value': {'$gte': 1}}, set={'name': 'updated'})
+        assert ret.modified_count == 2
+        res = yield BulkParent.count({'name': 'updated'})
+        assert res == 2
+
+        with pytest.raises(ma.ValidationError) as exc:
+            BulkParent.update_many({}, set={'value': 'dummy'})
+        assert exc.value.messages == {'value': ['Not a valid integer.']}
+
+        ret = yield BulkChild.delete_many({'value': {'$lt': 2}})
+        assert ret.deleted_count == 2
+        res = yield BulkParent.count()
+        assert res == 5
+
+        # Run hooks by batches
+        callbacks = []
+
+        @instance.register
+        class BulkHooks(Document):
+            value = fields.IntField()
+
+            def pre_delete(self):
+                callbacks.append(('pre_delete', self.value))
+
+            def post_delete(self, ret):
+                assert isinstance(ret, DeleteResult)
+                callbacks.append(('post_delete', self.value))
+
+        yield BulkHooks.collection.drop()
+        for i in range(5):
+            yield BulkHooks(value=i).commit()
+        rets = yield BulkHooks.delete_many({'value': {'$gte': 1}}, hooks=True, batch_size=2)
+        assert sum(ret.deleted_count for ret in rets) == 4
+        assert sorted(callbacks) == sorted(
+            [('pre_delete', i) for i in range(1, 5)] + [('post_delete', i) for i in range(1, 5)])
+        res = yield BulkHooks.find()
+        assert [d.value for d in res] == [0]
+
+    @pytest_inlineCallbacks
+    def test_find_one_and_update_delete(self, instance):
+
+        @instance.register
+        class Parent(Document):
+            name = fields.StrField(attribute='n')
+            count = fields.IntField(attribute='c')
+
+        @instance.register
+        class Child(Parent):
+            pass
+
+        yield Parent.collection.drop()
+        parent = Parent(name='parent', count=0)
+        yield parent.commit()
+        yield Child(name='child', count=0).commit()
+
+        doc = yield Parent.find_one_and_update({'name': 'parent'}, {'$inc': {'count': 2}})
+        assert isinstance(doc, Parent)
+        assert doc.pk == parent.pk
+        assert doc.count == 2
+        doc = yield Parent.find_one_and_update(
+            {'name': 'parent'}, {'$set': {'count': 5}}, return_document='before')
+        assert doc.count == 2
+        ret = yield Child.find_one_and_update({'name': 'parent'}, {'$inc': {'count': 1}})
+        assert ret is None
+
+        ret = yield Child.find_one_and_delete({'name': 'parent'})
+        assert ret is None
+        doc = yield Parent.find_one_and_delete({'name': 'child'})
+        assert isinstance(doc, Child)
+        assert not doc.is_created
+        res = yield Parent.collection.count()
+        assert res == 1
+
+    @pytest_inlineCallbacks
+    def test_schema_version(self, instance):
+
+        @instance.register
+        class Versioned(Document):
+            first_name = fields.StrField()
+            last_name = fields.StrField()
+
+            class Meta:
+                schema_version = 1
+
+        @Versioned.upgrade(0)
+        def split_name(data):
+            data['first_name'], data['last_name'] = data.pop('name').split(' ', 1)
+            return data
+
+        yield Versioned.collection.drop()
+        yield Versioned.collection.insert_many([{'name': 'John Doe%s' % i} for i in range(5)])
+        ret = yield Versioned(first_name='Jane').commit()
+        raw = yield Versioned.collection.find_one(ret.inserted_id)
+        assert raw['_schema_version'] == 1
+
+        # Upgraded on read and written back on commit
+        doc = yield Versioned.find_one({'first_name': {'$exists': False}})
+        assert doc.last_name == 'Doe0'
+        yield doc.commit()
+        raw = yield Versioned.collection.find_one(doc.pk, {'_id': False})
+        assert raw == {'first_name': 'John', 'last_name': 'Doe0', '_schema_version': 1}
+        assert not doc.is_modified()
+
+        # Remaining documents upgraded in bulk
+        progress = []
+        stats = yield Versioned.migrate_schema(
+            batch_size=3, progress=lambda s: progress.append(s[:2]))
+        assert progress[-1] == (4, 4)
+        assert stats[:2] == (4, 4)
+        res = yield Versioned.collection.count({'_schema_version': 1})
+        assert res == 6
+
+    @pytest_inlineCallbacks
+    def test_version_field(self, instance):
+
+        @instance.register
+        class Counter(Document):
+            count = fields.IntField(default=0)
+
+            class Meta:
+                version_field = 'version'
+
+        doc = Counter()
+        yield doc.commit()
+        assert doc.version == 1
+        concurrent = yield Counter.find_one(doc.pk)
+        doc.count = 1
+        yield doc.commit()
+        assert doc.version == 2
+        # Concurrent update is rejected
+        concurrent.count = 2
+        with pytest.raises(exceptions.UpdateError):
+            yield concurrent.commit()
+
+        # Concurrent modification between load and commit is retried
+        calls = []
+
+        @inlineCallbacks
+        def increment(counter):
+            if not calls:
+                yield Counter.collection.update_one({'_id': counter.pk}, {'$inc': {'version': 1}})
+            calls.append(counter.version)
+            counter.count += 1
+
+        doc = yield Counter.modify_with_retry(doc.pk, increment, backoff=0)
+        assert calls == [2, 3]
+        assert doc.version == 4
+        raw = yield Counter.collection.find_one(doc.pk, {'_id': False})
+        assert raw == {'count': 2, 'version': 4}
+
     @pytest_inlineCallbacks
     def test_pre_post_hooks(self, instance):
 
@@ -1062,3 +1365,50 @@ class TestTxMongo(BaseDBTest):
         assert res == doc_umongo_3
         res = yield instance.db.doc.find_one(child_doc_umongo_3['_id'])
         assert res == child_doc_umongo_3
+
+    @pytest_inlineCallbacks
+    def test_2_to_3_migration_batches(self, db):
+
+        instance = framework.TxMongoMigrationInstance(db)
+
+        @instance.register
+        class ConcreteEmbeddedDoc(EmbeddedDocument):
+            f = fields.IntField()
+
+        @instance.register
+        class Doc(Document):
+            ec = fields.EmbeddedField(ConcreteEmbeddedDoc)
+
+        class Interrupt(Exception):
+            pass
+
+        def interrupt(collection_name, stats):
+            assert collection_name == 'doc'
+            raise Interrupt()
+
+        yield instance.db.doc.drop()
+        yield instance.db.migrations.drop()
+        # Half of the documents are already migrated
+        yield instance.db.doc.insert_many([
+            {'ec': {'f': i, '_cls': 'ConcreteEmbeddedDoc'} if i % 2 else {'f': i}}
+            for i in range(20)
+        ])
+
+        with pytest.raises(Exception):
+            yield instance.migrate_2_to_3(
+                partitions=1, batch_size=5, checkpoint_collection='migrations',
+                progress=interrupt)
+
+        # Migration is resumed where it stopped
+        stats = yield instance.migrate_2_to_3(
+            partitions=1, batch_size=5, checkpoint_collection='migrations')
+        assert stats['doc'].scanned < 20
+        res = yield instance.db.doc.count({'ec._cls': {'$exists': True}})
+        assert res == 0
+
+        # Migration is done
+        stats = yield instance.migrate_2_to_3(checkpoint_collection='migrations')
+        assert stats['doc'][:2] == (0, 0)
+        # Unchanged documents are not written
+        stats = yield instance.migrate_2_to_3(partitions=3)
+        assert stats['doc'][:2] == (20, 0)
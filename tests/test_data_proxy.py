@@ -5,7 +5,9 @@ import marshmallow as ma
 
 from umongo import fields, EmbeddedDocument, validate, exceptions
 from umongo.abstract import BaseSchema
-from umongo.data_proxy import data_proxy_factory, BaseDataProxy, BaseNonStrictDataProxy
+from umongo.data_proxy import (
+    data_proxy_factory, mongo_serializer_factory, dump_serializer_factory, BaseDataProxy,
+    BaseNonStrictDataProxy)
 
 from .common import BaseTest, assert_equal_order
 
@@ -187,6 +189,43 @@ class TestDataProxy(BaseTest):
         with pytest.raises(ma.ValidationError):
             d.set('d', None)
 
+    def test_set_many(self):
+
+        class MySchema(BaseSchema):
+            a = fields.IntField()
+            b = fields.IntField(attribute='in_mongo_b')
+            c = fields.StrField(allow_none=True, validate=validate.Length(max=5))
+
+        MyDataProxy = data_proxy_factory('My', MySchema())
+        d = MyDataProxy()
+        d.from_mongo({'a': 1, 'in_mongo_b': 2})
+        d.set_many({'b': '3', 'c': None})
+        assert d.to_mongo() == {'a': 1, 'in_mongo_b': 3, 'c': None}
+        assert d.to_mongo(update=True) == {'$set': {'in_mongo_b': 3, 'c': None}}
+
+        # All errors are reported and nothing is set
+        d.clear_modified()
+        with pytest.raises(ma.ValidationError) as exc:
+            d.set_many({'a': 4, 'b': 'dummy', 'c': '123456', 'in_mongo_b': 5})
+        assert exc.value.messages == {
+            'b': ['Not a valid integer.'],
+            'c': ['Longer than maximum length 5.'],
+            'in_mongo_b': ['Unknown field.'],
+        }
+        assert d.get('a') == 1
+        assert not d.is_modified()
+
+        # Values set as is without validation
+        d.set_many({'a': 'not validated'}, validate=False)
+        assert d.to_mongo(update=True) == {'$set': {'a': 'not validated'}}
+
+        # Except None for the fields not allowing it
+        d.clear_modified()
+        with pytest.raises(ma.ValidationError) as exc:
+            d.set_many({'a': None, 'b': 4, 'c': None}, validate=False)
+        assert exc.value.messages == {'a': ['Field may not be null.']}
+        assert not d.is_modified()
+
     def test_del(self):
 
         class MySchema(BaseSchema):
@@ -386,6 +425,83 @@ class TestDataProxy(BaseTest):
             'dicted': {'a': {'value': {'required': ['Missing data for required field.']}}},
         }
 
+    def test_mongo_serializer(self):
+
+        @self.instance.register
+        class MyEmbedded(EmbeddedDocument):
+            required = fields.IntField(required=True)
+
+        class MySchema(BaseSchema):
+            required = fields.IntField(required=True, attribute='r')
+            with_default = fields.StrField(default='default')
+            date = fields.DateField()
+            embedded = fields.EmbeddedField(MyEmbedded, instance=self.instance)
+            listed = fields.ListField(fields.IntField())
+
+        MyDataProxy = data_proxy_factory('My', MySchema())
+        serialize = mongo_serializer_factory(MyDataProxy.schema)
+        for data in (
+                {'required': 42},
+                {'required': 42, 'date': '2020-01-01', 'embedded': {'required': 1}},
+                {'required': 42, 'with_default': 'value', 'listed': [1, 2]},
+        ):
+            loaded = MyDataProxy.schema.load(data, partial=True)
+            assert serialize(loaded) == MyDataProxy(data).to_mongo()
+            assert serialize(loaded, required=True) == MyDataProxy(data).to_mongo()
+
+        loaded = MyDataProxy.schema.load({'embedded': {}}, partial=True)
+        assert serialize(loaded) == {'with_default': 'default', 'embedded': {}}
+        with pytest.raises(ma.ValidationError) as exc:
+            serialize(loaded, required=True)
+        assert exc.value.messages == {
+            'required': ['Missing data for required field.'],
+            'embedded': {'required': ['Missing data for required field.']},
+        }
+
+        # Serializer is built once per data proxy
+        assert MyDataProxy.get_mongo_serializer() is MyDataProxy.get_mongo_serializer()
+
+    def test_dump_serializer(self):
+
+        @self.instance.register
+        class MyEmbedded(EmbeddedDocument):
+            value = fields.IntField(attribute='v')
+
+        class MySchema(BaseSchema):
+            number = fields.IntField(attribute='n', data_key='num')
+            with_default = fields.StrField(default='default')
+            date = fields.DateField()
+            secret = fields.StrField(load_only=True)
+            embedded = fields.EmbeddedField(MyEmbedded, instance=self.instance)
+            listed = fields.ListField(fields.EmbeddedField(MyEmbedded, instance=self.instance))
+
+        MyDataProxy = data_proxy_factory('My', MySchema())
+        serialize = dump_serializer_factory(MyDataProxy.schema)
+        for data in (
+                {},
+                {'num': 42, 'date': '2020-01-01', 'secret': 'x', 'embedded': {'value': 1}},
+                {'with_default': 'value', 'listed': [{'value': 1}, {}]},
+        ):
+            d = MyDataProxy(data)
+            assert serialize(d._data) == MyDataProxy.schema.dump(d._data)
+            assert d.dump() == MyDataProxy.schema.dump(d._data)
+        assert d.dump() == {'with_default': 'value', 'listed': [{'value': 1}, {}]}
+
+        # Serializer is built once per data proxy
+        assert MyDataProxy.get_dump_serializer() is MyDataProxy.get_dump_serializer()
+
+        # Schemas with dump hooks are dumped by marshmallow
+        class HookedSchema(BaseSchema):
+            number = fields.IntField()
+
+            @ma.post_dump
+            def add_total(self, data, **kwargs):
+                data['total'] = data.get('number', 0) + 1
+                return data
+
+        HookedDataProxy = data_proxy_factory('Hooked', HookedSchema())
+        assert HookedDataProxy({'number': 1}).dump() == {'number': 1, 'total': 2}
+
     def test_unkown_field_in_db(self):
         class MySchema(BaseSchema):
             field = fields.IntField(attribute='mongo_field')
@@ -435,6 +551,36 @@ class TestDataProxy(BaseTest):
         d.get('e')['b'] = 4
         assert_equal_order(d.to_mongo()['e'], {'a': 1, 'b': 4, 'c': 3})
 
+    def test_to_mongo_diff(self):
+
+        class MySchema(BaseSchema):
+            a = fields.IntField()
+            b = fields.IntField(attribute='in_mongo_b')
+            d = fields.DictField()
+            li = fields.ListField(fields.IntField())
+
+        MyDataProxy = data_proxy_factory('My', MySchema())
+        d = MyDataProxy()
+        d.from_mongo({'a': 1, 'in_mongo_b': 2, 'd': {'x': {'y': 1, 'z': 2}}, 'li': [1, 2]})
+        snapshot = d.mongo_snapshot()
+        assert d.to_mongo_diff(snapshot) is None
+        # Value set back to its original is not sent
+        d.set('a', 1)
+        d.set('b', 3)
+        d.get('d')['x'] = {'y': 3, 'z': 2}
+        d.get('li')[1] = 4
+        assert d.to_mongo_diff(snapshot) == {'$set': {
+            'in_mongo_b': 3, 'd.x.y': 3, 'li.1': 4}}
+        # Lists of different length are set entirely
+        d.get('li').append(5)
+        d.delete('b')
+        assert d.to_mongo_diff(snapshot) == {
+            '$set': {'d.x.y': 3, 'li': [1, 4, 5]}, '$unset': {'in_mongo_b': ''}}
+        snapshot = d.mongo_snapshot(snapshot)
+        assert snapshot == {'a': 1, 'd': {'x': {'y': 3, 'z': 2}}, 'li': [1, 4, 5]}
+        d.clear_modified()
+        assert d.to_mongo_diff(snapshot) is None
+
 
 class TestNonStrictDataProxy(BaseTest):
 
@@ -1,9 +1,11 @@
 from copy import copy, deepcopy
 import datetime as dt
+import decimal
+import json
 
 import pytest
 
-from bson import ObjectId, DBRef
+from bson import ObjectId, DBRef, Decimal128
 import marshmallow as ma
 
 from umongo import (
@@ -11,6 +13,7 @@ from umongo import (
     fields, exceptions, post_dump, pre_load, validates_schema, ExposeMissing
 )
 from umongo.abstract import BaseSchema
+from umongo.json_encoding import json_default
 from .common import BaseTest
 
 
@@ -91,6 +94,62 @@ class TestDocument(BaseTest):
             'gpa': 3.0
         }
 
+    def test_dump_many(self):
+
+        @self.instance.register
+        class Person(Document):
+            name = fields.StrField()
+            extra = fields.DictField()
+
+            class Meta:
+                allow_inheritance = True
+
+        @self.instance.register
+        class Teacher(Person):
+            subject = fields.StrField()
+
+            @post_dump
+            def add_title(self, data, **kwargs):
+                data['title'] = 'Professor'
+                return data
+
+        oid = ObjectId()
+        people = [
+            Person(name='John', extra={'ref': oid, 'at': dt.datetime(2020, 1, 1)}),
+            Teacher(name='Jane', subject='Maths'),
+            Person(),
+        ]
+        assert Person.dump_many(people) == [doc.dump() for doc in people]
+        assert Person.dump_many([]) == []
+        assert Person.dump_many(people[1:]) == [
+            {'name': 'Jane', 'subject': 'Maths', 'cls': 'Teacher', 'title': 'Professor'},
+            {},
+        ]
+
+        # JSON output
+        assert Person.dump_many(people[:1], as_json=True) == (
+            b'[{"name":"John","extra":{"ref":"%s","at":"2020-01-01T00:00:00"}}]'
+            % str(oid).encode())
+
+        def encoder(data):
+            return json.dumps(data, default=json_default, indent=1).encode()
+
+        assert Person.dump_many(people[2:], as_json=True, encoder=encoder) == b'[\n {}\n]'
+        with pytest.raises(TypeError):
+            json_default(object())
+
+        # Decimals keep their precision, remaining bytes are base64 encoded
+        @self.instance.register
+        class Priced(Document):
+            price = fields.DecimalField()
+            extra = fields.DictField()
+
+        priced = Priced(
+            price=decimal.Decimal('10.10'),
+            extra={'total': Decimal128('20.20'), 'data': b'\x00\x01'})
+        assert Priced.dump_many([priced], as_json=True) == (
+            b'[{"price":"10.10","extra":{"total":"20.20","data":"AAE="}}]')
+
     def test_fields_by_attr(self):
         john = self.Student.build_from_mongo(data={
             'name': 'John Doe', 'birthday': dt.datetime(1995, 12, 12), 'gpa': 3.0})
@@ -399,6 +458,93 @@ class TestDocument(BaseTest):
         assert jane.child == john.child
         assert jane.child is not john.child
 
+    def test_clone_isolation(self):
+
+        @self.instance.register
+        class Child(EmbeddedDocument):
+            name = fields.StrField()
+
+        @self.instance.register
+        class Parent(Document):
+            tags = fields.ListField(fields.StrField())
+            child = fields.EmbeddedField(Child)
+
+        john = Parent.build_from_mongo({
+            '_id': ObjectId(), 'tags': ['a'], 'child': {'name': 'John Jr.'}})
+        # References taken before the clone and the snapshot
+        tags = john.tags
+        child = john.child
+        jane = john.clone()
+        snapshot = john.snapshot()
+        tags.append('b')
+        child.name = 'Johnny Jr.'
+        assert john.tags == ['a', 'b']
+        assert jane.tags == ['a']
+        assert jane.child.name == 'John Jr.'
+        assert snapshot['tags'] == ['a']
+        assert snapshot['child'].name == 'John Jr.'
+        jane.tags.append('c')
+        assert john.tags == ['a', 'b']
+        assert jane.to_mongo() == {'tags': ['a', 'c'], 'child': {'name': 'John Jr.'}}
+
+    def test_clone_copy_on_write(self):
+
+        @self.instance.register
+        class Child(EmbeddedDocument):
+            name = fields.StrField()
+
+        @self.instance.register
+        class Parent(Document):
+            tags = fields.ListField(fields.StrField())
+            child = fields.EmbeddedField(Child)
+            scores = fields.DictField(values=fields.IntField())
+
+        john = Parent.build_from_mongo({
+            '_id': ObjectId(), 'tags': ['a'], 'child': {'name': 'John Jr.'},
+            'scores': {'x': 1}})
+        john.tags.append('b')
+        jane = john.clone()
+        snapshot = john.snapshot()
+        # Values not accessed are shared by the documents and the snapshot
+        for key in ('child', 'scores'):
+            assert jane._data._data[key] is john._data._data[key]
+            assert snapshot[key] is john._data._data[key]
+        # Accessed values are copied
+        assert jane._data._data['tags'] is not john._data._data['tags']
+        assert jane.tags == ['a', 'b']
+        # Each side copies a shared value on first access
+        jane.child.name = 'Jane Jr.'
+        jane.scores['y'] = 2
+        assert john.child.name == 'John Jr.'
+        assert john.scores == {'x': 1}
+        john.scores['z'] = 3
+        assert jane.scores == {'x': 1, 'y': 2}
+        assert snapshot['scores'] == {'x': 1}
+        assert snapshot['child'].name == 'John Jr.'
+        assert john.to_mongo(update=True) == {
+            '$set': {'tags': ['a', 'b'], 'scores': {'x': 1, 'z': 3}}}
+        assert jane.to_mongo() == {
+            'tags': ['a', 'b'], 'child': {'name': 'Jane Jr.'}, 'scores': {'x': 1, 'y': 2}}
+
+    def test_snapshot(self):
+
+        @self.instance.register
+        class Doc(Document):
+            name = fields.StrField()
+            tags = fields.ListField(fields.StrField())
+            count = fields.IntField()
+
+        doc = Doc(name='John', tags=['a'])
+        snapshot = doc.snapshot()
+        assert dict(snapshot) == {'name': 'John', 'tags': ['a']}
+        with pytest.raises(TypeError):
+            snapshot['name'] = 'Jane'
+        doc.name = 'Jane'
+        doc.tags.append('b')
+        doc.count = 1
+        assert dict(snapshot) == {'name': 'John', 'tags': ['a']}
+        assert dict(doc.snapshot()) == {'name': 'Jane', 'tags': ['a', 'b'], 'count': 1}
+
     def test_clone_default_id(self):
         """Check clone gets a new default id if defaut is provided"""
 
@@ -415,6 +561,17 @@ class TestDocument(BaseTest):
         assert jane.id != john.id
         assert jane.name == 'John Doe'
 
+    def test_set_many(self):
+        john = self.Student.build_from_mongo(data={
+            '_id': ObjectId('5672d47b1d41c88dcd37ef05'), 'name': 'John Doe', 'gpa': 3.0})
+        john.set_many({'name': 'John', 'gpa': '3.5'})
+        assert john.to_mongo(update=True) == {'$set': {'name': 'John', 'gpa': 3.5}}
+        with pytest.raises(ma.ValidationError) as exc:
+            john.set_many({'gpa': 'dummy', 'birthday': 'dummy'})
+        assert set(exc.value.messages) == {'gpa', 'birthday'}
+        with pytest.raises(exceptions.AlreadyCreatedError):
+            john.set_many({'id': ObjectId()})
+
     def test_modify_pk_field(self):
 
         @self.instance.register
@@ -736,3 +893,208 @@ class TestConfig(BaseTest):
         with pytest.raises(ma.ValidationError) as exc:
             NonStrictDoc(a=42, b='foo')
         assert exc.value.messages == {'b': ['Unknown field.']}
+
+    def test_schema_version(self):
+        @self.instance.register
+        class Doc(Document):
+            first_name = fields.StrField()
+            last_name = fields.StrField()
+            age = fields.IntField()
+
+            class Meta:
+                schema_version = 3
+
+        @Doc.upgrade(0)
+        def split_name(data):
+            data['first_name'], data['last_name'] = data.pop('name').split(' ', 1)
+            return data
+
+        @Doc.upgrade(2)
+        def drop_age(data):
+            data.pop('age', None)
+            return data
+
+        @self.instance.register
+        class Child(Doc):
+            pass
+
+        assert Child.opts.schema_version == 3
+
+        # Every version needs an upgrade, the data isn't marked as upgraded
+        with pytest.raises(exceptions.DocumentDefinitionError) as exc:
+            Doc.upgrade_from_mongo({'first_name': 'John', '_schema_version': 1})
+        assert exc.value.args[0] == 'Doc: no upgrade registered from schema version 1'
+
+        # Child upgrades don't apply to the parent, the parent's ones apply
+        # to the child even once registered after it
+        @Child.upgrade(1)
+        def child_upgrade(data):
+            data['child'] = True
+            return data
+
+        @Doc.upgrade(1)
+        def parent_upgrade(data):
+            data['parent'] = True
+            return data
+
+        data = {'first_name': 'John', '_schema_version': 1}
+        assert Child.upgrade_from_mongo(data) == {
+            'first_name': 'John', 'child': True, '_schema_version': 3}
+        assert Doc.upgrade_from_mongo(data) == {
+            'first_name': 'John', 'parent': True, '_schema_version': 3}
+        # Compatible version
+        Doc.upgrade(1)(lambda data: data)
+
+        # Upgrades of an abstract parent registered after the child is defined
+        @self.instance.register
+        class AbstractVersioned(Document):
+            name = fields.StrField()
+
+            class Meta:
+                abstract = True
+                schema_version = 2
+
+        @self.instance.register
+        class Concrete(AbstractVersioned):
+            pass
+
+        @AbstractVersioned.upgrade(0)
+        def add_name(data):
+            data.setdefault('name', 'unknown')
+            return data
+
+        AbstractVersioned.upgrade(1)(lambda data: data)
+        assert Concrete.upgrade_from_mongo({'_schema_version': 0}) == {
+            'name': 'unknown', '_schema_version': 2}
+
+        # Upgrade registration checks
+        for version in (-1, 3):
+            with pytest.raises(exceptions.DocumentDefinitionError):
+                Doc.upgrade(version)
+
+        @self.instance.register
+        class NotVersioned(Document):
+            pass
+
+        with pytest.raises(exceptions.DocumentDefinitionError):
+            NotVersioned.upgrade(0)
+
+        with pytest.raises(exceptions.DocumentDefinitionError) as exc:
+            @self.instance.register
+            class ImpossibleChild(Doc):
+                class Meta:
+                    schema_version = 4
+        assert exc.value.args[0] == "Cannot redefine schema_version in a child"
+
+        # Data upgraded step by step
+        oid = ObjectId()
+        data = {'_id': oid, 'name': 'John Doe', 'age': 42}
+        assert Doc.upgrade_from_mongo(data) == {
+            '_id': oid, 'first_name': 'John', 'last_name': 'Doe', '_schema_version': 3}
+        assert data == {'_id': oid, 'name': 'John Doe', 'age': 42}
+        data = {'_id': oid, 'first_name': 'John', 'age': 42, '_schema_version': 2}
+        assert Doc.upgrade_from_mongo(data) == {
+            '_id': oid, 'first_name': 'John', '_schema_version': 3}
+        data = {'_id': oid, 'first_name': 'John', '_schema_version': 3}
+        assert Doc.upgrade_from_mongo(data) is data
+
+        # Upgraded on read, then written back entirely
+        doc = Doc.build_from_mongo({'_id': oid, 'name': 'John Doe', 'age': 42})
+        assert doc.first_name == 'John'
+        assert doc.age is None
+        assert doc.is_modified()
+        assert doc.to_mongo(update=True) == {
+            '$set': {'first_name': 'John', 'last_name': 'Doe', '_schema_version': 3},
+            '$unset': {'age': '', 'name': ''},
+        }
+        assert doc.to_mongo() == {
+            '_id': oid, 'first_name': 'John', 'last_name': 'Doe', '_schema_version': 3}
+
+        # Partially reloaded from an outdated version, written back as well
+        doc = Doc.build_from_mongo({'_id': oid, 'first_name': 'John', '_schema_version': 3})
+        doc.from_mongo({'_id': oid, 'name': 'Jack Doe', 'age': 42}, fields=['first_name'])
+        assert doc.first_name == 'Jack'
+        assert doc.last_name is None
+        assert doc.is_modified()
+        assert doc.to_mongo(update=True) == {
+            '$set': {'first_name': 'Jack', '_schema_version': 3},
+            '$unset': {'age': '', 'name': ''},
+        }
+
+        # Up to date documents are not modified
+        doc = Doc.build_from_mongo({'_id': oid, 'first_name': 'John', '_schema_version': 3})
+        assert not doc.is_modified()
+        doc.age = 12
+        assert doc.to_mongo(update=True) == {'$set': {'age': 12}}
+        assert Doc(first_name='Jane').to_mongo() == {
+            'first_name': 'Jane', '_schema_version': 3}
+
+    def test_from_mongo_fields(self):
+        @self.instance.register
+        class Doc(Document):
+            name = fields.StrField(attribute='n')
+            age = fields.IntField()
+            tags = fields.ListField(fields.StrField())
+
+        oid = ObjectId()
+        doc = Doc.build_from_mongo({'_id': oid, 'n': 'John', 'age': 42, 'tags': ['a']})
+        assert doc._reload_projection() is None
+        assert doc._reload_projection(['name', 'tags']) == {'n': True, 'tags': True}
+        doc.name = 'Jack'
+        doc.age = 43
+        doc.tags.append('b')
+        doc.from_mongo({'_id': oid, 'n': 'Jane'}, fields=['name', 'tags'])
+        assert doc.name == 'Jane'
+        assert doc.tags is None
+        assert doc.age == 43
+        assert doc._data.get_modified_fields() == {'age'}
+        with pytest.raises(KeyError):
+            doc.from_mongo({}, fields=['dummy'])
+
+    def test_version_field(self):
+        @self.instance.register
+        class Doc(Document):
+            name = fields.StrField()
+
+            class Meta:
+                version_field = 'v'
+
+        @self.instance.register
+        class DeclaredVersion(Document):
+            version = fields.IntField(attribute='_v')
+
+            class Meta:
+                version_field = 'version'
+
+        @self.instance.register
+        class Child(Doc):
+            pass
+
+        # Version field added if not declared
+        assert isinstance(Doc.schema.fields['v'], fields.IntField)
+        assert Doc.schema.fields['v'].dump_only
+        assert Child.opts.version_field == 'v'
+        assert DeclaredVersion.schema.fields['version'].attribute == '_v'
+
+        with pytest.raises(exceptions.DocumentDefinitionError) as exc:
+            @self.instance.register
+            class ImpossibleChild(Doc):
+                class Meta:
+                    version_field = 'w'
+        assert exc.value.args[0] == "Cannot redefine version_field in a child"
+
+        # Inserted with version 1
+        doc = Doc(name='John')
+        assert doc._versioned_payload(doc.to_mongo()) == {'name': 'John', 'v': 1}
+
+        # Updated on condition of the current version
+        oid = ObjectId()
+        doc = Doc.build_from_mongo({'_id': oid, 'name': 'John', 'v': 2})
+        assert doc._version_filter() == {'v': 2}
+        doc.name = 'Jane'
+        doc.v = 5
+        assert doc._versioned_payload(doc.to_mongo(update=True), update=True) == {
+            '$set': {'name': 'Jane'}, '$inc': {'v': 1}}
+        doc = DeclaredVersion.build_from_mongo({'_id': oid})
+        assert doc._version_filter() == {'_v': None}
+        assert doc._versioned_payload(doc.to_mongo()) == {'_id': oid, '_v': 1}
@@ -110,6 +110,37 @@ class TestRequired(BaseTest):
 
         MyDoc(embedded_list=None, embedded_dict=None, embedded=None).required_validate()
 
+    def test_required_revalidate_db_values(self):
+        @self.instance.register
+        class MyEmbedded(EmbeddedDocument):
+            required_field = fields.IntField(required=True)
+
+        @self.instance.register
+        class MyDoc(Document):
+            checked = fields.ListField(fields.EmbeddedField(MyEmbedded))
+            trusted = fields.ListField(
+                fields.EmbeddedField(MyEmbedded), revalidate_db_values=False)
+
+        # Data stored before required_field was added
+        doc = MyDoc.build_from_mongo({'_id': ObjectId(), 'checked': [{}], 'trusted': [{}]})
+        with pytest.raises(ma.ValidationError) as exc:
+            doc.required_validate()
+        assert exc.value.messages == {
+            'checked': {0: {'required_field': ['Missing data for required field.']}}}
+        doc.checked = []
+        doc.required_validate()
+        # Modified values are checked
+        doc.trusted.append({'required_field': 1})
+        with pytest.raises(ma.ValidationError) as exc:
+            doc.required_validate()
+        assert exc.value.messages == {
+            'trusted': {0: {'required_field': ['Missing data for required field.']}}}
+        # Values of documents not loaded from database are checked
+        with pytest.raises(ma.ValidationError) as exc:
+            MyDoc(trusted=[{}]).required_validate()
+        assert exc.value.messages == {
+            'trusted': {0: {'required_field': ['Missing data for required field.']}}}
+
 
 class TestFields(BaseTest):
 
@@ -209,6 +240,9 @@ class TestFields(BaseTest):
         assert data['a'].minute == 0
         assert data['a'].second == 0
         assert data['a'].microsecond == 0
+        # Values already rounded are kept as is
+        value = dt.datetime(2016, 8, 6, 12, 30, 30, 123000)
+        assert s.load({'a': value})['a'] is value
 
     def test_aware_datetime(self):
 
@@ -242,6 +276,13 @@ class TestFields(BaseTest):
         assert d.get('b') == dt.datetime(2016, 8, 6, tzinfo=dt.timezone.utc)
         assert d.get('b').tzinfo == timezone_2h
 
+        # Aware datetimes (from a tz_aware client) are only converted if needed
+        value = dt.datetime(2016, 8, 6, tzinfo=dt.timezone.utc)
+        d.from_mongo({'a': value, 'b': value.astimezone(timezone_2h)})
+        assert d.get('a') is value
+        assert d.get('b') == value
+        assert d.get('b').tzinfo == timezone_2h
+
     def test_date(self):
 
         class MySchema(BaseSchema):
@@ -628,6 +669,9 @@ class TestFields(BaseTest):
 
         d.set('objid', "5672d5e71d41c88f914b77c4")
         assert d.get('objid') == ObjectId("5672d5e71d41c88f914b77c4")
+        objid = ObjectId()
+        d.set('objid', objid)
+        assert d.get('objid') is objid
 
         with pytest.raises(ma.ValidationError):
             d.set('objid', 'notanid')
@@ -6,6 +6,7 @@ from bson import ObjectId
 
 from umongo import Document, fields, EmbeddedDocument
 from umongo.instance import Instance
+from umongo.builder import LazyAttribute
 from umongo.document import DocumentTemplate, DocumentImplementation
 from umongo.embedded_document import EmbeddedDocumentTemplate, EmbeddedDocumentImplementation
 import umongo.frameworks
@@ -240,3 +241,38 @@ class TestInstance:
         assert Doc1.opts.instance is instance1
         assert Doc2.schema.fields['embedded'].instance is instance2
         assert Doc2.opts.instance is instance2
+
+    def test_lazy_registration(self):
+        instance = MockedInstance(MockedDB('my_db'), lazy=True)
+
+        @instance.register
+        class Embedded(EmbeddedDocument):
+            a = fields.IntField()
+
+        @instance.register
+        class Parent(Document):
+            _id = fields.StrField(attribute='_id')
+            emb = fields.EmbeddedField(Embedded)
+
+        @instance.register
+        class Child(Parent):
+            b = fields.IntField()
+
+        # Nothing built until first use
+        for impl in (Embedded, Parent, Child):
+            for attr in ('Schema', 'schema', 'DataProxy', '_fields'):
+                assert isinstance(vars(impl)[attr], LazyAttribute)
+        # Id field is retrieved from parent without building it
+        assert Parent.pk_field == '_id'
+        assert Child.pk_field == '_id'
+        assert isinstance(vars(Parent)['schema'], LazyAttribute)
+
+        child = Child(_id='c1', emb={'a': 1}, b=2)
+        assert child.to_mongo() == {'_id': 'c1', '_cls': 'Child', 'emb': {'a': 1}, 'b': 2}
+        # Child and parent are now built
+        for impl in (Embedded, Parent, Child):
+            assert not isinstance(vars(impl)['schema'], LazyAttribute)
+            assert impl.schema is vars(impl)['schema']
+            assert impl.DataProxy.schema is impl.schema
+        assert Child._fields == {'_id', 'emb', 'b', 'cls'}
+        assert issubclass(Child.Schema, Parent.Schema)
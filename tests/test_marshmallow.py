@@ -152,6 +152,40 @@ class TestMarshmallow(BaseTest):
         ma_schema_cls = self.User.schema.as_marshmallow_schema()
         new_ma_schema_cls = self.User.schema.as_marshmallow_schema()
         assert new_ma_schema_cls == ma_schema_cls
+        # Cached by schema class
+        assert self.User.schema.__class__().as_marshmallow_schema() is ma_schema_cls
+
+        # Keyed by gettext function
+        set_gettext(lambda message: 'OMG !!! ' + message)
+        i18n_ma_schema_cls = self.User.schema.as_marshmallow_schema()
+        assert i18n_ma_schema_cls is not ma_schema_cls
+        assert i18n_ma_schema_cls._default_error_messages['unknown'] == 'OMG !!! Unknown field.'
+        set_gettext(None)
+        assert self.User.schema.as_marshmallow_schema() is ma_schema_cls
+
+        # Keyed by the fields selection of the schema instance
+        schema_cls = self.User.schema.__class__
+        name_ma_schema_cls = schema_cls(only=('name',)).as_marshmallow_schema()
+        birthday_ma_schema_cls = schema_cls(only=('birthday',)).as_marshmallow_schema()
+        assert set(name_ma_schema_cls().fields) == {'name'}
+        assert set(birthday_ma_schema_cls().fields) == {'birthday'}
+        assert schema_cls(only=('name',)).as_marshmallow_schema() is name_ma_schema_cls
+        assert set(schema_cls(exclude=('name',)).as_marshmallow_schema()().fields) == {
+            'id', 'birthday'}
+        assert self.User.schema.as_marshmallow_schema() is ma_schema_cls
+
+        # Keyed by base marshmallow schema class
+        class MyBaseSchema(BaseMarshmallowSchema):
+            pass
+
+        self.User.schema.MA_BASE_SCHEMA_CLS = MyBaseSchema
+        assert issubclass(self.User.schema.as_marshmallow_schema(), MyBaseSchema)
+        del self.User.schema.MA_BASE_SCHEMA_CLS
+        assert self.User.schema.as_marshmallow_schema() is ma_schema_cls
+
+        # Invalidation
+        BaseSchema.clear_marshmallow_schema_cache()
+        assert self.User.schema.as_marshmallow_schema() is not ma_schema_cls
 
     def test_keep_attributes(self):
         @self.instance.register
@@ -3,7 +3,7 @@ import datetime as dt
 from bson import ObjectId
 
 from umongo import Document, EmbeddedDocument, fields
-from umongo.query_mapper import map_query
+from umongo.query_mapper import map_query, map_pipeline, unmap_entry_with_dots
 
 from .common import BaseTest, assert_equal_order
 
@@ -152,3 +152,106 @@ class TestQueryMapper(BaseTest):
         assert map_query({'sponsors.contact.name': 1}, team_fields) == {'s.cc.pn': 1}
         assert map_query(
             {'sponsors': {'contact': {'name': 1}}}, team_fields) == {'s': {'cc': {'pn': 1}}}
+
+    def test_pipeline_mapper(self):
+
+        @self.instance.register
+        class Author(EmbeddedDocument):
+            name = fields.StrField(attribute='n')
+
+        @self.instance.register
+        class Book(Document):
+            title = fields.StrField(attribute='t')
+            length = fields.IntField(attribute='l')
+            author = fields.EmbeddedField(Author, attribute='a')
+            tags = fields.ListField(fields.StrField())
+
+        book_fields = Book.schema.fields
+        assert map_pipeline([
+            {'$match': {
+                'length': {'$gt': 100}, 'author.name': 'JRR Tolkien',
+                '$expr': {'$gt': ['$length', '$author.name']},
+            }},
+            {'$sort': {'title': 1, 'length': -1}},
+            {'$limit': 10},
+            {'$project': {
+                'title': 1,
+                'author.name': 1,
+                'pages': {'$add': ['$length', 10]},
+                'literal': {'$literal': '$length'},
+                'var': '$$ROOT',
+            }},
+            # Documents no longer match the schema after a reshaping stage
+            {'$match': {'length': {'$gt': 1000}}},
+            {'$sort': {'title': 1}},
+        ], book_fields) == [
+            {'$match': {
+                'l': {'$gt': 100}, 'a.n': 'JRR Tolkien',
+                '$expr': {'$gt': ['$l', '$a.n']},
+            }},
+            {'$sort': {'t': 1, 'l': -1}},
+            {'$limit': 10},
+            {'$project': {
+                't': 1,
+                'a.n': 1,
+                'pages': {'$add': ['$l', 10]},
+                'literal': {'$literal': '$length'},
+                'var': '$$ROOT',
+            }},
+            {'$match': {'length': {'$gt': 1000}}},
+            {'$sort': {'title': 1}},
+        ]
+        assert map_pipeline([
+            {'$group': {'_id': '$author.name', 'length': {'$sum': '$length'}}},
+            {'$sort': {'_id': 1, 'length': 1}},
+        ], book_fields) == [
+            {'$group': {'_id': '$a.n', 'length': {'$sum': '$l'}}},
+            {'$sort': {'_id': 1, 'length': 1}},
+        ]
+        assert map_pipeline([
+            {'$unwind': {'path': '$author', 'includeArrayIndex': 'index'}},
+            {'$match': {'author': 'JRR Tolkien'}},
+        ], book_fields) == [
+            {'$unwind': {'path': '$a', 'includeArrayIndex': 'index'}},
+            {'$match': {'author': 'JRR Tolkien'}},
+        ]
+        assert map_pipeline([
+            {'$addFields': {'length': {'$multiply': ['$length', 2]}}},
+            {'$match': {'length': 1}},
+        ], book_fields) == [
+            {'$addFields': {'length': {'$multiply': ['$l', 2]}}},
+            {'$match': {'length': 1}},
+        ]
+        assert map_pipeline([
+            {'$lookup': {
+                'from': 'author', 'localField': 'author.name',
+                'foreignField': 'name', 'as': 'authors'}},
+            {'$replaceRoot': {'newRoot': '$author'}},
+        ], book_fields) == [
+            {'$lookup': {
+                'from': 'author', 'localField': 'a.n',
+                'foreignField': 'name', 'as': 'authors'}},
+            {'$replaceRoot': {'newRoot': '$author'}},
+        ]
+        assert map_pipeline([{'$replaceWith': '$author'}], book_fields) == [
+            {'$replaceWith': '$a'}]
+
+    def test_unmap_entry(self):
+
+        @self.instance.register
+        class Author(EmbeddedDocument):
+            name = fields.StrField(attribute='n')
+
+        @self.instance.register
+        class Book(Document):
+            title = fields.StrField(attribute='t')
+            author = fields.EmbeddedField(Author, attribute='a')
+            authors = fields.ListField(fields.EmbeddedField(Author), attribute='as')
+
+        book_fields = Book.schema.fields
+        assert unmap_entry_with_dots('t', book_fields) == 'title'
+        assert unmap_entry_with_dots('a.n', book_fields) == 'author.name'
+        assert unmap_entry_with_dots('as.1.n', book_fields) == 'authors.1.name'
+        # Unknown entries are left untouched
+        assert unmap_entry_with_dots('a.unknown', book_fields) == 'author.unknown'
+        assert unmap_entry_with_dots('_id', book_fields) == 'id'
@@ -2,6 +2,7 @@ import marshmallow as ma
 
 from .expose_missing import RemoveMissingSchema
 from .exceptions import DocumentDefinitionError
+from . import i18n
 from .i18n import gettext as _, N_
 
 
@@ -34,6 +35,9 @@ class BaseSchema(ma.Schema):
     # to let the template set the base marshmallow schema class.
     # It may be overriden in Template classes.
     MA_BASE_SCHEMA_CLS = BaseMarshmallowSchema
+    # Incremented to invalidate the pure marshmallow schemas cached by
+    # the schema classes
+    _ma_schemas_version = 0
 
     class Meta:
         ordered = True
@@ -41,7 +45,6 @@ class BaseSchema(ma.Schema):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.error_messages = I18nErrorDict(self.error_messages)
-        self._ma_schema = None
 
     def map_to_field(self, func):
         """
@@ -57,26 +60,55 @@ class BaseSchema(ma.Schema):
                 field.map_to_field(mongo_path, name, func)
 
     def as_marshmallow_schema(self):
-        """Return a pure-marshmallow version of this schema class"""
+        """
+        Return a pure-marshmallow version of this schema class
+
+        The generated schema is cached by the schema class, per base
+        marshmallow schema class, gettext function and the `only`,
+        `exclude`, `load_only` and `dump_only` arguments of this schema
+        instance, which select and configure its fields. The other
+        arguments (e.g. `partial`) are not carried over: pass them when
+        instantiating the generated schema.
+        """
         # Use a cache to avoid generating several times the same schema
-        if self._ma_schema is not None:
-            return self._ma_schema
+        cls = type(self)
+        cache = cls.__dict__.get('_ma_schemas')
+        if cache is None or cache[0] != BaseSchema._ma_schemas_version:
+            cache = (BaseSchema._ma_schemas_version, {})
+            cls._ma_schemas = cache
+        key = (
+            self.MA_BASE_SCHEMA_CLS, i18n._gettext,
+            None if self.only is None else frozenset(self.only), frozenset(self.exclude),
+            frozenset(self.load_only), frozenset(self.dump_only),
+        )
+        m_schema = cache[1].get(key)
+        if m_schema is not None:
+            return m_schema
 
         # Create schema if not found in cache
         nmspc = {
             name: field.as_marshmallow_field()
             for name, field in self.fields.items()
         }
-        name = 'Marshmallow%s' % type(self).__name__
+        name = 'Marshmallow%s' % cls.__name__
         m_schema = type(name, (self.MA_BASE_SCHEMA_CLS, ), nmspc)
         # Add i18n support to the schema
         # We can't use I18nErrorDict here because __getitem__ is not called
         # when error_messages is updated with _default_error_messages.
         m_schema._default_error_messages = {
             k: _(v) for k, v in m_schema._default_error_messages.items()}
-        self._ma_schema = m_schema
+        cache[1][key] = m_schema
         return m_schema
 
+    @staticmethod
+    def clear_marshmallow_schema_cache():
+        """
+        Invalidate the pure-marshmallow schemas cached by
+        :meth:`as_marshmallow_schema` for all the schema classes (e.g. after
+        modifying a field's parameters).
+        """
+        BaseSchema._ma_schemas_version += 1
+
 
 class BaseField(ma.fields.Field):
     """
@@ -106,7 +138,8 @@ class BaseField(ma.fields.Field):
 
     MARSHMALLOW_ARGS_PREFIX = 'marshmallow_'
 
-    def __init__(self, *args, io_validate=None, unique=False, instance=None, **kwargs):
+    def __init__(self, *args, io_validate=None, io_validate_concurrency=None,
+                 unique=False, instance=None, revalidate_db_values=True, **kwargs):
         if 'missing' in kwargs:
             raise DocumentDefinitionError(
                 "uMongo doesn't use `missing` argument, use `default` "
@@ -142,6 +175,12 @@ class BaseField(ma.fields.Field):
         # list and embedded fields.
         self.io_validate = io_validate
         self.io_validate_recursive = None
+        # Maximum number of items of a container field validated concurrently
+        # (async frameworks only). If None, the instance's setting is used.
+        self.io_validate_concurrency = io_validate_concurrency
+        # If False, a value loaded from database and not modified since is
+        # not validated again on commit (e.g. a list of embedded documents)
+        self.revalidate_db_values = revalidate_db_values
         self.unique = unique
         self.instance = instance
 
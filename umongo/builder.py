@@ -5,6 +5,7 @@ A builder connect a :class:`umongo.document.Template` with a
 :class:`umongo.document.Implementation`.
 """
 import re
+from collections import ChainMap
 from copy import copy
 
 import marshmallow as ma
@@ -62,6 +63,8 @@ def _on_need_add_id_field(bases, fields_dict):
     """
     If the given fields make no reference to `_id`, add an `id` field
     (type ObjectId, dump_only=True, attribute=`_id`) to handle it
+
+    :param bases: Parent implementations providing a schema
     """
 
     def find_id_field(fields_dict):
@@ -75,8 +78,11 @@ def _on_need_add_id_field(bases, fields_dict):
 
     # Search among parents for the id field
     for base in bases:
-        schema = base()
-        name = find_id_field(schema.fields)
+        # Parent documents already looked up their id field, no need to
+        # instantiate their schema again
+        name = getattr(base, 'pk_field', None)
+        if name is None:
+            name = find_id_field(base.Schema._declared_fields)
         if name is not None:
             return name
 
@@ -90,6 +96,23 @@ def _on_need_add_id_field(bases, fields_dict):
     return 'id'
 
 
+def _on_need_add_version_field(bases, fields_dict, name):
+    """
+    If the `version_field` is not declared by the document or its parents,
+    add it as an integer field only set on commit
+
+    :param bases: Parent implementations providing a schema
+    """
+    if name in fields_dict:
+        return
+    for base in bases:
+        if getattr(base.opts, 'version_field', None) == name:
+            return
+        if name in base.Schema._declared_fields:
+            return
+    fields_dict[name] = fields.IntField(dump_only=True)
+
+
 def _collect_schema_attrs(template):
     """
     Split dict between schema fields and non-fields elements and retrieve
@@ -112,21 +135,50 @@ def _collect_schema_attrs(template):
     return nmspc, schema_fields, schema_non_fields
 
 
+class LazyAttribute:
+    """
+    Placeholder for an implementation class attribute computed upon first use.
+
+    All the lazy attributes of an implementation share the same `build`
+    function, which returns a dict of the actual attributes. On first access
+    to any of them, they are all replaced in the implementation class.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.owner = None
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner):
+        for name, value in self.build().items():
+            setattr(self.owner, name, value)
+        return getattr(self.owner, self.name)
+
+
 class BaseBuilder:
     """
     A builder connect a :class:`umongo.document.Template` with a
     :class:`umongo.instance.BaseInstance` by generating an
     :class:`umongo.document.Implementation`.
 
+    :param instance: Instance the implementations are built for
+    :param lazy: If True, defer the creation of the schema and the DataProxy
+        of the implementations until their first use.
+
     .. note:: This class should not be used directly, it should be inherited by
               concrete implementations such as :class:`umongo.frameworks.pymongo.PyMongoBuilder`
     """
 
     BASE_DOCUMENT_CLS = None
 
-    def __init__(self, instance):
+    def __init__(self, instance, lazy=False):
         assert self.BASE_DOCUMENT_CLS
         self.instance = instance
+        self.lazy = lazy
         self._templates_lookup = {
             DocumentTemplate: self.BASE_DOCUMENT_CLS,
             EmbeddedDocumentTemplate: EmbeddedDocumentImplementation,
@@ -185,6 +237,14 @@ class BaseBuilder:
             kwargs['strict'] = getattr(meta, 'strict', True)
             if base_tmpl_cls is DocumentTemplate:
                 collection_name = getattr(meta, 'collection_name', None)
+                schema_version = getattr(meta, 'schema_version', None)
+                upgrades = None
+                diff_updates = getattr(meta, 'diff_updates', None)
+                version_field = getattr(meta, 'version_field', None)
+                routing = {
+                    option: getattr(meta, option, None)
+                    for option in ('database', 'read_preference', 'read_concern')
+                }
 
             # Handle option inheritance and integrity checks
             for base in bases:
@@ -200,6 +260,33 @@ class BaseBuilder:
                             raise DocumentDefinitionError(
                                 "Cannot redefine collection_name in a child, use abstract instead")
                         collection_name = popts.collection_name
+                    if not popts.abstract:
+                        # Children are stored in their parent's collection
+                        # and must be upgraded the same way, the upgrades
+                        # registered on the child only apply to it
+                        if schema_version is not None:
+                            raise DocumentDefinitionError(
+                                "Cannot redefine schema_version in a child")
+                        schema_version = popts.schema_version
+                        upgrades = ChainMap({}, popts.upgrades)
+                    elif popts.schema_version is not None:
+                        if schema_version is None:
+                            schema_version = popts.schema_version
+                        upgrades = ChainMap({}, popts.upgrades)
+                    if diff_updates is None:
+                        diff_updates = popts.diff_updates
+                    if popts.version_field:
+                        if version_field and not popts.abstract:
+                            raise DocumentDefinitionError(
+                                "Cannot redefine version_field in a child")
+                        version_field = version_field or popts.version_field
+                    if popts.database and routing['database'] and not popts.abstract:
+                        # Children are stored in their parent's collection
+                        raise DocumentDefinitionError(
+                            "Cannot redefine database in a child")
+                    for option, value in routing.items():
+                        if value is None:
+                            routing[option] = getattr(popts, option)
 
         if base_tmpl_cls is DocumentTemplate:
             if collection_name:
@@ -210,6 +297,11 @@ class BaseBuilder:
                 # Determine the collection name from the class name
                 collection_name = camel_to_snake(template.__name__)
             kwargs['collection_name'] = collection_name
+            kwargs['schema_version'] = schema_version
+            kwargs['upgrades'] = upgrades
+            kwargs['diff_updates'] = bool(diff_updates)
+            kwargs['version_field'] = version_field
+            kwargs.update(routing)
 
         return base_opts_cls(**kwargs)
 
@@ -229,29 +321,42 @@ class BaseBuilder:
         opts = self._build_document_opts(template, bases, is_child)
         nmspc['opts'] = opts
 
-        # Create schema by retrieving inherited schema classes
-        schema_bases = tuple(
-            base.Schema for base in bases
-            if issubclass(base, Implementation) and hasattr(base, 'Schema')
+        # Parent implementations to inherit schema from
+        parents = tuple(
+            base for base in bases
+            if issubclass(base, Implementation) and 'Schema' in vars(base)
         )
-        if not schema_bases:
-            schema_bases = (BaseSchema, )
         if base_tmpl_cls is DocumentTemplate:
-            nmspc['pk_field'] = _on_need_add_id_field(schema_bases, schema_fields)
+            nmspc['pk_field'] = _on_need_add_id_field(parents, schema_fields)
+            if opts.version_field:
+                _on_need_add_version_field(parents, schema_fields, opts.version_field)
 
         if base_tmpl_cls is not MixinDocumentTemplate:
             if is_child:
                 schema_fields['cls'] = fields.StringField(
                     attribute='_cls', default=name, dump_only=True
                 )
-        schema_cls = self._build_schema(template, schema_bases, schema_fields, schema_non_fields)
-        nmspc['Schema'] = schema_cls
-        schema = schema_cls()
-        nmspc['schema'] = schema
-        if base_tmpl_cls is not MixinDocumentTemplate:
-            nmspc['DataProxy'] = data_proxy_factory(name, schema, strict=opts.strict)
-            # Add field names set as class attribute
-            nmspc['_fields'] = set(schema.fields.keys())
+
+        def build_schema():
+            # Create schema by retrieving inherited schema classes
+            schema_bases = tuple(base.Schema for base in parents) or (BaseSchema, )
+            schema_cls = self._build_schema(
+                template, schema_bases, schema_fields, schema_non_fields)
+            schema = schema_cls()
+            attrs = {'Schema': schema_cls, 'schema': schema}
+            if base_tmpl_cls is not MixinDocumentTemplate:
+                attrs['DataProxy'] = data_proxy_factory(name, schema, strict=opts.strict)
+                # Add field names set as class attribute
+                attrs['_fields'] = set(schema.fields.keys())
+            return attrs
+
+        if self.lazy:
+            attr_names = ['Schema', 'schema']
+            if base_tmpl_cls is not MixinDocumentTemplate:
+                attr_names += ['DataProxy', '_fields']
+            nmspc.update({attr: LazyAttribute(build_schema) for attr in attr_names})
+        else:
+            nmspc.update(build_schema())
 
         implementation = type(name, bases, nmspc)
         self._templates_lookup[template] = implementation
@@ -1,24 +1,34 @@
 """umongo BaseDataProxy"""
+import datetime as dt
+from copy import deepcopy
+from types import MappingProxyType
+
 import marshmallow as ma
 
-from .abstract import BaseDataObject
+from .abstract import BaseDataObject, BaseField
 from .exceptions import UnknownFieldInDBError
 from .i18n import gettext as _
 
 
-__all__ = ('data_proxy_factory')
+__all__ = ('data_proxy_factory', 'mongo_serializer_factory', 'dump_serializer_factory')
 
 
 class BaseDataProxy:
 
-    __slots__ = ('_data', '_modified_data')
+    __slots__ = ('_data', '_modified_data', '_shared', '_exposed')
     schema = None
     _fields = None
     _fields_from_mongo_key = None
+    _setters = None
 
     def __init__(self, data=None):
         # Inside data proxy, data are stored in mongo world representation
         self._modified_data = set()
+        # Keys of the values shared with other data proxies or snapshots,
+        # copied on first access (see `share_data`)
+        self._shared = set()
+        # Keys of the values that may be referenced outside the data proxy
+        self._exposed = set()
         self._data = {}
         self.load(data or {})
 
@@ -36,6 +46,55 @@ class BaseDataProxy:
                 mongo_data[key] = val
         return mongo_data
 
+    def to_mongo_diff(self, snapshot):
+        """
+        Return the update payload of the modified fields whose value differs
+        from the MongoDB data `snapshot`, or None if there is no difference.
+
+        Embedded documents, dicts and lists of the same length are compared
+        item by item so that only the changed paths are set.
+        """
+        set_data = {}
+        unset_data = []
+        for name in self.get_modified_fields():
+            field = self._fields[name]
+            key = field.attribute or name
+            val = field.serialize_to_mongo(self._data[key])
+            if val is ma.missing:
+                if key in snapshot:
+                    unset_data.append(key)
+            elif key in snapshot:
+                _diff_mongo(key, snapshot[key], val, set_data, unset_data)
+            else:
+                set_data[key] = val
+        mongo_data = {}
+        if set_data:
+            mongo_data['$set'] = set_data
+        if unset_data:
+            mongo_data['$unset'] = {k: "" for k in unset_data}
+        return mongo_data or None
+
+    def mongo_snapshot(self, snapshot=None):
+        """
+        Return a copy of the data in MongoDB world representation, not
+        affected by later changes to the data.
+
+        :param snapshot: Previous result, only the modified fields are
+            serialized again.
+        """
+        if snapshot is None:
+            return deepcopy(self._to_mongo())
+        snapshot = dict(snapshot)
+        for name in self.get_modified_fields():
+            field = self._fields[name]
+            key = field.attribute or name
+            val = field.serialize_to_mongo(self._data[key])
+            if val is ma.missing:
+                snapshot.pop(key, None)
+            else:
+                snapshot[key] = deepcopy(val)
+        return snapshot
+
     def _to_mongo_update(self):
         mongo_data = {}
         set_data = {}
@@ -56,6 +115,8 @@ class BaseDataProxy:
 
     def from_mongo(self, data):
         self._data = {}
+        self._shared.clear()
+        self._exposed.clear()
         for key, val in data.items():
             try:
                 field = self._fields_from_mongo_key[key]
@@ -68,8 +129,52 @@ class BaseDataProxy:
         self.clear_modified()
         self._add_missing_fields()
 
+    def from_mongo_fields(self, data, names):
+        """
+        Replace the values of the given fields by the ones in MongoDB `data`,
+        a field absent from `data` being reset to missing. The other fields
+        and their modified state are left untouched.
+        """
+        for name in names:
+            name, field = self._get_field(name)
+            self._modified_data.discard(name)
+            self._shared.discard(name)
+            self._exposed.discard(name)
+            if name in data:
+                self._data[name] = field.deserialize_from_mongo(data[name])
+            elif callable(field.missing):
+                self._data[name] = field.missing()
+            else:
+                self._data[name] = field.missing
+
     def dump(self):
-        return self.schema.dump(self._data)
+        return self.get_dump_serializer()(self._data)
+
+    @classmethod
+    def get_dump_serializer(cls):
+        """
+        Return the serializer generated by :func:`dump_serializer_factory`
+        for the schema of this data proxy (built on first call).
+        """
+        serializer = cls.__dict__.get('_dump_serializer')
+        if serializer is None:
+            serializer = dump_serializer_factory(cls.schema)
+            cls._dump_serializer = staticmethod(serializer)
+            return serializer
+        return serializer.__func__
+
+    @classmethod
+    def get_mongo_serializer(cls):
+        """
+        Return the serializer generated by :func:`mongo_serializer_factory`
+        for the schema of this data proxy (built on first call).
+        """
+        serializer = cls.__dict__.get('_mongo_serializer')
+        if serializer is None:
+            serializer = mongo_serializer_factory(cls.schema)
+            cls._mongo_serializer = staticmethod(serializer)
+            return serializer
+        return serializer.__func__
 
     def _mark_as_modified(self, key):
         self._modified_data.add(key)
@@ -78,6 +183,8 @@ class BaseDataProxy:
         # Always use marshmallow partial load to skip required checks
         loaded_data = self.schema.load(data, partial=True)
         self._data.update(loaded_data)
+        self._shared.difference_update(loaded_data)
+        self._exposed.update(loaded_data)
         for key in loaded_data:
             self._mark_as_modified(key)
 
@@ -86,6 +193,9 @@ class BaseDataProxy:
         loaded_data = self.schema.load(data, partial=True)
         # Cast to dict to ignore field order in comparisons
         self._data = dict(loaded_data)
+        self._shared.clear()
+        # Values provided by the caller
+        self._exposed = set(loaded_data)
         # Map the modified fields list on the the loaded data
         self.clear_modified()
         for key in loaded_data:
@@ -98,24 +208,105 @@ class BaseDataProxy:
         name = field.attribute or name
         return name, field
 
+    def _get_value(self, key):
+        if key in self._shared:
+            # Copy the shared value before it can be modified
+            self._shared.discard(key)
+            self._data[key] = deepcopy(self._data[key])
+        self._exposed.add(key)
+        return self._data[key]
+
     def get(self, name):
         name, _ = self._get_field(name)
-        return self._data[name]
+        return self._get_value(name)
 
     def set(self, name, value):
-        name, field = self._get_field(name)
-        if value is None and not getattr(field, 'allow_none', False):
-            raise ma.ValidationError(field.error_messages['null'])
-        if value is not None:
-            value = field._deserialize(value, name, None)
-            field._validate(value)
-        self._data[name] = value
-        self._mark_as_modified(name)
+        key, load = self._setters[name]
+        self._data[key] = load(value)
+        self._shared.discard(key)
+        self._exposed.add(key)
+        self._mark_as_modified(key)
+
+    def set_many(self, data, validate=True):
+        """
+        Set several fields at once.
+
+        Values are all deserialized and validated before any of them is set,
+        errors are reported together by field name.
+
+        :param data: Dict of values by field name.
+        :param validate: If False, values are considered already deserialized
+            and valid and are set as is, only None being still rejected for
+            fields not allowing it.
+        """
+        setters = self._setters
+        loaded = {}
+        errors = {}
+        for name, value in data.items():
+            try:
+                key, load = setters[name]
+            except KeyError:
+                errors[name] = [_('Unknown field.')]
+                continue
+            if validate:
+                try:
+                    value = load(value)
+                except ma.ValidationError as exc:
+                    errors[name] = exc.messages
+                    continue
+            elif value is None and not self._fields[name].allow_none:
+                errors[name] = [self._fields[name].error_messages['null']]
+                continue
+            loaded[key] = value
+        if errors:
+            raise ma.ValidationError(errors)
+        self._data.update(loaded)
+        self._shared.difference_update(loaded)
+        self._exposed.update(loaded)
+        self._modified_data.update(loaded)
+
+    def share_data(self):
+        """
+        Return a shallow copy of the data, along with the keys of its shared
+        values.
+
+        Lists, dicts and embedded documents never returned by this data
+        proxy (e.g. loaded from database and not accessed since) are shared
+        instead of copied: this data proxy (and the other owner) copies
+        them on first access. The other ones may be referenced outside and
+        modified through these references, they are deep-copied.
+        """
+        data = dict(self._data)
+        shared = set()
+        for key, val in data.items():
+            if isinstance(val, BaseDataObject):
+                if key in self._exposed:
+                    data[key] = deepcopy(val)
+                else:
+                    shared.add(key)
+        self._shared |= shared
+        return data, shared
+
+    def snapshot(self):
+        """
+        Return a read-only mapping of the current values by field name,
+        missing values are omitted.
+
+        Values are shared with the data proxy as with :meth:`share_data`,
+        they must not be modified.
+        """
+        data, _ = self.share_data()
+        return MappingProxyType({
+            name: data[field.attribute or name]
+            for name, field in self._fields.items()
+            if data[field.attribute or name] is not ma.missing
+        })
 
     def delete(self, name):
         name, field = self._get_field(name)
         default = field.default
         self._data[name] = default() if callable(default) else default
+        self._shared.discard(name)
         self._mark_as_modified(name)
 
     def __repr__(self):
@@ -162,14 +353,28 @@ class BaseDataProxy:
                 else:
                     self._data[mongo_name] = field.missing
 
-    def required_validate(self):
+    def required_validate(self, from_db=False):
+        """
+        Check the required fields, including the ones of embedded documents.
+
+        :param from_db: If True, data has been loaded from database and the
+            values not modified since of the fields with
+            ``revalidate_db_values=False`` are not checked again.
+        """
         errors = {}
         for name, field in self.schema.fields.items():
-            value = self._data[field.attribute or name]
+            key = field.attribute or name
+            value = self._data[key]
             if field.required and value is ma.missing:
                 errors[name] = [_("Missing data for required field.")]
             elif value is ma.missing or value is None:
                 continue
+            elif (
+                    from_db and not field.revalidate_db_values and
+                    key not in self._modified_data and
+                    not (isinstance(value, BaseDataObject) and value.is_modified())
+            ):
+                continue
             elif hasattr(field, '_required_validate'):
                 try:
                     field._required_validate(value)
@@ -182,14 +387,14 @@ class BaseDataProxy:
 
     def items(self):
         return (
-            (key, self._data[field.attribute or key]) for key, field in self._fields.items()
+            (key, self._get_value(field.attribute or key)) for key, field in self._fields.items()
         )
 
     def keys(self):
         return (field.attribute or key for key, field in self._fields.items())
 
     def values(self):
-        return self._data.values()
+        return (self._get_value(key) for key in self._data)
 
 
 class BaseNonStrictDataProxy(BaseDataProxy):
@@ -211,6 +416,8 @@ class BaseNonStrictDataProxy(BaseDataProxy):
 
     def from_mongo(self, data):
         self._data = {}
+        self._shared.clear()
+        self._exposed.clear()
         for key, val in data.items():
             try:
                 field = self._fields_from_mongo_key[key]
@@ -222,6 +429,56 @@ class BaseNonStrictDataProxy(BaseDataProxy):
         self._add_missing_fields()
 
 
+def _diff_mongo(path, old, new, set_data, unset_data):
+    """Add to `set_data` and `unset_data` the paths changed from `old` to `new`"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        keys = old.keys() | new.keys()
+        if not all(isinstance(k, str) and k and '.' not in k and k[0] != '$' for k in keys):
+            # Keys can't be used in a path
+            if old != new:
+                set_data[path] = new
+            return
+        for key, val in new.items():
+            if key in old:
+                _diff_mongo('%s.%s' % (path, key), old[key], val, set_data, unset_data)
+            else:
+                set_data['%s.%s' % (path, key)] = val
+        unset_data.extend('%s.%s' % (path, key) for key in old if key not in new)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for idx, (old_val, val) in enumerate(zip(old, new)):
+            _diff_mongo('%s.%s' % (path, idx), old_val, val, set_data, unset_data)
+    elif isinstance(old, dt.datetime) and isinstance(new, dt.datetime):
+        # Datetimes are loaded naive from database, compare them as stored
+        if _naive_utc(old) != _naive_utc(new):
+            set_data[path] = new
+    elif type(old) is not type(new) or old != new:
+        set_data[path] = new
+
+
+def _naive_utc(value):
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+
+def _loader_factory(key, field):
+    """Return a function deserializing and validating a value set to the field"""
+    deserialize = field._deserialize
+    validate = field._validate
+    allow_none = getattr(field, 'allow_none', False)
+
+    def load(value):
+        if value is None:
+            if not allow_none:
+                raise ma.ValidationError(field.error_messages['null'])
+            return None
+        value = deserialize(value, key, None)
+        validate(value)
+        return value
+
+    return load
+
+
 def data_proxy_factory(basename, schema, strict=True):
     """
     Generate a DataProxy from the given schema.
@@ -236,8 +493,108 @@ def data_proxy_factory(basename, schema, strict=True):
         '__slots__': (),
         'schema': schema,
         '_fields': schema.fields,
-        '_fields_from_mongo_key': {v.attribute or k: v for k, v in schema.fields.items()}
+        '_fields_from_mongo_key': {v.attribute or k: v for k, v in schema.fields.items()},
+        # Mongo world key and loader of each field, to set values without lookups
+        '_setters': {
+            k: (v.attribute or k, _loader_factory(v.attribute or k, v))
+            for k, v in schema.fields.items()
+        },
     }
 
     data_proxy_cls = type(cls_name, (BaseDataProxy if strict else BaseNonStrictDataProxy, ), nmspc)
     return data_proxy_cls
+
+
+def mongo_serializer_factory(schema):
+    """
+    Generate a function serializing the data loaded by the given schema
+    into MongoDB world representation.
+
+    This is the equivalent of building a data proxy from the loaded data
+    and calling its ``to_mongo`` method, without the per-field lookups:
+    fields that don't need any conversion are copied as is.
+
+    The returned function takes the loaded data and a `required` flag
+    to check the required fields as ``required_validate`` does.
+    """
+    entries = []
+    for name, field in schema.fields.items():
+        convert = not (
+            type(field).serialize_to_mongo is BaseField.serialize_to_mongo and
+            type(field)._serialize_to_mongo is BaseField._serialize_to_mongo)
+        entries.append((name, field.attribute or name, field, convert))
+
+    def serialize(data, required=False):
+        mongo_data = {}
+        errors = {}
+        for name, key, field, convert in entries:
+            if key in data:
+                val = data[key]
+            else:
+                val = field.missing() if callable(field.missing) else field.missing
+            if required:
+                if val is ma.missing:
+                    if field.required:
+                        errors[name] = [_("Missing data for required field.")]
+                    continue
+                if val is not None and hasattr(field, '_required_validate'):
+                    try:
+                        field._required_validate(val)
+                    except ma.ValidationError as exc:
+                        errors[name] = exc.messages
+                        continue
+            if convert:
+                val = field.serialize_to_mongo(val)
+            if val is not ma.missing:
+                mongo_data[key] = val
+        if errors:
+            raise ma.ValidationError(errors)
+        return mongo_data
+
+    return serialize
+
+
+def dump_serializer_factory(schema):
+    """
+    Generate a function dumping the data of a data proxy for the given
+    schema.
+
+    This is the equivalent of ``schema.dump(data, many=False)`` with the
+    fields' keys and dump defaults resolved once: each field is serialized
+    directly, without marshmallow's per-call processing. Schemas defining
+    dump hooks are dumped by marshmallow.
+    """
+    if (schema._has_processors(ma.decorators.PRE_DUMP) or
+            schema._has_processors(ma.decorators.POST_DUMP)):
+        return schema.dump
+    entries = []
+    for name, field in schema.dump_fields.items():
+        key = field.data_key if field.data_key is not None else name
+        # Fields getting their value from the data as marshmallow does
+        direct = (
+            field._CHECK_ATTRIBUTE and
+            type(field).get_value is ma.fields.Field.get_value)
+        entries.append((name, field.attribute or name, key, field, field.default, direct))
+    dict_class = schema.dict_class
+    get_attribute = schema.get_attribute
+
+    def serialize(data, many=False):
+        if many:
+            return [serialize(item) for item in data]
+        dumped = dict_class()
+        for name, attribute, key, field, default, direct in entries:
+            if direct:
+                val = data.get(attribute, ma.missing)
+                if val is ma.missing:
+                    val = default() if callable(default) else default
+                    if val is ma.missing:
+                        continue
+                val = field._serialize(val, name, data)
+            else:
+                val = field.serialize(name, data, accessor=get_attribute)
+                if val is ma.missing:
+                    continue
+            dumped[key] = val
+        return dumped
+
+    return serialize
@@ -8,12 +8,14 @@ from marshmallow import (
 )
 
 from .exceptions import (
-    AlreadyCreatedError, NotCreatedError, NoDBDefinedError, AbstractDocumentError
+    AlreadyCreatedError, NotCreatedError, NoDBDefinedError, AbstractDocumentError,
+    DocumentDefinitionError, NoTenantError
 )
 from .template import Template, MetaImplementation
 from .embedded_document import EmbeddedDocumentImplementation
 from .data_objects import Reference
 from .indexes import parse_index
+from .json_encoding import json_dumps
 
 
 __all__ = (
@@ -22,6 +24,7 @@ __all__ = (
     'DocumentOpts',
     'MetaDocumentImplementation',
     'DocumentImplementation',
+    'SCHEMA_VERSION_KEY',
     'pre_load',
     'post_load',
     'pre_dump',
@@ -48,6 +51,9 @@ class DocumentTemplate(Template):
 Document = DocumentTemplate
 "Shortcut to DocumentTemplate"
 
+SCHEMA_VERSION_KEY = '_schema_version'
+"Name of the MongoDB field storing the schema version of a versioned document"
+
 
 class DocumentOpts:
     """
@@ -73,12 +79,37 @@ class DocumentOpts:
     abstract             yes                    Document has no collection
                                                 and can only be inherited
     collection_name      yes                    Name of the collection to store
-                                                the document into
+                                                the document into, or callable
+                                                returning it from the current
+                                                tenant key
     is_child             no                     Document inherit of a non-abstract document
     strict               yes                    Don't accept unknown fields from mongo
                                                 (default: True)
     indexes              yes                    List of custom indexes
     offspring            no                     List of Documents inheriting this one
+    schema_version       yes                    Current version of the document's
+                                                schema, stored in database (default: None,
+                                                document not versioned)
+    upgrades             no                     Upgrade functions by schema version,
+                                                chained to the parent's ones: the
+                                                parent's upgrades apply to the child,
+                                                the child's ones only to it
+    diff_updates         yes                    Keep the data loaded from MongoDB to only
+                                                write the values that changed on commit
+                                                (default: False)
+    version_field        yes                    Name of the integer field holding the
+                                                document's version, checked and
+                                                incremented on commit (default: None)
+    database             yes                    Name of the database to store the
+                                                document into, in the client of the
+                                                instance's one (default: None, the
+                                                instance's database)
+    read_preference      yes                    Read preference of the document's
+                                                collection (default: None, the
+                                                database's one)
+    read_concern         yes                    Read concern of the document's
+                                                collection (default: None, the
+                                                database's one)
     ==================== ====================== ===========
     """
     def __repr__(self):
@@ -90,11 +121,20 @@ class DocumentOpts:
                 'is_child={self.is_child}, '
                 'strict={self.strict}, '
                 'indexes={self.indexes}, '
-                'offspring={self.offspring})>'
+                'offspring={self.offspring}, '
+                'schema_version={self.schema_version}, '
+                'diff_updates={self.diff_updates}, '
+                'version_field={self.version_field}, '
+                'database={self.database}, '
+                'read_preference={self.read_preference}, '
+                'read_concern={self.read_concern})>'
                 .format(ClassName=self.__class__.__name__, self=self))
 
     def __init__(self, instance, template, collection_name=None, abstract=False,
-                 indexes=None, is_child=True, strict=True, offspring=None):
+                 indexes=None, is_child=True, strict=True, offspring=None,
+                 schema_version=None, upgrades=None, diff_updates=False,
+                 version_field=None, database=None, read_preference=None,
+                 read_concern=None):
         self.instance = instance
         self.template = template
         self.collection_name = collection_name if not abstract else None
@@ -103,6 +143,13 @@ class DocumentOpts:
         self.is_child = is_child
         self.strict = strict
         self.offspring = set(offspring) if offspring else set()
+        self.schema_version = schema_version
+        self.upgrades = upgrades if upgrades is not None else {}
+        self.diff_updates = diff_updates
+        self.version_field = version_field
+        self.database = database
+        self.read_preference = read_preference
+        self.read_concern = read_concern
 
 
 class MetaDocumentImplementation(MetaImplementation):
@@ -110,6 +157,23 @@ class MetaDocumentImplementation(MetaImplementation):
     def __init__(cls, *args, **kwargs):
         cls._indexes = None
 
+    @property
+    def collection_name(cls):
+        """
+        Return the name of the collection used by this document class
+
+        A callable ``collection_name`` meta option is called with the key of
+        the current tenant.
+        """
+        name = cls.opts.collection_name
+        if callable(name):
+            tenant = cls.opts.instance._tenant.get()
+            if tenant is None:
+                raise NoTenantError(
+                    '%s collection depends on the tenant, none is set' % cls.__name__)
+            name = name(tenant)
+        return name
+
     @property
     def collection(cls):
         """
@@ -119,7 +183,17 @@ class MetaDocumentImplementation(MetaImplementation):
             raise NoDBDefinedError('Abstract document has no collection')
         if not cls.opts.instance.db:
             raise NoDBDefinedError('Instance must be initialized first')
-        return cls.opts.instance.db[cls.opts.collection_name]
+        opts = cls.opts
+        database, read_preference, read_concern = (
+            opts.database, opts.read_preference, opts.read_concern)
+        routing = opts.instance._routing.get()
+        if routing is not None:
+            database = routing.get('database', database)
+            read_preference = routing.get('read_preference', read_preference)
+            read_concern = routing.get('read_concern', read_concern)
+        return opts.instance.get_collection(
+            cls.collection_name, database=database,
+            read_preference=read_preference, read_concern=read_concern)
 
     @property
     def indexes(cls):
@@ -186,7 +260,7 @@ class DocumentImplementation(
               concrete implementations such as :class:`umongo.frameworks.pymongo.PyMongoDocument`
     """
 
-    __slots__ = ('is_created', '_data')
+    __slots__ = ('is_created', '_data', '_schema_upgrade', '_db_snapshot')
     opts = DocumentOpts(None, DocumentTemplate, abstract=True)
 
     def __init__(self, **kwargs):
@@ -194,6 +268,10 @@ class DocumentImplementation(
             raise AbstractDocumentError("Cannot instantiate an abstract Document")
         self.is_created = False
         "Return True if the document has been commited to database"  # is_created's docstring
+        # Keys of the upgraded MongoDB data if the document must be written back
+        self._schema_upgrade = None
+        # MongoDB data as last read or written if `diff_updates` is set
+        self._db_snapshot = None
         super().__init__(**kwargs)
 
     def __repr__(self):
@@ -214,13 +292,18 @@ class DocumentImplementation(
     def clone(self):
         """Return a copy of this Document as a new Document instance
 
-        All fields are deep-copied except the _id field.
+        All fields are copied except the _id field. Lists, dicts and embedded
+        documents are copied on write: the ones not accessed since loaded
+        from database are shared by both documents until one of them
+        accesses its value, the other ones are deep-copied.
         """
         new = self.__class__()
-        data = deepcopy(self._data._data)
+        data, shared = self._data.share_data()
         # Replace ID with new ID ("missing" unless a default value is provided)
         data['_id'] = new._data._data['_id']
         new._data._data = data
+        new._data._shared = shared - {'_id'}
+        new._data._exposed = set()
         new._data._modified_data = set(data.keys())
         return new
 
@@ -271,12 +354,119 @@ class DocumentImplementation(
         doc.from_mongo(data)
         return doc
 
-    def from_mongo(self, data):
+    @classmethod
+    def upgrade(cls, version):
         """
-        Update the document with the MongoDB data
+        Register a function upgrading the documents' data from a schema
+        version to the next one.
+
+        The function receives a copy of the data as stored in MongoDB and
+        returns the upgraded data. Every version has to be registered, a
+        version compatible with the next one with a function returning the
+        data unchanged.
+
+        .. code-block:: python
+
+            @Doc.upgrade(1)
+            def split_name(data):
+                data['first_name'], data['last_name'] = data.pop('name').split(' ', 1)
+                return data
+
+        :param version: Version upgraded by the function. Documents
+            stored before `schema_version` was set are at version 0.
+        """
+        if cls.opts.schema_version is None:
+            raise DocumentDefinitionError(
+                '{}: schema_version must be set to register upgrades'.format(cls.__name__))
+        if not 0 <= version < cls.opts.schema_version:
+            raise DocumentDefinitionError(
+                '{}: cannot register an upgrade from version {} (schema_version is {})'.format(
+                    cls.__name__, version, cls.opts.schema_version))
+
+        def decorator(func):
+            cls.opts.upgrades[version] = func
+            return func
+        return decorator
+
+    @classmethod
+    def upgrade_from_mongo(cls, data):
+        """
+        Return MongoDB data upgraded to the current schema version
+
+        The upgrade functions of the versions between the data's one and the
+        current one are applied in order. Data already at the current
+        version (or newer) is returned unchanged.
+
+        Raises :class:`umongo.exceptions.DocumentDefinitionError` if one of
+        these versions has no upgrade function, rather than marking the data
+        as upgraded.
 
         :param data: data as retrieved from MongoDB
         """
+        current = cls.opts.schema_version
+        version = data.get(SCHEMA_VERSION_KEY) or 0
+        if current is None or version >= current:
+            return data
+        missing = [ver for ver in range(version, current) if ver not in cls.opts.upgrades]
+        if missing:
+            raise DocumentDefinitionError(
+                '{}: no upgrade registered from schema version {}'.format(
+                    cls.__name__, ', '.join(str(ver) for ver in missing)))
+        data = dict(data)
+        for ver in range(version, current):
+            data = cls.opts.upgrades[ver](data)
+        data[SCHEMA_VERSION_KEY] = current
+        return data
+
+    def _reload_projection(self, fields=None):
+        """
+        Return the projection retrieving the given fields from MongoDB, None
+        to retrieve the entire document.
+
+        Versioned documents are always retrieved entirely as upgrade
+        functions need the whole data.
+
+        :param fields: Names of the fields to retrieve.
+        """
+        if fields is None or self.opts.schema_version is not None:
+            return None
+        return {self.schema.fields[name].attribute or name: True for name in fields}
+
+    def from_mongo(self, data, fields=None):
+        """
+        Update the document with the MongoDB data
+
+        Data stored with an older schema version is upgraded, the document
+        is then considered modified so that the next commit writes it back
+        entirely with the current version, even if only some `fields` are
+        updated.
+
+        :param data: data as retrieved from MongoDB
+        :param fields: Names of the fields to update, the other fields are
+            left untouched and keep their modified state. By default, the
+            whole document is replaced.
+        """
+        if fields is not None:
+            upgraded = self.upgrade_from_mongo(data)
+            if upgraded is not data:
+                self._schema_upgrade = set(data) | (self._schema_upgrade or set())
+            data = upgraded
+            self._data.from_mongo_fields(data, fields)
+            if self._db_snapshot is not None:
+                for name in fields:
+                    key = self.schema.fields[name].attribute or name
+                    if key in data:
+                        self._db_snapshot[key] = deepcopy(data[key])
+                    else:
+                        self._db_snapshot.pop(key, None)
+            return
+        self._schema_upgrade = None
+        self._db_snapshot = deepcopy(data) if self.opts.diff_updates else None
+        if self.opts.schema_version is not None:
+            upgraded = self.upgrade_from_mongo(data)
+            if upgraded is not data:
+                self._schema_upgrade = set(data)
+            data = {k: v for k, v in upgraded.items() if k != SCHEMA_VERSION_KEY}
         self._data.from_mongo(data)
         self.is_created = True
 
@@ -286,10 +476,71 @@ class DocumentImplementation(
 
         :param update: if True the return dict should be used as an
                        update payload instead of containing the entire document
+                       (with `diff_updates`, only the paths whose value changed
+                       since the document was loaded or committed)
         """
         if update and not self.is_created:
             raise NotCreatedError('Must create the document before using update')
-        return self._data.to_mongo(update=update)
+        if update and self._schema_upgrade is None:
+            if self._db_snapshot is not None:
+                return self._data.to_mongo_diff(self._db_snapshot)
+            return self._data.to_mongo(update=True)
+        if self.opts.schema_version is None:
+            return self._data.to_mongo()
+        mongo_data = self._data.to_mongo()
+        mongo_data[SCHEMA_VERSION_KEY] = self.opts.schema_version
+        if not update:
+            return mongo_data
+        # Upgraded document: write it back entirely
+        mongo_data.pop('_id', None)
+        payload = {'$set': mongo_data}
+        unset_data = self._schema_upgrade - set(mongo_data) - {'_id'}
+        if unset_data:
+            payload['$unset'] = {k: "" for k in sorted(unset_data)}
+        return payload
+
+    def _next_version(self):
+        # Missing and None versions are both falsy
+        return (self._data.get(self.opts.version_field) or 0) + 1
+
+    def _version_filter(self):
+        """
+        Return the condition on the version stored in database to add to the
+        commit or delete query (empty without `version_field`).
+        """
+        name = self.opts.version_field
+        if name is None:
+            return {}
+        version = self._data.get(name)
+        # `None` also matches documents stored without version
+        return {self.schema.fields[name].attribute or name: (
+            None if version is ma.missing else version)}
+
+    def _versioned_payload(self, payload, update=False):
+        """
+        Make the commit `payload` write the next version of the document
+        (unchanged without `version_field`).
+        """
+        name = self.opts.version_field
+        if name is None or payload is None:
+            return payload
+        key = self.schema.fields[name].attribute or name
+        if not update:
+            payload[key] = self._next_version()
+            return payload
+        # The version can only be incremented
+        for operator in ('$set', '$unset'):
+            if key in payload.get(operator, ()):
+                del payload[operator][key]
+                if not payload[operator]:
+                    del payload[operator]
+        payload['$inc'] = {key: 1}
+        return payload
+
+    def _bump_version(self):
+        """Increment the version of the document once committed"""
+        if self.opts.version_field is not None:
+            self._data.set(self.opts.version_field, self._next_version())
 
     def update(self, data):
         """Update the document with the given data."""
@@ -297,17 +548,78 @@ class DocumentImplementation(
             raise AlreadyCreatedError("Can't modify id of a created document")
         self._data.update(data)
 
+    def set_many(self, data, validate=True):
+        """
+        Set several fields of the document at once.
+
+        Values are all validated before any of them is set, errors are
+        reported together by field name.
+
+        :param data: Dict of values by field name.
+        :param validate: If False, values are considered already deserialized
+            and valid and are set as is, except None for fields not allowing it.
+        """
+        if self.is_created and self.pk_field in data:
+            raise AlreadyCreatedError("Can't modify id of a created document")
+        self._data.set_many(data, validate=validate)
+
+    def clear_modified(self):
+        """
+        Reset the list of document's modified items.
+
+        With `diff_updates`, the current data is then considered to be the
+        one stored in database. A pending schema upgrade (see :meth:`upgrade`)
+        is considered written as well and is forgotten.
+        """
+        if self.opts.diff_updates:
+            # An upgraded document has been written back entirely
+            snapshot = self._db_snapshot if self._schema_upgrade is None else None
+            self._db_snapshot = self._data.mongo_snapshot(snapshot)
+        self._data.clear_modified()
+        self._schema_upgrade = None
+
     def dump(self):
         """
         Dump the document.
         """
         return self._data.dump()
 
+    @classmethod
+    def dump_many(cls, docs, as_json=False, encoder=json_dumps):
+        """
+        Dump the documents, the equivalent of ``[doc.dump() for doc in docs]``
+        with a single schema pass over the documents of each class.
+
+        :param docs: Documents of this class or of its children.
+        :param as_json: If True, return the dumped documents encoded in JSON.
+        :param encoder: Function encoding the list of dumped documents to
+            JSON bytes (e.g. a faster JSON library's ``dumps``, passing it
+            :func:`umongo.json_encoding.json_default`).
+        """
+        docs = list(docs)
+        indexes_by_cls = {}
+        for idx, doc in enumerate(docs):
+            indexes_by_cls.setdefault(type(doc), []).append(idx)
+        dumped = [None] * len(docs)
+        for doc_cls, indexes in indexes_by_cls.items():
+            serialize = doc_cls.DataProxy.get_dump_serializer()
+            items = serialize([docs[idx]._data._data for idx in indexes], many=True)
+            for idx, item in zip(indexes, items):
+                dumped[idx] = item
+        return encoder(dumped) if as_json else dumped
+
+    def required_validate(self):
+        self._data.required_validate(from_db=self.is_created)
+
     def is_modified(self):
         """
         Returns True if and only if the document was modified since last commit.
         """
-        return not self.is_created or self._data.is_modified()
+        return (
+            not self.is_created or
+            self._schema_upgrade is not None or
+            self._data.is_modified()
+        )
 
     # Data-proxy accessor shortcuts
 
@@ -323,7 +635,7 @@ class DocumentImplementation(
 
     def __setattr__(self, name, value):
         if name in self._fields:
-            if self.is_created and name == self.pk_field:
+            if name == self.pk_field and self.is_created:
                 raise AlreadyCreatedError("Can't modify id of a created document")
             self._data.set(name, value)
         else:
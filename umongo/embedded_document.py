@@ -145,6 +145,16 @@ class EmbeddedDocumentImplementation(Implementation, BaseDataObject):
         """
         return self._data.update(data)
 
+    def set_many(self, data, validate=True):
+        """
+        Set several fields of the embedded document at once.
+
+        :param data: Dict of values by field name.
+        :param validate: If False, values are considered already deserialized
+            and valid and are set as is, except None for fields not allowing it.
+        """
+        self._data.set_many(data, validate=validate)
+
     def dump(self):
         """
         Dump the embedded document.
@@ -154,6 +164,18 @@ class EmbeddedDocumentImplementation(Implementation, BaseDataObject):
     def items(self):
         return self._data.items()
 
+    def snapshot(self):
+        """
+        Return a read-only mapping of the current values by field name
+        (missing values are omitted), e.g. to audit or diff the document.
+
+        Later modifications of the document don't affect the snapshot. Lists,
+        dicts and embedded documents not accessed since loaded from database
+        are shared rather than copied, and copied by the document before it
+        can modify them. The snapshot's values must not be modified.
+        """
+        return self._data.snapshot()
+
     # Data-proxy accessor shortcuts
 
     def __getitem__(self, name):
@@ -21,6 +21,10 @@ class NoDBDefinedError(UMongoError):
     """No database defined"""
 
 
+class NoTenantError(UMongoError):
+    """No tenant set to resolve a tenant-dependent collection"""
+
+
 class NotRegisteredDocumentError(UMongoError):
     """Document not registered"""
 
@@ -40,5 +40,8 @@ class RemoveMissingSchema(ma.Schema):
     :class:`umongo.Document`s.
     """
     def dump(self, *args, **kwargs):
+        # Nested schemas are dumped within the context of the outer one
+        if EXPOSE_MISSING.get():
+            return super().dump(*args, **kwargs)
         with ExposeMissing():
             return super().dump(*args, **kwargs)
@@ -94,6 +94,9 @@ def _round_to_millisecond(datetime):
     MongoDB stores datetimes with a millisecond precision.
     For consistency, use the same precision in the object representation.
     """
+    if not datetime.microsecond % 1000:
+        # Already rounded (e.g. loaded from database)
+        return datetime
     microseconds = round(datetime.microsecond, -3)
     if microseconds == 1000000:
         return datetime.replace(microsecond=0) + dt.timedelta(seconds=1)
@@ -122,6 +125,15 @@ class NaiveDateTimeField(BaseField, ma.fields.NaiveDateTime):
 
 class AwareDateTimeField(BaseField, ma.fields.AwareDateTime):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Timezone the values loaded from database are converted to
+        # (None to keep them in UTC)
+        if self.default_timezone is None or self.default_timezone is dt.timezone.utc:
+            self._mongo_timezone = None
+        else:
+            self._mongo_timezone = self.default_timezone
+
     def _deserialize(self, value, attr, data, **kwargs):
         if isinstance(value, dt.datetime):
             ret = value
@@ -130,9 +142,10 @@ class AwareDateTimeField(BaseField, ma.fields.AwareDateTime):
         return _round_to_millisecond(ret)
 
     def _deserialize_from_mongo(self, value):
-        value = value.replace(tzinfo=dt.timezone.utc)
-        if self.default_timezone is not None:
-            value = value.astimezone(self.default_timezone)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt.timezone.utc)
+        if self._mongo_timezone is not None and value.tzinfo is not self._mongo_timezone:
+            value = value.astimezone(self._mongo_timezone)
         return value
 
 
@@ -171,10 +184,24 @@ class ConstantField(BaseField, ma.fields.Constant):
     pass
 
 
+def _keeps_mongo_value(field):
+    """Return True if the field's values are the same in MongoDB and OO worlds"""
+    if field is None:
+        return True
+    field_cls = type(field)
+    return (
+        field_cls.deserialize_from_mongo is BaseField.deserialize_from_mongo and
+        field_cls._deserialize_from_mongo is BaseField._deserialize_from_mongo
+    )
+
+
 class DictField(BaseField, ma.fields.Dict):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Items loaded from database can be used as is
+        self._keeps_mongo_items = (
+            _keeps_mongo_value(self.key_field) and _keeps_mongo_value(self.value_field))
 
         def cast_value_or_callable(key_field, value_field, value):
             if value is ma.missing:
@@ -200,6 +227,8 @@ class DictField(BaseField, ma.fields.Dict):
         }
 
     def _deserialize_from_mongo(self, value):
+        if value and self._keeps_mongo_items:
+            return Dict(self.key_field, self.value_field, value)
         if value:
             return Dict(
                 self.key_field,
@@ -241,6 +270,8 @@ class ListField(BaseField, ma.fields.List):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Items loaded from database can be used as is
+        self._keeps_mongo_items = _keeps_mongo_value(self.inner)
 
         def cast_value_or_callable(inner, value):
             if value is ma.missing:
@@ -262,6 +293,8 @@ class ListField(BaseField, ma.fields.List):
         return [self.inner.serialize_to_mongo(each) for each in obj]
 
     def _deserialize_from_mongo(self, value):
+        if value and self._keeps_mongo_items:
+            return List(self.inner, value)
         if value:
             return List(
                 self.inner,
@@ -1,23 +1,186 @@
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from copy import deepcopy
+
+import bson
 from mongomock.database import Database
 from mongomock.collection import Cursor
+from mongomock.command_cursor import CommandCursor
+from mongomock.filtering import filter_applies
 
-from .pymongo import PyMongoBuilder, PyMongoDocument, BaseWrappedCursor
+from .pymongo import (
+    PyMongoBuilder, PyMongoDocument, PyMongoInstance, PyMongoTransaction, BaseWrappedCursor)
 from ..instance import Instance
 from ..document import DocumentImplementation
 
 
 # Mongomock aims at working like pymongo
 
+# Mongomock has no change streams: the events of the watched collections
+# are recorded on the documents' commit and delete, by client (identity,
+# clients with the same address being equal) then collection's full name
+_CHANGE_EVENTS = {}
+# Number of events kept by collection, the oldest ones being dropped
+CHANGE_EVENTS_MAX = 1000
+
+
+def reset_change_events():
+    """Drop the recorded change events (e.g. between tests)"""
+    _CHANGE_EVENTS.clear()
+
+
+class _ChangeLog:
+    """Last events of a collection, numbered from the first one recorded"""
+
+    def __init__(self):
+        self.events = deque(maxlen=CHANGE_EVENTS_MAX)
+        self.count = 0
+
+    def append(self, change):
+        self.events.append(change)
+        self.count += 1
+
+    def get(self, position):
+        """Return the event with the given number, or the oldest one kept after"""
+        first = self.count - len(self.events)
+        return self.events[max(position - first, 0)]
+
+
+def _change_log(collection, create=False):
+    """Return the events of the collection, None if it is not watched"""
+    client = collection.database.client
+    logs = _CHANGE_EVENTS.get(id(client))
+    if logs is None:
+        if not create:
+            return None
+        logs = _CHANGE_EVENTS[id(client)] = {}
+        # Forget the events with the client, its id being reusable
+        weakref.finalize(client, _CHANGE_EVENTS.pop, id(client), None)
+    if create:
+        return logs.setdefault(collection.full_name, _ChangeLog())
+    return logs.get(collection.full_name)
+
 
 class WrappedCursor(BaseWrappedCursor, Cursor):
     __slots__ = ()
 
 
+class WrappedCommandCursor(BaseWrappedCursor, CommandCursor):
+    __slots__ = ()
+
+
+class FakeChangeStream:
+    """
+    Change stream over the events recorded for a collection.
+
+    Only the changes made through the documents' ``commit`` and ``delete``
+    are provided, iteration stops once the recorded events are exhausted.
+    Only `$match` stages are supported in the pipeline.
+    """
+
+    def __init__(self, collection, pipeline=None, full_document=None, resume_after=None,
+                 **kwargs):
+        for stage in pipeline or ():
+            if list(stage) != ['$match']:
+                raise NotImplementedError('Only $match stages are supported')
+        self.collection = collection
+        self.pipeline = pipeline or []
+        self.full_document = full_document
+        self._log = _change_log(collection, create=True)
+        if resume_after is None:
+            self._position = self._log.count
+        else:
+            self._position = int(resume_after['_data'], 16) + 1
+        self.alive = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.alive and self._position < self._log.count:
+            change = deepcopy(self._log.get(self._position))
+            self._position = int(change['_id']['_data'], 16) + 1
+            if (change['operationType'] == 'update' and
+                    self.full_document == 'updateLookup'):
+                change['fullDocument'] = self.collection.find_one(change['documentKey'])
+            if all(filter_applies(stage['$match'], change) for stage in self.pipeline):
+                return change
+        raise StopIteration
+
+    next = __next__
+
+    def close(self):
+        self.alive = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _record_change(log, collection, operation_type, document_id, **extra):
+    change = {
+        '_id': {'_data': '%016x' % log.count},
+        'operationType': operation_type,
+        'ns': {'db': collection.database.name, 'coll': collection.name},
+        'documentKey': {'_id': document_id},
+    }
+    change.update(extra)
+    log.append(deepcopy(change))
+
+
 class MongoMockDocument(PyMongoDocument):
     __slots__ = ()
     cursor_cls = WrappedCursor
+    command_cursor_cls = WrappedCommandCursor
     opts = DocumentImplementation.opts
 
+    @classmethod
+    def _find_bson(cls, *args, session=None, **kwargs):
+        # Mongomock doesn't provide raw BSON documents, encode them again
+        return cls.collection.find(*args, **kwargs), bson.BSON.encode
+
+    @classmethod
+    def _open_change_stream(cls, pipeline, **kwargs):
+        return FakeChangeStream(cls.collection, pipeline, **kwargs)
+
+    def _finish_commit(self, operation, ret, inserted_id=None, payload=None):
+        log = _change_log(self.collection)
+        # Built from the written payload rather than read back from database
+        if log is not None and operation == 'insert':
+            _record_change(log, self.collection, 'insert', inserted_id,
+                           fullDocument=dict(payload, _id=inserted_id))
+        elif log is not None and operation == 'replace':
+            _record_change(log, self.collection, 'replace', self.pk,
+                           fullDocument=dict(payload, _id=self.pk))
+        elif log is not None and operation == 'update':
+            updated_fields = dict(payload.get('$set', {}))
+            # Only the version is incremented by a commit
+            for key in payload.get('$inc', ()):
+                updated_fields[key] = self._next_version()
+            _record_change(log, self.collection, 'update', self.pk, updateDescription={
+                'updatedFields': updated_fields,
+                'removedFields': list(payload.get('$unset', ()))})
+        super()._finish_commit(operation, ret, inserted_id, payload)
+
+    def _finish_delete(self, ret):
+        log = _change_log(self.collection)
+        if log is not None:
+            _record_change(log, self.collection, 'delete', self.pk)
+        super()._finish_delete(ret)
+
+
+class MongoMockTransaction(PyMongoTransaction):
+    """Transaction whose writes don't use the session, unknown to mongomock"""
+
+    def _find_one(self, collection, query):
+        return collection.find_one(query, {'_id': True})
+
+    def _bulk_write(self, collection, requests):
+        return collection.bulk_write(requests)
+
 
 class MongoMockBuilder(PyMongoBuilder):
     BASE_DOCUMENT_CLS = MongoMockDocument
@@ -32,3 +195,19 @@ class MongoMockInstance(Instance):
     @staticmethod
     def is_compatible_with(db):
         return isinstance(db, Database)
+
+    ensure_all_indexes = PyMongoInstance.ensure_all_indexes
+
+    @contextmanager
+    def transaction(self, session, max_retries=5, backoff=0.01, **kwargs):
+        """
+        See :meth:`umongo.frameworks.pymongo.PyMongoInstance.transaction`.
+
+        Mongomock has neither sessions nor transactions: `session` (e.g. a
+        fake session raising errors to test the retries) only drives the
+        transaction and is not bound to the context. The writes are neither
+        isolated nor rolled back.
+        """
+        transaction = MongoMockTransaction(session)
+        yield transaction
+        transaction._run(max_retries, backoff, kwargs)
@@ -1,12 +1,16 @@
 import collections
 from contextvars import ContextVar
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, AsyncExitStack
 
-from inspect import iscoroutine
+from inspect import iscoroutine, isawaitable
 import asyncio
+import itertools
+import time
 
-from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCursor
-from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import (
+    AsyncIOMotorDatabase, AsyncIOMotorCursor, AsyncIOMotorLatentCommandCursor)
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import ReplaceOne
 import marshmallow as ma
 
 from ..builder import BaseBuilder
@@ -17,13 +21,20 @@ from ..exceptions import NotCreatedError, UpdateError, DeleteError, NoneReferenc
 from ..fields import ReferenceField, ListField, DictField, EmbeddedField
 from ..query_mapper import map_query
 
-from .tools import cook_find_filter, remove_cls_field_from_embedded_docs
+from .tools import (
+    cook_find_filter, cook_aggregate_pipeline, cook_update, cook_batch_delete_filter,
+    cook_insert_many_batches, cook_scan_filters, cook_range_filter, scan_sample_pipeline,
+    scan_bounds, diff_indexes, documents_by_collection, migrate_2_to_3_documents,
+    migration_checkpoint, MigrationStats, cook_schema_upgrade_filter, upgrade_documents,
+    retry_delay, cook_update_document, RETURN_DOCUMENT, cook_watch_pipeline,
+    build_change_event, has_error_label, cook_transaction_writes, check_transaction_result,
+    unique_index_error, bulk_write_unique_error)
 
 
 SESSION = ContextVar("session", default=None)
 
 
-class WrappedCursor(AsyncIOMotorCursor):
+class BaseWrappedCursor:
 
     __slots__ = ('raw_cursor', 'document_cls')
 
@@ -31,8 +42,8 @@ class WrappedCursor(AsyncIOMotorCursor):
         # Such a cunning plan my lord !
         # We inherit from Cursor but don't call its __init__ because
         # we act as a proxy to the underlying raw_cursor
-        WrappedCursor.raw_cursor.__set__(self, cursor)
-        WrappedCursor.document_cls.__set__(self, document_cls)
+        BaseWrappedCursor.raw_cursor.__set__(self, cursor)
+        BaseWrappedCursor.document_cls.__set__(self, document_cls)
 
     def __getattr__(self, name):
         return getattr(self.raw_cursor, name)
@@ -41,7 +52,7 @@ class WrappedCursor(AsyncIOMotorCursor):
         return setattr(self.raw_cursor, name, value)
 
     def clone(self):
-        return WrappedCursor(self.document_cls, self.raw_cursor.clone())
+        return type(self)(self.document_cls, self.raw_cursor.clone())
 
     async def next(self):
         raw = await self.raw_cursor.__anext__()
@@ -60,17 +71,195 @@ class WrappedCursor(AsyncIOMotorCursor):
             return callback(result, error)
         return self.raw_cursor.each(wrapped_callback)
 
-    def to_list(self, length, callback=None):
-        kwargs = {"callback": callback} if callback else {}
-        raw_future = self.raw_cursor.to_list(length, **kwargs)
-        cooked_future = asyncio.Future()
+    async def to_list(self, length):
+        raw_docs = await self.raw_cursor.to_list(length)
         builder = self.document_cls.build_from_mongo
+        return [builder(e, use_cls=True) for e in raw_docs]
+
+    async def batches(self, size=1000):
+        """
+        Asynchronous generator providing the documents by lists.
+
+        The batch size of a cursor not yet started is set to `size` so that
+        each list maps a batch returned by the server, hydrated at once.
+
+        :param size: Maximum number of documents per list.
+        """
+        # The batch size can't be changed once the cursor is started
+        if not self.raw_cursor.started:
+            self.raw_cursor.batch_size(size)
+        builder = self.document_cls.build_from_mongo
+        while True:
+            raw_docs = await self.raw_cursor.to_list(size)
+            if not raw_docs:
+                return
+            yield [builder(e, use_cls=True) for e in raw_docs]
+
+
+class WrappedCursor(BaseWrappedCursor, AsyncIOMotorCursor):
+    __slots__ = ()
+
+
+class WrappedCommandCursor(BaseWrappedCursor, AsyncIOMotorLatentCommandCursor):
+    __slots__ = ()
 
-        def on_raw_done(fut):
-            cooked_future.set_result([builder(e, use_cls=True) for e in fut.result()])
 
-        raw_future.add_done_callback(on_raw_done)
-        return cooked_future
+def _retrieve_task_exception(task):
+    if not task.cancelled():
+        task.exception()
+
+
+class PrefetchWrappedCursor(WrappedCursor):
+    """
+    Cursor requesting the next batch of documents in background while the
+    current one is hydrated and consumed (at most one batch in flight).
+
+    Documents should be retrieved with ``async for`` or :meth:`batches`,
+    :meth:`to_list`, :meth:`next_object` and :meth:`each` also consume the
+    prefetched batches rather than reading the raw cursor.
+
+    A cursor left before its end should be closed with ``await cursor.close()``
+    so that the batch requested in background is cancelled and awaited.
+    """
+    __slots__ = ('prefetch_size', '_buffer', '_next_batch')
+
+    def __init__(self, document_cls, cursor, size=1000):
+        super().__init__(document_cls, cursor)
+        cursor.batch_size(size)
+        PrefetchWrappedCursor.prefetch_size.__set__(self, size)
+        PrefetchWrappedCursor._buffer.__set__(self, collections.deque())
+        PrefetchWrappedCursor._next_batch.__set__(self, None)
+
+    def clone(self):
+        return type(self)(self.document_cls, self.raw_cursor.clone(), self.prefetch_size)
+
+    def _cancel_next_batch(self):
+        """Cancel the batch requested in background and return its task, if any"""
+        next_batch = self._next_batch
+        if next_batch is not None:
+            PrefetchWrappedCursor._next_batch.__set__(self, None)
+            next_batch.cancel()
+            # The request may have failed already, don't leave its error unretrieved
+            next_batch.add_done_callback(_retrieve_task_exception)
+        return next_batch
+
+    async def _discard_next_batch(self):
+        """Cancel the batch requested in background and wait for its task to end"""
+        next_batch = self._cancel_next_batch()
+        if next_batch is not None:
+            # Unlike awaiting the task, doesn't raise its error nor CancelledError
+            await asyncio.wait([next_batch])
+
+    async def close(self):
+        """
+        Cancel the batch requested in background, then close the cursor.
+
+        Call like ``await cursor.close()``.
+        """
+        await self._discard_next_batch()
+        ret = self.raw_cursor.close()
+        if isawaitable(ret):
+            await ret
+
+    def __del__(self):
+        try:
+            PrefetchWrappedCursor._next_batch.__get__(self)
+        except AttributeError:
+            # Not initialized
+            return
+        self._cancel_next_batch()
+
+    async def _fetch_batch(self):
+        """Return the current batch and request the next one in background"""
+        next_batch = self._next_batch
+        if next_batch is None:
+            raw_docs = await self.raw_cursor.to_list(self.prefetch_size)
+        else:
+            PrefetchWrappedCursor._next_batch.__set__(self, None)
+            raw_docs = await next_batch
+        if raw_docs:
+            PrefetchWrappedCursor._next_batch.__set__(
+                self, asyncio.ensure_future(self.raw_cursor.to_list(self.prefetch_size)))
+            # Let the request be sent before hydrating the current batch
+            await asyncio.sleep(0)
+        return raw_docs
+
+    async def next(self):
+        if not self._buffer:
+            self._buffer.extend(await self._fetch_batch())
+            if not self._buffer:
+                raise StopAsyncIteration()
+        return self.document_cls.build_from_mongo(self._buffer.popleft(), use_cls=True)
+
+    __anext__ = next
+
+    def next_object(self):
+        """Return the next document of the batches already fetched, or None."""
+        if not self._buffer:
+            return None
+        return self.document_cls.build_from_mongo(self._buffer.popleft(), use_cls=True)
+
+    def each(self, callback):
+        """
+        Call `callback` with ``(document, None)`` for each document, then
+        with ``(None, None)`` (or ``(None, error)`` on error) in background.
+        Iteration stops if `callback` returns False.
+        """
+        async def iterate():
+            try:
+                while True:
+                    try:
+                        doc = await self.next()
+                    except StopAsyncIteration:
+                        break
+                    if callback(doc, None) is False:
+                        await self._discard_next_batch()
+                        return
+            except Exception as exc:
+                callback(None, exc)
+                return
+            callback(None, None)
+
+        asyncio.ensure_future(iterate())
+
+    async def to_list(self, length):
+        raw_docs = []
+        while length is None or len(raw_docs) < length:
+            if not self._buffer:
+                self._buffer.extend(await self._fetch_batch())
+                if not self._buffer:
+                    break
+            count = len(self._buffer)
+            if length is not None:
+                count = min(count, length - len(raw_docs))
+            raw_docs.extend(self._buffer.popleft() for _ in range(count))
+        builder = self.document_cls.build_from_mongo
+        return [builder(e, use_cls=True) for e in raw_docs]
+
+    async def batches(self, size=None):
+        """
+        Asynchronous generator providing the documents by lists.
+
+        :param size: Maximum number of documents per list, defaults to the
+            prefetch batch size.
+        """
+        if size is not None:
+            PrefetchWrappedCursor.prefetch_size.__set__(self, size)
+            if not self.raw_cursor.started:
+                self.raw_cursor.batch_size(size)
+        builder = self.document_cls.build_from_mongo
+        try:
+            if self._buffer:
+                yield [builder(e, use_cls=True) for e in self._buffer]
+                self._buffer.clear()
+            while True:
+                raw_docs = await self._fetch_batch()
+                if not raw_docs:
+                    return
+                yield [builder(e, use_cls=True) for e in raw_docs]
+        finally:
+            # Consumer stopped early, don't leave a request running in background
+            await self._discard_next_batch()
 
 
 class MotorAsyncIODocument(DocumentImplementation):
@@ -118,20 +307,26 @@ class MotorAsyncIODocument(DocumentImplementation):
             ret = await ret
         return ret
 
-    async def reload(self):
+    async def reload(self, fields=None):
         """
         Retrieve and replace document's data by the ones in database.
 
+        :param fields: Names of the fields to reload (using a projection),
+            the other fields are left untouched and keep their modified state.
+            By default, the whole document is reloaded.
+
         Raises :class:`umongo.exceptions.NotCreatedError` if the document
         doesn't exist in database.
         """
         if not self.is_created:
             raise NotCreatedError("Document doesn't exists in database")
-        ret = await self.collection.find_one(self.pk, session=SESSION.get())
+        ret = await self.collection.find_one(
+            self.pk, projection=self._reload_projection(fields), session=SESSION.get())
         if ret is None:
             raise NotCreatedError("Document doesn't exists in database")
-        self._data = self.DataProxy()
-        self._data.from_mongo(ret)
+        if fields is None:
+            self._data = self.DataProxy()
+        self.from_mongo(ret, fields=fields)
 
     async def commit(self, io_validate_all=False, conditions=None, replace=False):
         """
@@ -149,60 +344,33 @@ class MotorAsyncIODocument(DocumentImplementation):
             ObjectId of the inserted document.
         """
         try:
-            if self.is_created:
-                if self.is_modified() or replace:
-                    query = conditions or {}
-                    query['_id'] = self.pk
-                    # pre_update can provide additional query filter and/or
-                    # modify the fields' values
-                    additional_filter = await self.__coroutined_pre_update()
-                    if additional_filter:
-                        query.update(map_query(additional_filter, self.schema.fields))
-                    self.required_validate()
-                    await self.io_validate(validate_all=io_validate_all)
-                    if replace:
-                        payload = self._data.to_mongo(update=False)
+            operation = await self._prepare_commit(io_validate_all, conditions, replace)
+            ret = None
+            if operation is not None:
+                operation, query, payload = operation
+                if operation == 'insert':
+                    ret = await self.collection.insert_one(payload, session=SESSION.get())
+                    # TODO: check ret ?
+                    await self._finish_commit(operation, ret, ret.inserted_id)
+                else:
+                    if operation == 'check':
+                        await self._check_commit_conditions(query)
+                    elif operation == 'replace':
                         ret = await self.collection.replace_one(
                             query, payload, session=SESSION.get())
                     else:
-                        payload = self._data.to_mongo(update=True)
                         ret = await self.collection.update_one(
                             query, payload, session=SESSION.get())
-                    if ret.matched_count != 1:
+                    if ret is not None and ret.matched_count != 1:
                         raise UpdateError(ret)
-                    await self.__coroutined_post_update(ret)
-                else:
-                    ret = None
-            elif conditions:
-                raise NotCreatedError(
-                    'Document must already exist in database to use `conditions`.'
-                )
-            else:
-                await self.__coroutined_pre_insert()
-                self.required_validate()
-                await self.io_validate(validate_all=io_validate_all)
-                payload = self._data.to_mongo(update=False)
-                ret = await self.collection.insert_one(payload, session=SESSION.get())
-                # TODO: check ret ?
-                self._data.set(self.pk_field, ret.inserted_id)
-                self.is_created = True
-                await self.__coroutined_post_insert(ret)
+                    await self._finish_commit(operation, ret)
         except DuplicateKeyError as exc:
-            # Sort value to make testing easier for compound indexes
-            keys = sorted(exc.details['keyPattern'].keys())
-            try:
-                fields = [self.schema.fields[k] for k in keys]
-            except KeyError:
+            error = unique_index_error(type(self), exc.details['keyPattern'])
+            if error is None:
                 # A key in the index is unknwon from umongo
                 raise exc
-            if len(keys) == 1:
-                msg = fields[0].error_messages['unique']
-                raise ma.ValidationError({keys[0]: msg})
-            raise ma.ValidationError({
-                k: f.error_messages['unique_compound'].format(fields=keys)
-                for k, f in zip(keys, fields)
-            })
-        self._data.clear_modified()
+            raise error
+        self.clear_modified()
         return ret
 
     async def delete(self, conditions=None):
@@ -226,20 +394,87 @@ class MotorAsyncIODocument(DocumentImplementation):
 
         :return: Delete result dict returned by underlaying driver.
         """
+        query = await self._prepare_delete(conditions)
+        ret = await self.collection.delete_one(query, session=SESSION.get())
+        if ret.deleted_count != 1:
+            raise DeleteError(ret)
+        await self._finish_delete(ret)
+        return ret
+
+    async def _prepare_commit(self, io_validate_all=False, conditions=None, replace=False):
+        """
+        Run the pre hooks and the validation of a commit.
+
+        :return: The ``(operation, query, payload)`` to write, operation
+            being ``'insert'``, ``'replace'``, ``'update'`` or ``'check'``
+            (the query has to match but there is nothing to write), or None
+            if the document isn't modified.
+        """
+        if self.is_created:
+            if not (self.is_modified() or replace):
+                return None
+            query = conditions or {}
+            query['_id'] = self.pk
+            query.update(self._version_filter())
+            # pre_update can provide additional query filter and/or
+            # modify the fields' values
+            additional_filter = await self.__coroutined_pre_update()
+            if additional_filter:
+                query.update(map_query(additional_filter, self.schema.fields))
+            self.required_validate()
+            await self.io_validate(validate_all=io_validate_all)
+            if replace:
+                return 'replace', query, self._versioned_payload(self.to_mongo())
+            payload = self._versioned_payload(self.to_mongo(update=True), update=True)
+            # No payload if `diff_updates` found no actual change, the
+            # conditions still have to be checked
+            return ('check', query, None) if payload is None else ('update', query, payload)
+        if conditions:
+            raise NotCreatedError(
+                'Document must already exist in database to use `conditions`.'
+            )
+        await self.__coroutined_pre_insert()
+        self.required_validate()
+        await self.io_validate(validate_all=io_validate_all)
+        return 'insert', None, self._versioned_payload(self.to_mongo())
+
+    async def _finish_commit(self, operation, ret, inserted_id=None):
+        """Update the document and run the post hooks once written"""
+        if operation != 'check':
+            self._bump_version()
+        if operation == 'insert':
+            self._data.set(self.pk_field, inserted_id)
+            self.is_created = True
+            await self.__coroutined_post_insert(ret)
+        else:
+            await self.__coroutined_post_update(ret)
+
+    async def _check_commit_conditions(self, query):
+        """
+        Raise :class:`umongo.exceptions.UpdateError` if the query of a commit
+        with nothing to write doesn't match the document.
+        """
+        # Only the `_id` to match if there are no conditions nor version
+        if len(query) > 1 and await self.collection.find_one(
+                query, {'_id': True}, session=SESSION.get()) is None:
+            raise UpdateError(query)
+
+    async def _prepare_delete(self, conditions=None):
+        """Run the pre hook of a delete and return its query"""
         if not self.is_created:
             raise NotCreatedError("Document doesn't exists in database")
         query = conditions or {}
         query['_id'] = self.pk
+        query.update(self._version_filter())
         # pre_delete can provide additional query filter
         additional_filter = await self.__coroutined_pre_delete()
         if additional_filter:
             query.update(map_query(additional_filter, self.schema.fields))
-        ret = await self.collection.delete_one(query, session=SESSION.get())
-        if ret.deleted_count != 1:
-            raise DeleteError(ret)
+        return query
+
+    async def _finish_delete(self, ret):
         self.is_created = False
         await self.__coroutined_post_delete(ret)
-        return ret
 
     async def io_validate(self, validate_all=False):
         """
@@ -265,17 +500,220 @@ class MotorAsyncIODocument(DocumentImplementation):
         return ret
 
     @classmethod
-    def find(cls, filter=None, *args, **kwargs):
+    async def find_one_and_update(cls, filter, update, return_document='after', **kwargs):
+        """
+        Atomically update a single document in database and return it.
+
+        Values are mapped and serialized like with :meth:`update_many`, no
+        hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param update: Update document using update operators (``$set``
+            values are validated and serialized by the fields).
+        :param return_document: ``'after'`` to return the document once
+            updated, ``'before'`` to return it as it was.
+        :return: The document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update_document(cls, update)
+        ret = await cls.collection.find_one_and_update(
+            filter, update, return_document=RETURN_DOCUMENT[return_document],
+            session=SESSION.get(), **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+        return ret
+
+    @classmethod
+    async def find_one_and_delete(cls, filter, **kwargs):
+        """
+        Atomically delete a single document from database and return it.
+
+        No hook is run, the returned document is not created anymore.
+
+        :param filter: Query filter, using the fields' name.
+        :return: The deleted document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        ret = await cls.collection.find_one_and_delete(filter, session=SESSION.get(), **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+            ret.is_created = False
+        return ret
+
+    @classmethod
+    async def modify_with_retry(cls, pk, fn, max_retries=5, backoff=0.01):
+        """
+        Load the document, modify it with `fn` and commit it, starting over
+        with a freshly loaded document if it was modified concurrently.
+
+        Meant to be used with the `version_field` meta option, the commit
+        raising :class:`umongo.exceptions.UpdateError` when the document
+        changed since it was loaded.
+
+        :param pk: Primary key of the document.
+        :param fn: Function (or coroutine function) modifying the document
+            passed as argument.
+        :param max_retries: Number of times to start over before letting the
+            :class:`umongo.exceptions.UpdateError` propagate.
+        :param backoff: Base delay in seconds before starting over, doubled
+            at each retry and randomized.
+        :return: The committed document, None if it doesn't exist.
+        """
+        for attempt in itertools.count():
+            doc = await cls.find_one({'_id': pk})
+            if doc is None:
+                return None
+            ret = fn(doc)
+            if iscoroutine(ret):
+                await ret
+            try:
+                await doc.commit()
+            except UpdateError:
+                if attempt >= max_retries:
+                    raise
+                await asyncio.sleep(retry_delay(backoff, attempt))
+            else:
+                return doc
+
+    @classmethod
+    def find(cls, filter=None, *args, prefetch=False, **kwargs):
         """
         Find a list document in database.
 
         Returns a cursor that provide Documents.
+
+        :param prefetch: Request the next batch of documents in background
+            while the current one is consumed. Batches have `batch_size`
+            documents (default: 1000).
         """
         filter = cook_find_filter(cls, filter)
-        return WrappedCursor(
-            cls,
-            cls.collection.find(filter, session=SESSION.get(), *args, **kwargs)
-        )
+        raw_cursor = cls.collection.find(filter, session=SESSION.get(), *args, **kwargs)
+        if prefetch:
+            return PrefetchWrappedCursor(cls, raw_cursor, kwargs.get('batch_size') or 1000)
+        return WrappedCursor(cls, raw_cursor)
+
+    @classmethod
+    def aggregate(cls, pipeline, *args, hydrate=False, **kwargs):
+        """
+        Run an aggregation pipeline on the document's collection.
+
+        Fields' name are replaced by their name in database in the `$match`,
+        `$sort`, `$project` and `$group` stages and child documents are
+        filtered on their `_cls` field.
+
+        :param pipeline: List of aggregation stages.
+        :param hydrate: If True, return a cursor that provide Documents
+            rather than raw results.
+        """
+        pipeline = cook_aggregate_pipeline(cls, pipeline)
+        raw_cursor = cls.collection.aggregate(pipeline, *args, session=SESSION.get(), **kwargs)
+        if hydrate:
+            return WrappedCommandCursor(cls, raw_cursor)
+        return raw_cursor
+
+    @classmethod
+    async def watch(cls, filter=None, pipeline=None, full_document='updateLookup',
+                    resume_after=None, checkpoint_collection=None, checkpoint_id=None, **kwargs):
+        """
+        Watch the changes of the documents in database.
+
+        Asynchronous generator of :class:`umongo.frameworks.tools.ChangeEvent`.
+
+        :param filter: Filter on the changed documents, using the fields'
+            name. Events without document (e.g. deletions, or updates
+            without `full_document`) don't match a filter.
+        :param pipeline: Additional stages on the change events, the paths
+            of the changed document (``fullDocument.<field>``) using the
+            fields' name.
+        :param full_document: ``'updateLookup'`` to retrieve the document of
+            the update events, None to only get their update description.
+        :param resume_after: Resume token of the event to start after.
+        :param checkpoint_collection: Name of a collection where the resume
+            token of the last processed event is saved (an event being
+            processed once the next one is requested), the stream resuming
+            after it when no `resume_after` is given.
+        :param checkpoint_id: Id of the saved resume token (by default, the
+            name of the document's collection).
+
+        Other arguments are passed to the driver's ``watch``.
+        """
+        pipeline = cook_watch_pipeline(cls, filter, pipeline)
+        checkpoints = None
+        if checkpoint_collection:
+            checkpoints = cls.opts.instance.db[checkpoint_collection]
+            checkpoint_id = checkpoint_id or cls.collection_name
+            if resume_after is None:
+                checkpoint = await checkpoints.find_one({'_id': checkpoint_id})
+                if checkpoint is not None:
+                    resume_after = checkpoint['resume_token']
+        stream = cls.collection.watch(
+            pipeline, full_document=full_document, resume_after=resume_after,
+            session=SESSION.get(), **kwargs)
+        async with stream:
+            async for change in stream:
+                yield build_change_event(cls, change)
+                # Back here once the event has been processed
+                if checkpoints is not None:
+                    await checkpoints.replace_one(
+                        {'_id': checkpoint_id}, {'resume_token': change['_id']}, upsert=True)
+
+    @classmethod
+    async def scan(cls, filter=None, partitions=4, batch_size=1000, raw=False):
+        """
+        Scan the documents matching the filter with concurrent cursors.
+
+        The documents are split in `partitions` ranges of `_id` (computed
+        from a `$sample` of the ids), each range is read by its own task.
+        The `_id` of the documents must be of the same type. The cursors use
+        the current session, if any.
+
+        :param filter: Query filter, using the fields' name.
+        :param partitions: Number of concurrent cursors.
+        :param batch_size: Maximum number of documents per batch.
+        :param raw: Provide the documents as returned by the driver rather
+            than Documents.
+        :return: An asynchronous generator of lists of documents (one per
+            batch, in no particular order).
+        """
+        session = SESSION.get()
+        filter = cook_find_filter(cls, filter or {})
+        if partitions > 1:
+            samples = await cls.collection.aggregate(
+                scan_sample_pipeline(filter, partitions), session=session).to_list(None)
+            filters = cook_scan_filters(filter, samples, partitions)
+        else:
+            filters = [filter]
+        batches = asyncio.Queue(maxsize=len(filters) * 2)
+
+        async def scan_partition(partition_filter):
+            try:
+                raw_cursor = cls.collection.find(
+                    partition_filter, batch_size=batch_size, session=session)
+                while True:
+                    batch = await raw_cursor.to_list(batch_size)
+                    if not batch:
+                        break
+                    if not raw:
+                        batch = [cls.build_from_mongo(elem, use_cls=True) for elem in batch]
+                    await batches.put(batch)
+            except Exception as exc:
+                await batches.put(exc)
+            await batches.put(None)
+
+        tasks = [asyncio.ensure_future(scan_partition(f)) for f in filters]
+        done = 0
+        try:
+            while done < len(tasks):
+                batch = await batches.get()
+                if batch is None:
+                    done += 1
+                elif isinstance(batch, Exception):
+                    raise batch
+                else:
+                    yield batch
+        finally:
+            for task in tasks:
+                task.cancel()
 
     @classmethod
     async def count_documents(cls, filter=None, *, with_limit_and_skip=False, **kwargs):
@@ -286,10 +724,153 @@ class MotorAsyncIODocument(DocumentImplementation):
         return await cls.collection.count_documents(filter, session=SESSION.get(), **kwargs)
 
     @classmethod
-    async def ensure_indexes(cls):
+    async def insert_many(cls, documents, batch_size=1000, validate='schema', ordered=True):
+        """
+        Insert documents in database by batches without building document
+        instances, hooks and `io_validate` are not run.
+
+        Each batch is loaded at once by the document's schema and serialized
+        with a serializer specialized for the schema.
+
+        :param documents: Iterable (e.g. generator) of dicts using the
+            fields' name, consumed one batch at a time.
+        :param batch_size: Number of documents inserted per request.
+        :param validate: ``'schema'`` to deserialize and validate the values
+            and check the required fields, ``'required'`` to only check the
+            required fields of already deserialized values, ``'none'`` to
+            skip validation.
+        :param ordered: Stop at the first error (and insert the documents
+            in order) if True, otherwise insert all the documents possible.
+        :return: List of the inserted documents' ids.
+        """
+        inserted_ids = []
+        for payload in cook_insert_many_batches(cls, documents, batch_size, validate):
+            ret = await cls.collection.insert_many(
+                payload, ordered=ordered, session=SESSION.get())
+            inserted_ids.extend(ret.inserted_ids)
+        return inserted_ids
+
+    @classmethod
+    async def update_many(cls, filter, set=None, unset=None, **kwargs):
+        """
+        Update all the documents matching the filter in database.
+
+        Values are validated and serialized as with a document's fields,
+        documents are not loaded and no hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param set: Dict of fields' values to set.
+        :param unset: List of fields' name to unset.
+        :return: Update result returned by underlaying driver.
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update(cls, set=set, unset=unset)
+        return await cls.collection.update_many(
+            filter, update, session=SESSION.get(), **kwargs)
+
+    @classmethod
+    async def delete_many(cls, filter, hooks=False, batch_size=1000):
+        """
+        Delete all the documents matching the filter in database.
+
+        :param filter: Query filter, using the fields' name.
+        :param hooks: Load the documents to run their `pre_delete` and
+            `post_delete` hooks. Documents are deleted by batches, each
+            document's `post_delete` receives the result of its batch.
+        :param batch_size: Number of documents per batch when `hooks` is set.
+        :return: Delete result returned by underlaying driver, or a list of
+            the results of each batch if `hooks` is set.
+        """
+        filter = cook_find_filter(cls, filter)
+        if not hooks:
+            return await cls.collection.delete_many(filter, session=SESSION.get())
+        rets = []
+
+        async def delete_batch(docs):
+            additional_filters = [await doc.__coroutined_pre_delete() for doc in docs]
+            query = cook_batch_delete_filter(cls, filter, docs, additional_filters)
+            ret = await cls.collection.delete_many(query, session=SESSION.get())
+            for doc in docs:
+                doc.is_created = False
+                await doc.__coroutined_post_delete(ret)
+            rets.append(ret)
+
+        docs = []
+        raw_cursor = cls.collection.find(filter, batch_size=batch_size, session=SESSION.get())
+        async for raw_doc in raw_cursor:
+            docs.append(cls.build_from_mongo(raw_doc, use_cls=True))
+            if len(docs) == batch_size:
+                await delete_batch(docs)
+                docs = []
+        if docs:
+            await delete_batch(docs)
+        return rets
+
+    @classmethod
+    async def migrate_schema(cls, filter=None, batch_size=1000, progress=None):
+        """
+        Upgrade the documents stored with an older schema version in
+        database, without loading them as documents.
+
+        Documents are read and replaced by batches. The ones whose version
+        changed since they were read (e.g. upgraded on read then committed)
+        are left untouched.
+
+        :param filter: Query filter, using the fields' name, restricting
+            the documents to upgrade.
+        :param batch_size: Number of documents read and written at once.
+        :param progress: Function called after each batch with the current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A :class:`umongo.frameworks.tools.MigrationStats`
+        """
+        start = time.perf_counter()
+        scanned = modified = 0
+        raw_cursor = cls.collection.find(
+            cook_schema_upgrade_filter(cls, filter), batch_size=batch_size, session=SESSION.get())
+        while True:
+            batch = await raw_cursor.to_list(batch_size)
+            if not batch:
+                break
+            ret = await cls.collection.bulk_write(
+                [ReplaceOne(query, data) for query, data in upgrade_documents(cls, batch)],
+                ordered=False, session=SESSION.get())
+            scanned += len(batch)
+            modified += ret.modified_count
+            if progress:
+                progress(MigrationStats(scanned, modified, time.perf_counter() - start))
+        return MigrationStats(scanned, modified, time.perf_counter() - start)
+
+    @classmethod
+    async def ensure_indexes(cls, diff=False, drop_stale=False, siblings=None):
         """
         Check&create if needed the Document's indexes in database
+
+        :param diff: Retrieve the existing indexes first and only create the
+            missing ones (in a single batch). The indexes of the database
+            with the key of a document's index but other options are
+            reported as conflicting and left as they are.
+        :param drop_stale: Drop the indexes that are not defined by any
+            document stored in the collection, and recreate the conflicting
+            ones. Implies `diff`.
+        :param siblings: Documents stored in the collection, as grouped by
+            :func:`umongo.frameworks.tools.documents_by_collection`
+            (computed if not given).
+        :return: A :class:`umongo.frameworks.tools.IndexesDiff` if `diff`
+            or `drop_stale` is set, None otherwise.
         """
+        if diff or drop_stale:
+            ret = diff_indexes(
+                cls, await cls.collection.index_information(session=SESSION.get()), siblings)
+            to_create = ret.missing
+            if drop_stale:
+                for name in ret.stale:
+                    await cls.collection.drop_index(name, session=SESSION.get())
+                for name, _index in ret.conflicting:
+                    await cls.collection.drop_index(name, session=SESSION.get())
+                to_create = to_create + [index for _name, index in ret.conflicting]
+            if to_create:
+                await cls.collection.create_indexes(to_create, session=SESSION.get())
+            return ret
         for index in cls.indexes:
             kwargs = index.document.copy()
             keys = kwargs.pop('key').items()
@@ -338,6 +919,33 @@ async def _io_validate_data_proxy(schema, data_proxy, partial=None):
         raise ma.ValidationError(errors)
 
 
+def _io_validate_concurrency(field):
+    if field.io_validate_concurrency is not None:
+        return field.io_validate_concurrency
+    return getattr(field.instance, 'io_validate_concurrency', None)
+
+
+async def _gather_bounded(tasks, concurrency):
+    """
+    Same as ``asyncio.gather(*tasks, return_exceptions=True)`` but keep at
+    most `concurrency` tasks in flight at once.
+
+    `tasks` is consumed lazily: a coroutine is only scheduled once a slot
+    is released by a previous one, so large containers never flood the
+    connection pool. A falsy `concurrency` means no limit.
+    """
+    if not concurrency:
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    futures = []
+    for task in tasks:
+        await semaphore.acquire()
+        future = asyncio.ensure_future(task)
+        future.add_done_callback(lambda _: semaphore.release())
+        futures.append(future)
+    return await asyncio.gather(*futures, return_exceptions=True)
+
+
 async def _reference_io_validate(field, value):
     if value is None:
         return
@@ -350,8 +958,8 @@ async def _list_io_validate(field, value):
     validators = field.inner.io_validate
     if not validators:
         return
-    tasks = [_run_validators(validators, field.inner, e) for e in value]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    tasks = (_run_validators(validators, field.inner, e) for e in value)
+    results = await _gather_bounded(tasks, _io_validate_concurrency(field))
     errors = {}
     for i, res in enumerate(results):
         if isinstance(res, ma.ValidationError):
@@ -368,10 +976,8 @@ async def _dict_io_validate(field, value):
     validators = field.value_field.io_validate
     if not validators:
         return
-    tasks = []
-    for key, val in value.items():
-        tasks.append(_run_validators(validators, field.value_field, val))
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    tasks = (_run_validators(validators, field.value_field, val) for val in value.values())
+    results = await _gather_bounded(tasks, _io_validate_concurrency(field))
     errors = collections.defaultdict(dict)
     for key, res in zip(value.keys(), results):
         if isinstance(res, ma.ValidationError):
@@ -435,16 +1041,156 @@ class MotorAsyncIOBuilder(BaseBuilder):
             field.io_validate_recursive = _embedded_document_io_validate
 
 
+class MotorAsyncIOTransaction:
+    """
+    Documents' writes committed together in a transaction, see
+    :meth:`MotorAsyncIOInstance.transaction`.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._writes = []
+
+    def commit(self, doc, io_validate_all=False, conditions=None, replace=False):
+        """
+        Commit the document with the transaction.
+
+        See :meth:`MotorAsyncIODocument.commit` for the parameters.
+        """
+        self._writes.append((doc, 'commit', (io_validate_all, conditions, replace)))
+
+    def delete(self, doc, conditions=None):
+        """
+        Delete the document with the transaction.
+
+        See :meth:`MotorAsyncIODocument.delete` for the parameters.
+        """
+        self._writes.append((doc, 'delete', (conditions, )))
+
+    async def _find_one(self, collection, query):
+        return await collection.find_one(query, {'_id': True}, session=self.session)
+
+    async def _bulk_write(self, collection, requests):
+        return await collection.bulk_write(requests, session=self.session)
+
+    async def _run(self, max_retries, backoff, options):
+        writes = []
+        for doc, operation, args in self._writes:
+            if operation == 'delete':
+                writes.append((doc, 'delete', await doc._prepare_delete(*args), None))
+            else:
+                prepared = await doc._prepare_commit(*args)
+                if prepared is not None:
+                    writes.append((doc, *prepared))
+        checks = [write for write in writes if write[1] == 'check']
+        bulks = cook_transaction_writes([write for write in writes if write[1] != 'check'])
+        if not bulks and not checks:
+            return
+
+        async def write():
+            for doc, _, query, _ in checks:
+                if len(query) > 1 and await self._find_one(doc.collection, query) is None:
+                    raise UpdateError(query)
+            results = []
+            for collection, requests, bulk_writes in bulks:
+                try:
+                    ret = await self._bulk_write(collection, requests)
+                except BulkWriteError as exc:
+                    error = bulk_write_unique_error(exc, bulk_writes)
+                    if error is None:
+                        raise
+                    raise error
+                check_transaction_result(ret, bulk_writes)
+                results.append(ret)
+            return results
+
+        results = await _run_transaction(self.session, write, max_retries, backoff, options)
+        for doc, operation, _, _ in checks:
+            await doc._finish_commit(operation, None)
+            doc.clear_modified()
+        for (_, _, bulk_writes), ret in zip(bulks, results):
+            for doc, operation, _, payload in bulk_writes:
+                if operation == 'delete':
+                    await doc._finish_delete(ret)
+                else:
+                    await doc._finish_commit(
+                        operation, ret, payload['_id'] if operation == 'insert' else None)
+                    doc.clear_modified()
+
+
+async def _run_transaction(session, write, max_retries, backoff, options):
+    """
+    Run `write` in a transaction, retrying on transient errors, and return
+    its result once committed.
+    """
+    committing = False
+    for attempt in itertools.count():
+        if attempt:
+            await asyncio.sleep(retry_delay(backoff, attempt - 1))
+        if not committing:
+            session.start_transaction(**options)
+            try:
+                ret = await write()
+            except Exception as exc:
+                await session.abort_transaction()
+                if attempt < max_retries and has_error_label(exc, 'TransientTransactionError'):
+                    continue
+                raise
+        try:
+            await session.commit_transaction()
+            return ret
+        except Exception as exc:
+            # Commit again if its result is unknown, start over if transient
+            committing = has_error_label(exc, 'UnknownTransactionCommitResult')
+            if attempt >= max_retries or not (
+                    committing or has_error_label(exc, 'TransientTransactionError')):
+                raise
+
+
 class MotorAsyncIOInstance(Instance):
     """
     :class:`umongo.instance.Instance` implementation for motor-asyncio
     """
     BUILDER_CLS = MotorAsyncIOBuilder
 
+    #: Default maximum number of items of a list or dict field validated
+    #: concurrently by ``io_validate`` (matches motor's default ``maxPoolSize``).
+    #: Can be overridden per field with ``io_validate_concurrency`` argument.
+    io_validate_concurrency = 100
+
+    def __init__(self, *args, io_validate_concurrency=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if io_validate_concurrency is not None:
+            self.io_validate_concurrency = io_validate_concurrency
+
     @staticmethod
     def is_compatible_with(db):
         return isinstance(db, AsyncIOMotorDatabase)
 
+    async def ensure_all_indexes(self, diff=False, drop_stale=False):
+        """
+        Check&create if needed the indexes of all registered documents
+
+        Collections are processed concurrently, documents sharing a
+        collection are processed one after another.
+        See :meth:`MotorAsyncIODocument.ensure_indexes` for the parameters.
+
+        :return: A dict of ``ensure_indexes`` results by document name
+        """
+        async def ensure_collection_indexes(docs):
+            return [
+                (doc_cls.__name__,
+                 await doc_cls.ensure_indexes(
+                     diff=diff, drop_stale=drop_stale, siblings=docs))
+                for doc_cls in docs
+            ]
+
+        results = await asyncio.gather(*(
+            ensure_collection_indexes(docs)
+            for docs in documents_by_collection(self).values()
+        ))
+        return dict(ret for rets in results for ret in rets)
+
     @asynccontextmanager
     async def session(self):
         async with await self.db.client.start_session() as session:
@@ -454,27 +1200,135 @@ class MotorAsyncIOInstance(Instance):
             finally:
                 SESSION.reset(token)
 
+    @asynccontextmanager
+    async def transaction(self, session=None, max_retries=5, backoff=0.01, **kwargs):
+        """
+        Asynchronous context manager writing documents together in a
+        transaction.
+
+        The documents' commits and deletes queued with the yielded
+        :class:`MotorAsyncIOTransaction` are written on exit, with a bulk
+        write per collection in a single transaction. Nothing is written if
+        an exception is raised within the context. The session is bound to
+        the context.
+
+        The transaction is started over on ``TransientTransactionError`` and
+        its commit retried on ``UnknownTransactionCommitResult``, hooks and
+        validation only running once before the first attempt.
+
+        Unlike the driver's ``with_transaction``, the context's body is not
+        run again on retry: the writes are sent again as prepared, and the
+        reads within the context are not part of the transaction. Use
+        ``conditions`` or the ``version_field`` option to make the writes
+        fail if the documents were modified since they were read. A
+        duplicate key makes the transaction raise the same
+        :class:`marshmallow.ValidationError` as ``commit``.
+
+        :param session: Session to use, a new one is started by default.
+        :param max_retries: Number of retries before letting the error
+            propagate.
+        :param backoff: Base delay in seconds before retrying, doubled at
+            each retry and randomized.
+
+        Other arguments are passed to ``session.start_transaction``.
+        """
+        async with AsyncExitStack() as stack:
+            if session is None:
+                session = await stack.enter_async_context(self.session())
+            else:
+                stack.callback(SESSION.reset, SESSION.set(session))
+            transaction = MotorAsyncIOTransaction(session)
+            yield transaction
+            await transaction._run(max_retries, backoff, kwargs)
+
 
 class MotorAsyncIOMigrationInstance(MotorAsyncIOInstance):
     """AsyncIO instance with migration features"""
 
-    async def migrate_2_to_3(self):
+    async def migrate_2_to_3(self, partitions=4, batch_size=1000, checkpoint_collection=None,
+                             progress=None):
         """Migrate database from umongo 2 to umongo 3
 
         - EmbeddedDocument _cls field is only set if child of concrete embedded document
+
+        Each collection is read by concurrent cursors on ranges of `_id` and
+        the modified documents are written by batches.
+
+        :param partitions: Number of concurrent cursors reading each collection.
+        :param batch_size: Number of documents read and written at once.
+        :param checkpoint_collection: Name of a collection where the progress
+            is saved after each batch. If the migration is interrupted,
+            running it again resumes it where it stopped.
+        :param progress: Function called after each batch with the
+            collection's name and its current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A dict of :class:`umongo.frameworks.tools.MigrationStats`
+            by collection name.
         """
         concrete_not_children = [
             name for name, ed in self._embedded_lookup.items()
             if not ed.opts.is_child and not ed.opts.abstract
         ]
+        checkpoints = self.db[checkpoint_collection] if checkpoint_collection else None
 
+        stats = {}
         for doc_cls in self._doc_lookup.values():
             if doc_cls.opts.abstract:
                 continue
             if doc_cls.opts.is_child:
                 continue
-            async for doc in doc_cls.collection.find():
-                doc = remove_cls_field_from_embedded_docs(doc, concrete_not_children)
-                ret = await doc_cls.collection.replace_one({"_id": doc["_id"]}, doc)
-                if ret.matched_count != 1:
+            stats[doc_cls.collection_name] = await _migrate_2_to_3_collection(
+                doc_cls.collection, concrete_not_children,
+                partitions, batch_size, checkpoints, progress)
+        return stats
+
+
+async def _migrate_2_to_3_collection(
+        collection, concrete_not_children, partitions, batch_size, checkpoints, progress):
+    start = time.perf_counter()
+    checkpoint = None
+    if checkpoints is not None:
+        checkpoint = await checkpoints.find_one({'_id': collection.name})
+    if checkpoint is None:
+        samples = []
+        if partitions > 1:
+            samples = await collection.aggregate(
+                scan_sample_pipeline({}, partitions)).to_list(None)
+        checkpoint = migration_checkpoint(collection.name, scan_bounds(samples, partitions))
+        if checkpoints is not None:
+            await checkpoints.insert_one(checkpoint)
+    elif checkpoint['done']:
+        return MigrationStats(0, 0, 0.0)
+    counters = {'scanned': 0, 'modified': 0}
+
+    async def migrate_partition(index, lower, upper, last):
+        raw_cursor = collection.find(
+            cook_range_filter({}, lower, upper, last), sort=[('_id', 1)], batch_size=batch_size)
+        while True:
+            batch = await raw_cursor.to_list(batch_size)
+            if not batch:
+                break
+            modified = migrate_2_to_3_documents(batch, concrete_not_children)
+            if modified:
+                ret = await collection.bulk_write(
+                    [ReplaceOne({'_id': doc['_id']}, doc) for doc in modified], ordered=False)
+                if ret.matched_count != len(modified):
                     raise UpdateError(ret)
+            if checkpoints is not None:
+                await checkpoints.update_one(
+                    {'_id': collection.name},
+                    {'$set': {'partitions.%s.2' % index: batch[-1]['_id']}})
+            counters['scanned'] += len(batch)
+            counters['modified'] += len(modified)
+            if progress:
+                progress(collection.name, MigrationStats(
+                    counters['scanned'], counters['modified'], time.perf_counter() - start))
+
+    await asyncio.gather(*(
+        migrate_partition(index, *partition)
+        for index, partition in enumerate(checkpoint['partitions'])
+    ))
+    if checkpoints is not None:
+        await checkpoints.update_one({'_id': collection.name}, {'$set': {'done': True}})
+    return MigrationStats(
+        counters['scanned'], counters['modified'], time.perf_counter() - start)
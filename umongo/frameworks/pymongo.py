@@ -1,10 +1,22 @@
 import collections
+import itertools
+import operator
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from contextvars import ContextVar
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from pymongo.database import Database
 from pymongo.cursor import Cursor
-from pymongo.errors import DuplicateKeyError
+from pymongo.command_cursor import CommandCursor
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import ReplaceOne
 import marshmallow as ma
 
 from ..builder import BaseBuilder
@@ -15,7 +27,14 @@ from ..exceptions import NotCreatedError, UpdateError, DeleteError, NoneReferenc
 from ..fields import ReferenceField, ListField, DictField, EmbeddedField
 from ..query_mapper import map_query
 
-from .tools import cook_find_filter, remove_cls_field_from_embedded_docs
+from .tools import (
+    cook_find_filter, cook_aggregate_pipeline, cook_update, cook_batch_delete_filter,
+    cook_insert_many_batches, cook_scan_filters, cook_range_filter, scan_sample_pipeline,
+    scan_bounds, diff_indexes, documents_by_collection, migrate_2_to_3_documents,
+    migration_checkpoint, MigrationStats, cook_schema_upgrade_filter, upgrade_documents,
+    retry_delay, cook_update_document, RETURN_DOCUMENT, cook_watch_pipeline,
+    build_change_event, has_error_label, cook_transaction_writes, check_transaction_result,
+    unique_index_error, bulk_write_unique_error)
 
 
 SESSION = ContextVar("session", default=None)
@@ -56,32 +75,146 @@ class BaseWrappedCursor:
         for elem in self.raw_cursor:
             yield self.document_cls.build_from_mongo(elem, use_cls=True)
 
+    def parallel_map(self, func, workers=None, ordered=True, chunk_size=1000, mp_context=None):
+        """
+        Hydrate the cursor's documents and apply `func` to them in a pool of
+        processes.
+
+        The raw documents are encoded again to BSON and sent to the workers
+        by chunks. :meth:`PyMongoDocument.parallel_map` runs a query sending
+        the documents' BSON as returned by the server instead.
+        The document class and `func` must be picklable (i.e. defined at
+        module level) unless processes are forked: with the `spawn` start
+        method, workers re-register the templates by importing their module.
+
+        :param func: Function called with each document, its result is
+            returned to the parent process.
+        :param workers: Number of processes, defaults to the number of CPUs.
+        :param ordered: If False, provide the results as soon as their chunk
+            is processed rather than in the cursor's order.
+        :param chunk_size: Number of documents sent to a worker at once.
+        :param mp_context: Multiprocessing context of the pool.
+        :return: A generator of the results of `func`.
+        """
+        workers = _check_parallel_map_args(func, workers, chunk_size)
+        return _parallel_map(
+            self.document_cls, self.raw_cursor, bson.BSON.encode, func, workers, ordered,
+            chunk_size, mp_context)
+
 
 class WrappedCursor(BaseWrappedCursor, Cursor):
     __slots__ = ()
 
 
+class WrappedCommandCursor(BaseWrappedCursor, CommandCursor):
+    __slots__ = ()
+
+
+# Document class and function used by parallel_map's worker processes
+_PARALLEL_MAP_WORKER = None
+
+
+def _init_parallel_map_worker(document_cls, func, codec_options):
+    global _PARALLEL_MAP_WORKER
+    _PARALLEL_MAP_WORKER = (document_cls, func, codec_options)
+
+
+def _parallel_map_chunk(chunk):
+    document_cls, func, codec_options = _PARALLEL_MAP_WORKER
+    return [
+        func(document_cls.build_from_mongo(elem, use_cls=True))
+        for elem in bson.decode_all(chunk, codec_options)
+    ]
+
+
+def _check_parallel_map_args(func, workers, chunk_size):
+    """Check the arguments of a parallel map and return the number of workers"""
+    if not callable(func):
+        raise TypeError('func must be callable')
+    workers = workers or os.cpu_count() or 1
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError('workers must be a positive integer')
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError('chunk_size must be a positive integer')
+    return workers
+
+
+def _parallel_map(document_cls, raw_cursor, encode, func, workers, ordered, chunk_size,
+                  mp_context, close=False):
+    """
+    Generator of the results of `func` applied to the documents of
+    `raw_cursor` in a pool of processes, the documents being sent as BSON
+    (given by `encode`) by chunks. The cursor is closed at the end if `close`.
+    """
+    options = document_cls.collection.codec_options
+    # Documents are decoded as dicts in the workers, keep the options
+    # related to the values
+    codec_options = CodecOptions(
+        tz_aware=options.tz_aware, tzinfo=options.tzinfo,
+        uuid_representation=options.uuid_representation)
+    chunks = (
+        b''.join(encode(elem) for elem in chunk)
+        for chunk in iter(lambda: list(itertools.islice(raw_cursor, chunk_size)), [])
+    )
+    executor = ProcessPoolExecutor(
+        workers, mp_context=mp_context, initializer=_init_parallel_map_worker,
+        initargs=(document_cls, func, codec_options))
+    # Bound the number of chunks waiting in memory
+    pending = collections.deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_parallel_map_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from _pop_parallel_map_results(pending, ordered)
+        while pending:
+            yield from _pop_parallel_map_results(pending, ordered)
+    finally:
+        # Don't process the remaining chunks if the generator is closed
+        # early or a chunk failed
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if close:
+            raw_cursor.close()
+
+
+def _pop_parallel_map_results(pending, ordered):
+    if ordered:
+        future = pending.popleft()
+    else:
+        future = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+        pending.remove(future)
+    return future.result()
+
+
 class PyMongoDocument(DocumentImplementation):
 
     __slots__ = ()
     cursor_cls = WrappedCursor  # Easier to customize this for mongomock this way
+    command_cursor_cls = WrappedCommandCursor
 
     opts = DocumentImplementation.opts
 
-    def reload(self):
+    def reload(self, fields=None):
         """
         Retrieve and replace document's data by the ones in database.
 
+        :param fields: Names of the fields to reload (using a projection),
+            the other fields are left untouched and keep their modified state.
+            By default, the whole document is reloaded.
+
         Raises :class:`umongo.exceptions.NotCreatedError` if the document
         doesn't exist in database.
         """
         if not self.is_created:
             raise NotCreatedError("Document doesn't exists in database")
-        ret = self.collection.find_one(self.pk, session=SESSION.get())
+        ret = self.collection.find_one(
+            self.pk, projection=self._reload_projection(fields), session=SESSION.get())
         if ret is None:
             raise NotCreatedError("Document doesn't exists in database")
-        self._data = self.DataProxy()
-        self._data.from_mongo(ret)
+        if fields is None:
+            self._data = self.DataProxy()
+        self.from_mongo(ret, fields=fields)
 
     def commit(self, io_validate_all=False, conditions=None, replace=False):
         """
@@ -99,58 +232,31 @@ class PyMongoDocument(DocumentImplementation):
             :class:`pymongo.results.InsertOneResult` depending of the operation.
         """
         try:
-            if self.is_created:
-                if self.is_modified() or replace:
-                    query = conditions or {}
-                    query['_id'] = self.pk
-                    # pre_update can provide additional query filter and/or
-                    # modify the fields' values
-                    additional_filter = self.pre_update()
-                    if additional_filter:
-                        query.update(map_query(additional_filter, self.schema.fields))
-                    self.required_validate()
-                    self.io_validate(validate_all=io_validate_all)
-                    if replace:
-                        payload = self._data.to_mongo(update=False)
+            operation = self._prepare_commit(io_validate_all, conditions, replace)
+            ret = None
+            if operation is not None:
+                operation, query, payload = operation
+                if operation == 'insert':
+                    ret = self.collection.insert_one(payload, session=SESSION.get())
+                    # TODO: check ret ?
+                    self._finish_commit(operation, ret, ret.inserted_id, payload)
+                else:
+                    if operation == 'check':
+                        self._check_commit_conditions(query)
+                    elif operation == 'replace':
                         ret = self.collection.replace_one(query, payload, session=SESSION.get())
                     else:
-                        payload = self._data.to_mongo(update=True)
                         ret = self.collection.update_one(query, payload, session=SESSION.get())
-                    if ret.matched_count != 1:
+                    if ret is not None and ret.matched_count != 1:
                         raise UpdateError(ret)
-                    self.post_update(ret)
-                else:
-                    ret = None
-            elif conditions:
-                raise NotCreatedError(
-                    'Document must already exist in database to use `conditions`.'
-                )
-            else:
-                self.pre_insert()
-                self.required_validate()
-                self.io_validate(validate_all=io_validate_all)
-                payload = self._data.to_mongo(update=False)
-                ret = self.collection.insert_one(payload, session=SESSION.get())
-                # TODO: check ret ?
-                self._data.set(self.pk_field, ret.inserted_id)
-                self.is_created = True
-                self.post_insert(ret)
+                    self._finish_commit(operation, ret, payload=payload)
         except DuplicateKeyError as exc:
-            # Sort value to make testing easier for compound indexes
-            keys = sorted(exc.details['keyPattern'].keys())
-            try:
-                fields = [self.schema.fields[k] for k in keys]
-            except KeyError:
+            error = unique_index_error(type(self), exc.details['keyPattern'])
+            if error is None:
                 # A key in the index is unknwon from umongo
                 raise exc
-            if len(keys) == 1:
-                msg = fields[0].error_messages['unique']
-                raise ma.ValidationError({keys[0]: msg})
-            raise ma.ValidationError({
-                k: f.error_messages['unique_compound'].format(fields=keys)
-                for k, f in zip(keys, fields)
-            })
-        self._data.clear_modified()
+            raise error
+        self.clear_modified()
         return ret
 
     def delete(self, conditions=None):
@@ -168,20 +274,91 @@ class PyMongoDocument(DocumentImplementation):
 
         :return: A :class:`pymongo.results.DeleteResult`
         """
+        query = self._prepare_delete(conditions)
+        ret = self.collection.delete_one(query, session=SESSION.get())
+        if ret.deleted_count != 1:
+            raise DeleteError(ret)
+        self._finish_delete(ret)
+        return ret
+
+    def _prepare_commit(self, io_validate_all=False, conditions=None, replace=False):
+        """
+        Run the pre hooks and the validation of a commit.
+
+        :return: The ``(operation, query, payload)`` to write, operation
+            being ``'insert'``, ``'replace'``, ``'update'`` or ``'check'``
+            (the query has to match but there is nothing to write), or None
+            if the document isn't modified.
+        """
+        if self.is_created:
+            if not (self.is_modified() or replace):
+                return None
+            query = conditions or {}
+            query['_id'] = self.pk
+            query.update(self._version_filter())
+            # pre_update can provide additional query filter and/or
+            # modify the fields' values
+            additional_filter = self.pre_update()
+            if additional_filter:
+                query.update(map_query(additional_filter, self.schema.fields))
+            self.required_validate()
+            self.io_validate(validate_all=io_validate_all)
+            if replace:
+                return 'replace', query, self._versioned_payload(self.to_mongo())
+            payload = self._versioned_payload(self.to_mongo(update=True), update=True)
+            # No payload if `diff_updates` found no actual change, the
+            # conditions still have to be checked
+            return ('check', query, None) if payload is None else ('update', query, payload)
+        if conditions:
+            raise NotCreatedError(
+                'Document must already exist in database to use `conditions`.'
+            )
+        self.pre_insert()
+        self.required_validate()
+        self.io_validate(validate_all=io_validate_all)
+        return 'insert', None, self._versioned_payload(self.to_mongo())
+
+    def _finish_commit(self, operation, ret, inserted_id=None, payload=None):
+        """
+        Update the document and run the post hooks once written.
+
+        :param payload: The payload written, None for a ``'check'``.
+        """
+        if operation != 'check':
+            self._bump_version()
+        if operation == 'insert':
+            self._data.set(self.pk_field, inserted_id)
+            self.is_created = True
+            self.post_insert(ret)
+        else:
+            self.post_update(ret)
+
+    def _check_commit_conditions(self, query):
+        """
+        Raise :class:`umongo.exceptions.UpdateError` if the query of a commit
+        with nothing to write doesn't match the document.
+        """
+        # Only the `_id` to match if there are no conditions nor version
+        if len(query) > 1 and self.collection.find_one(
+                query, {'_id': True}, session=SESSION.get()) is None:
+            raise UpdateError(query)
+
+    def _prepare_delete(self, conditions=None):
+        """Run the pre hook of a delete and return its query"""
         if not self.is_created:
             raise NotCreatedError("Document doesn't exists in database")
         query = conditions or {}
         query['_id'] = self.pk
+        query.update(self._version_filter())
         # pre_delete can provide additional query filter
         additional_filter = self.pre_delete()
         if additional_filter:
             query.update(map_query(additional_filter, self.schema.fields))
-        ret = self.collection.delete_one(query, session=SESSION.get())
-        if ret.deleted_count != 1:
-            raise DeleteError(ret)
+        return query
+
+    def _finish_delete(self, ret):
         self.is_created = False
         self.post_delete(ret)
-        return ret
 
     def io_validate(self, validate_all=False):
         """
@@ -207,6 +384,79 @@ class PyMongoDocument(DocumentImplementation):
             ret = cls.build_from_mongo(ret, use_cls=True)
         return ret
 
+    @classmethod
+    def find_one_and_update(cls, filter, update, return_document='after', **kwargs):
+        """
+        Atomically update a single document in database and return it.
+
+        Values are mapped and serialized like with :meth:`update_many`, no
+        hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param update: Update document using update operators (``$set``
+            values are validated and serialized by the fields).
+        :param return_document: ``'after'`` to return the document once
+            updated, ``'before'`` to return it as it was.
+        :return: The document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update_document(cls, update)
+        ret = cls.collection.find_one_and_update(
+            filter, update, return_document=RETURN_DOCUMENT[return_document],
+            session=SESSION.get(), **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+        return ret
+
+    @classmethod
+    def find_one_and_delete(cls, filter, **kwargs):
+        """
+        Atomically delete a single document from database and return it.
+
+        No hook is run, the returned document is not created anymore.
+
+        :param filter: Query filter, using the fields' name.
+        :return: The deleted document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        ret = cls.collection.find_one_and_delete(filter, session=SESSION.get(), **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+            ret.is_created = False
+        return ret
+
+    @classmethod
+    def modify_with_retry(cls, pk, fn, max_retries=5, backoff=0.01):
+        """
+        Load the document, modify it with `fn` and commit it, starting over
+        with a freshly loaded document if it was modified concurrently.
+
+        Meant to be used with the `version_field` meta option, the commit
+        raising :class:`umongo.exceptions.UpdateError` when the document
+        changed since it was loaded.
+
+        :param pk: Primary key of the document.
+        :param fn: Function modifying the document passed as argument.
+        :param max_retries: Number of times to start over before letting the
+            :class:`umongo.exceptions.UpdateError` propagate.
+        :param backoff: Base delay in seconds before starting over, doubled
+            at each retry and randomized.
+        :return: The committed document, None if it doesn't exist.
+        """
+        for attempt in itertools.count():
+            doc = cls.find_one({'_id': pk})
+            if doc is None:
+                return None
+            fn(doc)
+            try:
+                doc.commit()
+            except UpdateError:
+                if attempt >= max_retries:
+                    raise
+                time.sleep(retry_delay(backoff, attempt))
+            else:
+                return doc
+
     @classmethod
     def find(cls, filter=None, *args, **kwargs):
         """
@@ -218,6 +468,201 @@ class PyMongoDocument(DocumentImplementation):
         raw_cursor = cls.collection.find(filter, session=SESSION.get(), *args, **kwargs)
         return cls.cursor_cls(cls, raw_cursor)
 
+    @classmethod
+    def parallel_map(cls, func, filter=None, projection=None, sort=None, skip=0, limit=0,
+                     workers=None, ordered=True, chunk_size=1000, mp_context=None):
+        """
+        Find documents in database, hydrate them and apply `func` to them in
+        a pool of processes.
+
+        The documents' BSON is retrieved without decoding it and sent as is
+        to the workers by chunks. The document class and `func` must be
+        picklable (i.e. defined at module level) unless processes are
+        forked: with the `spawn` start method, workers re-register the
+        templates by importing their module.
+
+        :param func: Function called with each document, its result is
+            returned to the parent process.
+        :param filter: Filter of the documents, as for :meth:`find`.
+        :param projection: Fields to retrieve, sort, skip and limit as
+            for the driver's ``find``.
+        :param workers: Number of processes, defaults to the number of CPUs.
+        :param ordered: If False, provide the results as soon as their chunk
+            is processed rather than in the query's order.
+        :param chunk_size: Number of documents sent to a worker at once.
+        :param mp_context: Multiprocessing context of the pool.
+        :return: A generator of the results of `func`.
+        """
+        workers = _check_parallel_map_args(func, workers, chunk_size)
+        raw_cursor, encode = cls._find_bson(
+            cook_find_filter(cls, filter), projection, sort=sort, skip=skip, limit=limit,
+            batch_size=chunk_size, session=SESSION.get())
+        return _parallel_map(
+            cls, raw_cursor, encode, func, workers, ordered, chunk_size, mp_context, close=True)
+
+    @classmethod
+    def _find_bson(cls, *args, **kwargs):
+        """
+        Return a cursor of the driver's ``find`` providing the documents'
+        BSON undecoded, along with the function returning a document's BSON.
+        """
+        collection = cls.collection.with_options(
+            codec_options=cls.collection.codec_options.with_options(
+                document_class=RawBSONDocument))
+        return collection.find(*args, **kwargs), operator.attrgetter('raw')
+
+    @classmethod
+    def aggregate(cls, pipeline, *args, hydrate=False, **kwargs):
+        """
+        Run an aggregation pipeline on the document's collection.
+
+        Fields' name are replaced by their name in database in the `$match`,
+        `$sort`, `$project` and `$group` stages and child documents are
+        filtered on their `_cls` field.
+
+        :param pipeline: List of aggregation stages.
+        :param hydrate: If True, return a cursor that provide Documents
+            rather than raw results.
+        """
+        pipeline = cook_aggregate_pipeline(cls, pipeline)
+        raw_cursor = cls.collection.aggregate(pipeline, *args, session=SESSION.get(), **kwargs)
+        if hydrate:
+            return cls.command_cursor_cls(cls, raw_cursor)
+        return raw_cursor
+
+    @classmethod
+    def watch(cls, filter=None, pipeline=None, full_document='updateLookup', resume_after=None,
+              checkpoint_collection=None, checkpoint_id=None, **kwargs):
+        """
+        Watch the changes of the documents in database.
+
+        The change stream is opened when called, the returned generator
+        provides :class:`umongo.frameworks.tools.ChangeEvent`.
+
+        :param filter: Filter on the changed documents, using the fields'
+            name. Events without document (e.g. deletions, or updates
+            without `full_document`) don't match a filter.
+        :param pipeline: Additional stages on the change events, the paths
+            of the changed document (``fullDocument.<field>``) using the
+            fields' name.
+        :param full_document: ``'updateLookup'`` to retrieve the document of
+            the update events, None to only get their update description.
+        :param resume_after: Resume token of the event to start after.
+        :param checkpoint_collection: Name of a collection where the resume
+            token of the last processed event is saved (an event being
+            processed once the next one is requested), the stream resuming
+            after it when no `resume_after` is given.
+        :param checkpoint_id: Id of the saved resume token (by default, the
+            name of the document's collection).
+
+        Other arguments are passed to the driver's ``watch``.
+        """
+        pipeline = cook_watch_pipeline(cls, filter, pipeline)
+        checkpoints = None
+        if checkpoint_collection:
+            checkpoints = cls.opts.instance.db[checkpoint_collection]
+            checkpoint_id = checkpoint_id or cls.collection_name
+            if resume_after is None:
+                checkpoint = checkpoints.find_one({'_id': checkpoint_id})
+                if checkpoint is not None:
+                    resume_after = checkpoint['resume_token']
+        stream = cls._open_change_stream(
+            pipeline, full_document=full_document, resume_after=resume_after, **kwargs)
+        return cls._iter_change_events(stream, checkpoints, checkpoint_id)
+
+    @classmethod
+    def _open_change_stream(cls, pipeline, **kwargs):
+        return cls.collection.watch(pipeline, session=SESSION.get(), **kwargs)
+
+    @classmethod
+    def _iter_change_events(cls, stream, checkpoints, checkpoint_id):
+        with stream:
+            for change in stream:
+                yield build_change_event(cls, change)
+                # Back here once the event has been processed
+                if checkpoints is not None:
+                    checkpoints.replace_one(
+                        {'_id': checkpoint_id}, {'resume_token': change['_id']}, upsert=True)
+
+    @classmethod
+    def scan(cls, filter=None, partitions=4, batch_size=1000, raw=False):
+        """
+        Scan the documents matching the filter with concurrent cursors.
+
+        The documents are split in `partitions` ranges of `_id` (computed
+        from a `$sample` of the ids), each range is read by its own thread.
+        The `_id` of the documents must be of the same type.
+
+        A session can't be used by several threads: within a session (see
+        :meth:`PyMongoInstance.session`), the ranges are read one after the
+        other with it.
+
+        :param filter: Query filter, using the fields' name.
+        :param partitions: Number of concurrent cursors.
+        :param batch_size: Maximum number of documents per batch.
+        :param raw: Provide the documents as returned by the driver rather
+            than Documents.
+        :return: A generator of lists of documents (one per batch, in no
+            particular order).
+        """
+        session = SESSION.get()
+        filter = cook_find_filter(cls, filter or {})
+        if partitions > 1:
+            samples = cls.collection.aggregate(
+                scan_sample_pipeline(filter, partitions), session=session)
+            filters = cook_scan_filters(filter, samples, partitions)
+        else:
+            filters = [filter]
+
+        def read_partition(partition_filter):
+            cursor = cls.collection.find(
+                partition_filter, batch_size=batch_size, session=session)
+            for batch in iter(lambda: list(itertools.islice(cursor, batch_size)), []):
+                if not raw:
+                    batch = [cls.build_from_mongo(elem, use_cls=True) for elem in batch]
+                yield batch
+
+        if session is not None:
+            for partition_filter in filters:
+                yield from read_partition(partition_filter)
+            return
+
+        batches = queue.Queue(maxsize=len(filters) * 2)
+        stop = threading.Event()
+
+        def scan_partition(partition_filter):
+            try:
+                for batch in read_partition(partition_filter):
+                    if stop.is_set():
+                        break
+                    batches.put(batch)
+            except Exception as exc:
+                batches.put(exc)
+            batches.put(None)
+
+        threads = [
+            threading.Thread(target=scan_partition, args=(partition_filter, ), daemon=True)
+            for partition_filter in filters
+        ]
+        for thread in threads:
+            thread.start()
+        done = 0
+        try:
+            while done < len(threads):
+                batch = batches.get()
+                if batch is None:
+                    done += 1
+                elif isinstance(batch, Exception):
+                    raise batch
+                else:
+                    yield batch
+        finally:
+            # Unblock the threads if the scan is interrupted
+            stop.set()
+            while done < len(threads):
+                if batches.get() is None:
+                    done += 1
+
     @classmethod
     def count_documents(cls, filter=None, **kwargs):
         """
@@ -230,12 +675,144 @@ class PyMongoDocument(DocumentImplementation):
         return cls.collection.count_documents(filter, session=SESSION.get(), **kwargs)
 
     @classmethod
-    def ensure_indexes(cls):
+    def insert_many(cls, documents, batch_size=1000, validate='schema', ordered=True):
+        """
+        Insert documents in database by batches without building document
+        instances, hooks and `io_validate` are not run.
+
+        Each batch is loaded at once by the document's schema and serialized
+        with a serializer specialized for the schema.
+
+        :param documents: Iterable (e.g. generator) of dicts using the
+            fields' name, consumed one batch at a time.
+        :param batch_size: Number of documents inserted per request.
+        :param validate: ``'schema'`` to deserialize and validate the values
+            and check the required fields, ``'required'`` to only check the
+            required fields of already deserialized values, ``'none'`` to
+            skip validation.
+        :param ordered: Stop at the first error (and insert the documents
+            in order) if True, otherwise insert all the documents possible.
+        :return: List of the inserted documents' ids.
+        """
+        inserted_ids = []
+        for payload in cook_insert_many_batches(cls, documents, batch_size, validate):
+            ret = cls.collection.insert_many(payload, ordered=ordered, session=SESSION.get())
+            inserted_ids.extend(ret.inserted_ids)
+        return inserted_ids
+
+    @classmethod
+    def update_many(cls, filter, set=None, unset=None, **kwargs):
+        """
+        Update all the documents matching the filter in database.
+
+        Values are validated and serialized as with a document's fields,
+        documents are not loaded and no hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param set: Dict of fields' values to set.
+        :param unset: List of fields' name to unset.
+        :return: A :class:`pymongo.results.UpdateResult`
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update(cls, set=set, unset=unset)
+        return cls.collection.update_many(filter, update, session=SESSION.get(), **kwargs)
+
+    @classmethod
+    def delete_many(cls, filter, hooks=False, batch_size=1000):
+        """
+        Delete all the documents matching the filter in database.
+
+        :param filter: Query filter, using the fields' name.
+        :param hooks: Load the documents to run their `pre_delete` and
+            `post_delete` hooks. Documents are deleted by batches, each
+            document's `post_delete` receives the result of its batch.
+        :param batch_size: Number of documents per batch when `hooks` is set.
+        :return: A :class:`pymongo.results.DeleteResult`, or a list of
+            the results of each batch if `hooks` is set.
+        """
+        cooked_filter = cook_find_filter(cls, filter)
+        if not hooks:
+            return cls.collection.delete_many(cooked_filter, session=SESSION.get())
+        rets = []
+        cursor = cls.find(filter, batch_size=batch_size)
+        while True:
+            docs = list(itertools.islice(cursor, batch_size))
+            if not docs:
+                break
+            additional_filters = [doc.pre_delete() for doc in docs]
+            query = cook_batch_delete_filter(cls, cooked_filter, docs, additional_filters)
+            ret = cls.collection.delete_many(query, session=SESSION.get())
+            for doc in docs:
+                doc.is_created = False
+                doc.post_delete(ret)
+            rets.append(ret)
+        return rets
+
+    @classmethod
+    def migrate_schema(cls, filter=None, batch_size=1000, progress=None):
+        """
+        Upgrade the documents stored with an older schema version in
+        database, without loading them as documents.
+
+        Documents are read and replaced by batches. The ones whose version
+        changed since they were read (e.g. upgraded on read then committed)
+        are left untouched.
+
+        :param filter: Query filter, using the fields' name, restricting
+            the documents to upgrade.
+        :param batch_size: Number of documents read and written at once.
+        :param progress: Function called after each batch with the current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A :class:`umongo.frameworks.tools.MigrationStats`
+        """
+        start = time.perf_counter()
+        scanned = modified = 0
+        cursor = cls.collection.find(
+            cook_schema_upgrade_filter(cls, filter), batch_size=batch_size, session=SESSION.get())
+        for batch in iter(lambda: list(itertools.islice(cursor, batch_size)), []):
+            ret = cls.collection.bulk_write(
+                [ReplaceOne(query, data) for query, data in upgrade_documents(cls, batch)],
+                ordered=False, session=SESSION.get())
+            scanned += len(batch)
+            modified += ret.modified_count
+            if progress:
+                progress(MigrationStats(scanned, modified, time.perf_counter() - start))
+        return MigrationStats(scanned, modified, time.perf_counter() - start)
+
+    @classmethod
+    def ensure_indexes(cls, diff=False, drop_stale=False, siblings=None):
         """
         Check&create if needed the Document's indexes in database
+
+        :param diff: Retrieve the existing indexes first and only create the
+            missing ones (in a single batch). The indexes of the database
+            with the key of a document's index but other options are
+            reported as conflicting and left as they are.
+        :param drop_stale: Drop the indexes that are not defined by any
+            document stored in the collection, and recreate the conflicting
+            ones. Implies `diff`.
+        :param siblings: Documents stored in the collection, as grouped by
+            :func:`umongo.frameworks.tools.documents_by_collection`
+            (computed if not given).
+        :return: A :class:`umongo.frameworks.tools.IndexesDiff` if `diff`
+            or `drop_stale` is set, None otherwise.
         """
-        if cls.indexes:
-            cls.collection.create_indexes(cls.indexes, session=SESSION.get())
+        if not diff and not drop_stale:
+            if cls.indexes:
+                cls.collection.create_indexes(cls.indexes, session=SESSION.get())
+            return None
+        ret = diff_indexes(
+            cls, cls.collection.index_information(session=SESSION.get()), siblings)
+        to_create = ret.missing
+        if drop_stale:
+            for name in ret.stale:
+                cls.collection.drop_index(name, session=SESSION.get())
+            for name, _index in ret.conflicting:
+                cls.collection.drop_index(name, session=SESSION.get())
+            to_create = to_create + [index for _name, index in ret.conflicting]
+        if to_create:
+            cls.collection.create_indexes(to_create, session=SESSION.get())
+        return ret
 
 
 # Run multiple validators and collect all errors in one
@@ -359,6 +936,113 @@ class PyMongoBuilder(BaseBuilder):
             field.io_validate_recursive = _embedded_document_io_validate
 
 
+class PyMongoTransaction:
+    """
+    Documents' writes committed together in a transaction, see
+    :meth:`PyMongoInstance.transaction`.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._writes = []
+
+    def commit(self, doc, io_validate_all=False, conditions=None, replace=False):
+        """
+        Commit the document with the transaction.
+
+        See :meth:`PyMongoDocument.commit` for the parameters.
+        """
+        self._writes.append((doc, 'commit', (io_validate_all, conditions, replace)))
+
+    def delete(self, doc, conditions=None):
+        """
+        Delete the document with the transaction.
+
+        See :meth:`PyMongoDocument.delete` for the parameters.
+        """
+        self._writes.append((doc, 'delete', (conditions, )))
+
+    def _find_one(self, collection, query):
+        return collection.find_one(query, {'_id': True}, session=self.session)
+
+    def _bulk_write(self, collection, requests):
+        return collection.bulk_write(requests, session=self.session)
+
+    def _run(self, max_retries, backoff, options):
+        writes = []
+        for doc, operation, args in self._writes:
+            if operation == 'delete':
+                writes.append((doc, 'delete', doc._prepare_delete(*args), None))
+            else:
+                prepared = doc._prepare_commit(*args)
+                if prepared is not None:
+                    writes.append((doc, *prepared))
+        checks = [write for write in writes if write[1] == 'check']
+        bulks = cook_transaction_writes([write for write in writes if write[1] != 'check'])
+        if not bulks and not checks:
+            return
+
+        def write():
+            for doc, _, query, _ in checks:
+                if len(query) > 1 and self._find_one(doc.collection, query) is None:
+                    raise UpdateError(query)
+            results = []
+            for collection, requests, bulk_writes in bulks:
+                try:
+                    ret = self._bulk_write(collection, requests)
+                except BulkWriteError as exc:
+                    error = bulk_write_unique_error(exc, bulk_writes)
+                    if error is None:
+                        raise
+                    raise error
+                check_transaction_result(ret, bulk_writes)
+                results.append(ret)
+            return results
+
+        results = _run_transaction(self.session, write, max_retries, backoff, options)
+        for doc, operation, _, _ in checks:
+            doc._finish_commit(operation, None)
+            doc.clear_modified()
+        for (_, _, bulk_writes), ret in zip(bulks, results):
+            for doc, operation, _, payload in bulk_writes:
+                if operation == 'delete':
+                    doc._finish_delete(ret)
+                else:
+                    doc._finish_commit(
+                        operation, ret, payload['_id'] if operation == 'insert' else None,
+                        payload)
+                    doc.clear_modified()
+
+
+def _run_transaction(session, write, max_retries, backoff, options):
+    """
+    Run `write` in a transaction, retrying on transient errors, and return
+    its result once committed.
+    """
+    committing = False
+    for attempt in itertools.count():
+        if attempt:
+            time.sleep(retry_delay(backoff, attempt - 1))
+        if not committing:
+            session.start_transaction(**options)
+            try:
+                ret = write()
+            except Exception as exc:
+                session.abort_transaction()
+                if attempt < max_retries and has_error_label(exc, 'TransientTransactionError'):
+                    continue
+                raise
+        try:
+            session.commit_transaction()
+            return ret
+        except Exception as exc:
+            # Commit again if its result is unknown, start over if transient
+            committing = has_error_label(exc, 'UnknownTransactionCommitResult')
+            if attempt >= max_retries or not (
+                    committing or has_error_label(exc, 'TransientTransactionError')):
+                raise
+
+
 class PyMongoInstance(Instance):
     """
     :class:`umongo.instance.Instance` implementation for pymongo
@@ -369,6 +1053,20 @@ class PyMongoInstance(Instance):
     def is_compatible_with(db):
         return isinstance(db, Database)
 
+    def ensure_all_indexes(self, diff=False, drop_stale=False):
+        """
+        Check&create if needed the indexes of all registered documents
+
+        See :meth:`PyMongoDocument.ensure_indexes` for the parameters.
+
+        :return: A dict of ``ensure_indexes`` results by document name
+        """
+        return {
+            doc_cls.__name__: doc_cls.ensure_indexes(
+                diff=diff, drop_stale=drop_stale, siblings=docs)
+            for docs in documents_by_collection(self).values() for doc_cls in docs
+        }
+
     @contextmanager
     def session(self):
         with self.db.client.start_session() as session:
@@ -378,27 +1076,136 @@ class PyMongoInstance(Instance):
             finally:
                 SESSION.reset(token)
 
+    @contextmanager
+    def transaction(self, session=None, max_retries=5, backoff=0.01, **kwargs):
+        """
+        Context manager writing documents together in a transaction.
+
+        The documents' commits and deletes queued with the yielded
+        :class:`PyMongoTransaction` are written on exit, with a bulk write
+        per collection in a single transaction. Nothing is written if an
+        exception is raised within the context. The session is bound to
+        the context.
+
+        The transaction is started over on ``TransientTransactionError`` and
+        its commit retried on ``UnknownTransactionCommitResult``, hooks and
+        validation only running once before the first attempt.
+
+        Unlike the driver's ``with_transaction``, the context's body is not
+        run again on retry: the writes are sent again as prepared, and the
+        reads within the context are not part of the transaction. Use
+        ``conditions`` or the ``version_field`` option to make the writes
+        fail if the documents were modified since they were read. A
+        duplicate key makes the transaction raise the same
+        :class:`marshmallow.ValidationError` as ``commit``.
+
+        :param session: Session to use, a new one is started by default.
+        :param max_retries: Number of retries before letting the error
+            propagate.
+        :param backoff: Base delay in seconds before retrying, doubled at
+            each retry and randomized.
+
+        Other arguments are passed to ``session.start_transaction``.
+        """
+        with ExitStack() as stack:
+            if session is None:
+                session = stack.enter_context(self.session())
+            else:
+                stack.callback(SESSION.reset, SESSION.set(session))
+            transaction = PyMongoTransaction(session)
+            yield transaction
+            transaction._run(max_retries, backoff, kwargs)
+
 
 class PyMongoMigrationInstance(PyMongoInstance):
     """PyMongo instance with migration features"""
 
-    def migrate_2_to_3(self):
+    def migrate_2_to_3(self, partitions=4, batch_size=1000, checkpoint_collection=None,
+                       progress=None):
         """Migrate database from umongo 2 to umongo 3
 
         - EmbeddedDocument _cls field is only set if child of concrete embedded document
+
+        Each collection is read by concurrent cursors on ranges of `_id` and
+        the modified documents are written by batches.
+
+        :param partitions: Number of concurrent cursors reading each collection.
+        :param batch_size: Number of documents read and written at once.
+        :param checkpoint_collection: Name of a collection where the progress
+            is saved after each batch. If the migration is interrupted,
+            running it again resumes it where it stopped.
+        :param progress: Function called after each batch (from the
+            partitions' threads) with the collection's name and its current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A dict of :class:`umongo.frameworks.tools.MigrationStats`
+            by collection name.
         """
         concrete_not_children = [
             name for name, ed in self._embedded_lookup.items()
             if not ed.opts.is_child and not ed.opts.abstract
         ]
+        checkpoints = self.db[checkpoint_collection] if checkpoint_collection else None
 
+        stats = {}
         for doc_cls in self._doc_lookup.values():
             if doc_cls.opts.abstract:
                 continue
             if doc_cls.opts.is_child:
                 continue
-            for doc in doc_cls.collection.find():
-                doc = remove_cls_field_from_embedded_docs(doc, concrete_not_children)
-                ret = doc_cls.collection.replace_one({"_id": doc["_id"]}, doc)
-                if ret.matched_count != 1:
+            stats[doc_cls.collection_name] = _migrate_2_to_3_collection(
+                doc_cls.collection, concrete_not_children,
+                partitions, batch_size, checkpoints, progress)
+        return stats
+
+
+def _migrate_2_to_3_collection(
+        collection, concrete_not_children, partitions, batch_size, checkpoints, progress):
+    start = time.perf_counter()
+    checkpoint = None
+    if checkpoints is not None:
+        checkpoint = checkpoints.find_one({'_id': collection.name})
+    if checkpoint is None:
+        samples = []
+        if partitions > 1:
+            samples = collection.aggregate(scan_sample_pipeline({}, partitions))
+        checkpoint = migration_checkpoint(collection.name, scan_bounds(samples, partitions))
+        if checkpoints is not None:
+            checkpoints.insert_one(checkpoint)
+    elif checkpoint['done']:
+        return MigrationStats(0, 0, 0.0)
+    lock = threading.Lock()
+    counters = {'scanned': 0, 'modified': 0}
+
+    def migrate_partition(index, lower, upper, last):
+        cursor = collection.find(
+            cook_range_filter({}, lower, upper, last), sort=[('_id', 1)], batch_size=batch_size)
+        for batch in iter(lambda: list(itertools.islice(cursor, batch_size)), []):
+            modified = migrate_2_to_3_documents(batch, concrete_not_children)
+            if modified:
+                ret = collection.bulk_write(
+                    [ReplaceOne({'_id': doc['_id']}, doc) for doc in modified], ordered=False)
+                if ret.matched_count != len(modified):
                     raise UpdateError(ret)
+            if checkpoints is not None:
+                checkpoints.update_one(
+                    {'_id': collection.name},
+                    {'$set': {'partitions.%s.2' % index: batch[-1]['_id']}})
+            with lock:
+                counters['scanned'] += len(batch)
+                counters['modified'] += len(modified)
+                stats = MigrationStats(
+                    counters['scanned'], counters['modified'], time.perf_counter() - start)
+            if progress:
+                progress(collection.name, stats)
+
+    with ThreadPoolExecutor(len(checkpoint['partitions'])) as executor:
+        futures = [
+            executor.submit(migrate_partition, index, *partition)
+            for index, partition in enumerate(checkpoint['partitions'])
+        ]
+        for future in futures:
+            future.result()
+    if checkpoints is not None:
+        checkpoints.update_one({'_id': collection.name}, {'$set': {'done': True}})
+    return MigrationStats(
+        counters['scanned'], counters['modified'], time.perf_counter() - start)
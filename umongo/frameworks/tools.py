@@ -1,4 +1,23 @@
-from ..query_mapper import map_query
+from collections import namedtuple, defaultdict
+from collections.abc import Mapping
+import itertools
+import logging
+import random
+
+from bson import ObjectId
+from pymongo.collection import ReturnDocument
+from pymongo.errors import PyMongoError
+from pymongo.operations import InsertOne, ReplaceOne, UpdateOne, DeleteOne
+import marshmallow as ma
+
+from ..document import SCHEMA_VERSION_KEY
+from ..exceptions import DocumentDefinitionError, UpdateError, DeleteError
+from ..fields import DictField, EmbeddedField, ListField
+from ..i18n import gettext as _
+from ..query_mapper import map_query, map_pipeline, unmap_entry_with_dots
+
+
+logger = logging.getLogger(__name__)
 
 
 def cook_find_filter(doc_cls, filter):
@@ -24,6 +43,594 @@ def cook_find_filter(doc_cls, filter):
     return filter
 
 
+# Aggregation stages that must be the first of the pipeline
+_FIRST_STAGES = ('$geoNear', '$search', '$searchMeta')
+# Aggregation stages returning statistics rather than documents
+_STATS_STAGES = ('$collStats', '$indexStats')
+
+
+def cook_aggregate_pipeline(doc_cls, pipeline):
+    """
+    Replace the fields' name by the one they have in database in the
+    pipeline stages and add a `$match` on the `_cls` field if needed
+    (i.e. unless the pipeline returns statistics).
+    """
+    pipeline = map_pipeline(pipeline, doc_cls.schema.fields)
+    if doc_cls.opts.is_child and not (pipeline and set(pipeline[0]) & set(_STATS_STAGES)):
+        cls_match = {'$match': cook_find_filter(doc_cls, {})}
+        position = 1 if pipeline and set(pipeline[0]) & set(_FIRST_STAGES) else 0
+        pipeline.insert(position, cls_match)
+    return pipeline
+
+
+def _prefix_query(query, prefix):
+    """Prefix the paths of a (mapped) query, e.g. to filter on a sub-document"""
+    return {
+        (key if key.startswith('$') else prefix + key): (
+            [_prefix_query(sub_query, prefix) for sub_query in value]
+            if key in ('$and', '$or', '$nor') else value)
+        for key, value in query.items()
+    }
+
+
+def cook_watch_pipeline(doc_cls, filter=None, pipeline=None):
+    """
+    Build the pipeline of a change stream on the document's collection.
+
+    The filter uses the fields' name and applies to the changed document
+    (i.e. ``fullDocument``). Child documents are filtered on the `_cls`
+    field, except in the events without document (e.g. deletions).
+
+    :param pipeline: Additional stages on the change events, the paths
+        of the changed document (e.g. ``fullDocument.<field>``) using the
+        fields' name.
+    """
+    stages = []
+    if doc_cls.opts.is_child:
+        cls_filter = _prefix_query(cook_find_filter(doc_cls, {}), 'fullDocument.')
+        stages.append({'$match': {'$or': [{'fullDocument': None}, cls_filter]}})
+    if filter:
+        filter = map_query(filter, doc_cls.schema.fields)
+        stages.append({'$match': _prefix_query(filter, 'fullDocument.')})
+    fields = {'fullDocument': doc_cls.schema.fields}
+    return stages + map_pipeline(list(pipeline or ()), fields)
+
+
+class UpdateDescription(namedtuple('UpdateDescription', ('updated_fields', 'removed_fields'))):
+    """Description of an update in a change event, using the fields' name
+
+    - updated_fields: dict of the new values by path, the values of whole
+      fields being deserialized
+    - removed_fields: list of the removed paths
+    """
+    __slots__ = ()
+
+
+class ChangeEvent(namedtuple('ChangeEvent', (
+        'operation_type', 'document_id', 'document', 'update_description',
+        'resume_token', 'raw'))):
+    """Change stream event
+
+    - operation_type: ``'insert'``, ``'update'``, ``'replace'``, ``'delete'``...
+    - document_id: ``_id`` of the changed document
+    - document: document built from the event's ``fullDocument``, None
+      without ``fullDocument``
+    - update_description: :class:`UpdateDescription` of an update event,
+      None otherwise
+    - resume_token: token to resume a change stream after this event
+    - raw: event as returned by the driver
+    """
+    __slots__ = ()
+
+
+def build_change_event(doc_cls, change):
+    """Build a :class:`ChangeEvent` from a change stream's event"""
+    document = change.get('fullDocument')
+    if document is not None:
+        document = doc_cls.build_from_mongo(document, use_cls=True)
+    update = change.get('updateDescription')
+    if update is not None:
+        fields = doc_cls.schema.fields
+        from_mongo_key = doc_cls.DataProxy._fields_from_mongo_key
+        updated = {}
+        for path, value in update.get('updatedFields', {}).items():
+            field = from_mongo_key.get(path)
+            if field is not None:
+                value = field.deserialize_from_mongo(value)
+            updated[unmap_entry_with_dots(path, fields)] = value
+        update = UpdateDescription(updated, [
+            unmap_entry_with_dots(path, fields) for path in update.get('removedFields', ())])
+    return ChangeEvent(
+        change['operationType'], change.get('documentKey', {}).get('_id'), document, update,
+        change['_id'], change)
+
+
+def _resolve_update_path(doc_cls, path):
+    """
+    Return the name within the database of a '.' separated update path and
+    the field of its value, `None` if the value is a raw one (i.g. within a
+    `DictField` without `value_field`).
+
+    List items are given by their index or a positional operator (i.g. `$`).
+
+    :raises KeyError: if the path doesn't match the document's fields.
+    """
+    fields = doc_cls.schema.fields
+    field = None
+    mapped = []
+    for entry in path.split('.'):
+        if fields is not None:
+            field = fields[entry]
+            mapped.append(field.attribute or entry)
+        elif field is None:
+            mapped.append(entry)
+            continue
+        elif isinstance(field, ListField) and (entry.isdigit() or entry.startswith('$')):
+            field = field.inner
+            mapped.append(entry)
+        elif isinstance(field, DictField):
+            field = field.value_field
+            mapped.append(entry)
+        else:
+            raise KeyError(entry)
+        fields = (
+            field.embedded_document_cls.schema.fields
+            if isinstance(field, EmbeddedField) else None
+        )
+    return '.'.join(mapped), field
+
+
+def _cook_update_value(field, name, value, validate=True):
+    """Deserialize, validate and serialize a value to write in the given field."""
+    if field is None:
+        return value
+    if value is None:
+        if not getattr(field, 'allow_none', False):
+            raise ma.ValidationError(field.error_messages['null'])
+        return None
+    value = field._deserialize(value, name, None)
+    if validate:
+        field._validate(value)
+    return field.serialize_to_mongo(value)
+
+
+def _cook_update_increment(field, name, value):
+    # An increment or a factor doesn't have to satisfy the field's validators
+    return _cook_update_value(field, name, value, validate=False)
+
+
+def _item_field(field):
+    if field is None:
+        return None
+    if not isinstance(field, ListField):
+        raise ma.ValidationError(_('Not a list field.'))
+    return field.inner
+
+
+def _cook_update_item(field, name, value):
+    # `$push` and `$addToSet` take an item or several ones with modifiers
+    inner = _item_field(field)
+    if isinstance(value, dict) and '$each' in value:
+        return {
+            **value,
+            '$each': [_cook_update_value(inner, name, item) for item in value['$each']],
+        }
+    return _cook_update_value(inner, name, value)
+
+
+def _cook_update_items(field, name, value):
+    inner = _item_field(field)
+    return [_cook_update_value(inner, name, item) for item in value]
+
+
+def _cook_update_condition(field, name, value):
+    # `$pull` takes a query on the items
+    inner = _item_field(field)
+    fields = inner.embedded_document_cls.schema.fields if isinstance(inner, EmbeddedField) else {}
+    return map_query(value, fields)
+
+
+def _cook_update_as_is(field, name, value):
+    return value
+
+
+# How to cook the values of the supported update operators
+_UPDATE_OPERATORS = {
+    '$set': _cook_update_value,
+    '$setOnInsert': _cook_update_value,
+    '$min': _cook_update_value,
+    '$max': _cook_update_value,
+    '$inc': _cook_update_increment,
+    '$mul': _cook_update_increment,
+    '$push': _cook_update_item,
+    '$addToSet': _cook_update_item,
+    '$pullAll': _cook_update_items,
+    '$pull': _cook_update_condition,
+    '$pop': _cook_update_as_is,
+    '$currentDate': _cook_update_as_is,
+}
+
+
+def _cook_update_operator(doc_cls, operator, values, errors):
+    cook = _UPDATE_OPERATORS[operator]
+    cooked = {}
+    for name, value in values.items():
+        try:
+            path, field = _resolve_update_path(doc_cls, name)
+        except KeyError:
+            errors[name] = [_('Unknown field.')]
+            continue
+        try:
+            cooked[path] = cook(field, name, value)
+        except ma.ValidationError as exc:
+            errors[name] = exc.messages
+    return cooked
+
+
+def _cook_update_unset(doc_cls, names, errors):
+    cooked = {}
+    for name in names:
+        try:
+            path, field = _resolve_update_path(doc_cls, name)
+        except KeyError:
+            errors[name] = [_('Unknown field.')]
+            continue
+        if getattr(field, 'required', False):
+            errors[name] = [field.error_messages['required']]
+        else:
+            cooked[path] = ""
+    return cooked
+
+
+def _cook_update_rename(doc_cls, names, errors):
+    cooked = {}
+    for name, new_name in names.items():
+        try:
+            path, _field = _resolve_update_path(doc_cls, name)
+            new_path, _field = _resolve_update_path(doc_cls, new_name)
+        except KeyError:
+            errors[name] = [_('Unknown field.')]
+            continue
+        cooked[path] = new_path
+    return cooked
+
+
+def cook_update(doc_cls, set=None, unset=None):
+    """
+    Build an update document for the given fields.
+
+    Values to set are validated and serialized like the ones of a document,
+    fields' name are replaced by the one they have in database. The version
+    of the documents with a `version_field` is incremented.
+
+    :param set: Dict of fields' values to set, '.' separated paths
+        being allowed.
+    :param unset: List of fields' name to unset.
+    """
+    errors = {}
+    update = {}
+    if set:
+        update['$set'] = _cook_update_operator(doc_cls, '$set', set, errors)
+    if unset:
+        update['$unset'] = _cook_update_unset(doc_cls, unset, errors)
+    if errors:
+        raise ma.ValidationError(errors)
+    return _versioned_update(doc_cls, update)
+
+
+def _versioned_update(doc_cls, update):
+    """
+    Make a non-empty update increment the version of the documents with
+    a `version_field`, so that their stale instances can't overwrite it.
+    """
+    name = doc_cls.opts.version_field
+    if name is None or not update:
+        return update
+    key = doc_cls.schema.fields[name].attribute or name
+    for operator, values in update.items():
+        if key in values or (operator == '$rename' and key in values.values()):
+            raise ma.ValidationError({name: [_('The version can only be incremented.')]})
+    update.setdefault('$inc', {})[key] = 1
+    return update
+
+
+# `return_document` argument of the `find_one_and_update` methods
+RETURN_DOCUMENT = {'before': ReturnDocument.BEFORE, 'after': ReturnDocument.AFTER}
+
+
+def cook_update_document(doc_cls, update):
+    """
+    Map the fields' name of an update document using update operators.
+
+    Values are validated and serialized with the field they are written in
+    (the list's items field for `$push`, `$addToSet` and `$pullAll`), like
+    with :func:`cook_update`. `$pull` conditions are mapped like a query.
+
+    :raises ma.ValidationError: if an operator is not supported.
+    """
+    errors = {}
+    cooked = {}
+    for operator, values in update.items():
+        if operator == '$unset':
+            cooked[operator] = _cook_update_unset(doc_cls, values, errors)
+        elif operator == '$rename':
+            cooked[operator] = _cook_update_rename(doc_cls, values, errors)
+        elif operator in _UPDATE_OPERATORS:
+            cooked[operator] = _cook_update_operator(doc_cls, operator, values, errors)
+        else:
+            errors[operator] = [_('Unsupported update operator.')]
+    if errors:
+        raise ma.ValidationError(errors)
+    return _versioned_update(doc_cls, {k: v for k, v in cooked.items() if v})
+
+
+def retry_delay(backoff, attempt):
+    """
+    Return the delay in seconds before the given retry attempt (starting at 0):
+    exponential backoff with full jitter, so that concurrent writers failing
+    together don't retry together.
+    """
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+def has_error_label(exc, label):
+    """Return True if `exc` is a driver error with the given label"""
+    return isinstance(exc, PyMongoError) and exc.has_error_label(label)
+
+
+def unique_index_error(doc_cls, key_pattern):
+    """
+    Return the :class:`marshmallow.ValidationError` of a duplicate key error
+    on the unique index with the given key pattern, None if a key of the
+    index is unknown from umongo.
+    """
+    # Sort value to make testing easier for compound indexes
+    keys = sorted(key_pattern.keys())
+    try:
+        fields = [doc_cls.schema.fields[k] for k in keys]
+    except KeyError:
+        return None
+    if len(keys) == 1:
+        return ma.ValidationError({keys[0]: fields[0].error_messages['unique']})
+    return ma.ValidationError({
+        k: f.error_messages['unique_compound'].format(fields=keys)
+        for k, f in zip(keys, fields)
+    })
+
+
+def bulk_write_unique_error(exc, writes):
+    """
+    Return the :class:`marshmallow.ValidationError` of the first duplicate
+    key error of a transaction's bulk write (as :func:`unique_index_error`),
+    None if there is none.
+
+    :param exc: :class:`pymongo.errors.BulkWriteError` raised.
+    :param writes: Writes of the bulk, as returned by
+        :func:`cook_transaction_writes`.
+    """
+    for error in exc.details.get('writeErrors', ()):
+        if error.get('code') == 11000 and 'keyPattern' in error:
+            doc = writes[error['index']][0]
+            return unique_index_error(type(doc), error['keyPattern'])
+    return None
+
+
+def cook_transaction_writes(writes):
+    """
+    Group the writes of a transaction by collection, as bulk requests.
+
+    :param writes: List of ``(document, operation, query, payload)``,
+        operation being ``'insert'``, ``'replace'``, ``'update'`` or
+        ``'delete'``.
+    :return: List of ``(collection, requests, writes)``.
+    """
+    groups = {}
+    for write in writes:
+        doc, operation, query, payload = write
+        if operation == 'insert':
+            # Set the id now so it is kept if the transaction is retried
+            payload.setdefault('_id', ObjectId())
+            request = InsertOne(payload)
+        elif operation == 'replace':
+            request = ReplaceOne(query, payload)
+        elif operation == 'update':
+            request = UpdateOne(query, payload)
+        else:
+            request = DeleteOne(query)
+        collection = doc.collection
+        _, requests, group_writes = groups.setdefault(collection.full_name, (collection, [], []))
+        requests.append(request)
+        group_writes.append(write)
+    return list(groups.values())
+
+
+def check_transaction_result(ret, writes):
+    """
+    Raise :class:`umongo.exceptions.UpdateError` or
+    :class:`umongo.exceptions.DeleteError` if some of the bulk's writes
+    didn't match their document (e.g. conditions not satisfied).
+    """
+    operations = [operation for _, operation, _, _ in writes]
+    if ret.deleted_count != operations.count('delete'):
+        raise DeleteError(ret)
+    if ret.matched_count != operations.count('replace') + operations.count('update'):
+        raise UpdateError(ret)
+
+
+def cook_batch_delete_filter(doc_cls, filter, docs, additional_filters):
+    """
+    Build the filter to delete a batch of documents found with `filter`.
+
+    :param filter: Filter used to find the documents, as returned by
+        :func:`cook_find_filter`.
+    :param docs: Documents to delete.
+    :param additional_filters: Filters returned by the documents'
+        `pre_delete` hook (or None), in the same order as `docs`.
+    """
+    pks = []
+    queries = []
+    for doc, additional_filter in zip(docs, additional_filters):
+        if additional_filter:
+            query = map_query(additional_filter, doc_cls.schema.fields)
+            query['_id'] = doc.pk
+            queries.append(query)
+        else:
+            pks.append(doc.pk)
+    if pks:
+        queries.append({'_id': {'$in': pks}})
+    query = queries[0] if len(queries) == 1 else {'$or': queries}
+    if filter:
+        query = {'$and': [filter, query]}
+    return query
+
+
+INSERT_MANY_VALIDATE = ('schema', 'required', 'none')
+
+
+def cook_insert_many_batches(doc_cls, documents, batch_size, validate):
+    """
+    Generate the batches of documents to insert in database, in MongoDB
+    world representation.
+
+    :param documents: Iterable of dicts using the fields' name, consumed
+        one batch at a time.
+    :param batch_size: Number of documents per batch.
+    :param validate: One of:
+        - ``'schema'``: load each batch with the document's schema (values
+          are deserialized and validated) then check the required fields.
+        - ``'required'``: values are already deserialized, only check the
+          required fields.
+        - ``'none'``: values are already deserialized and valid.
+    """
+    if validate not in INSERT_MANY_VALIDATE:
+        raise ValueError('`validate` must be one of %s' % ', '.join(INSERT_MANY_VALIDATE))
+    serialize = doc_cls.DataProxy.get_mongo_serializer()
+    fields = doc_cls.schema.fields
+    schema_version = doc_cls.opts.schema_version
+    version_key = None
+    if doc_cls.opts.version_field:
+        version_key = fields[doc_cls.opts.version_field].attribute or doc_cls.opts.version_field
+    # Without schema load, data has to be keyed by attribute by hand
+    attributes = {
+        name: field.attribute for name, field in fields.items()
+        if field.attribute and field.attribute != name
+    }
+    documents = iter(documents)
+    for offset in itertools.count(0, batch_size):
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
+            return
+        errors = {}
+        if validate == 'schema':
+            try:
+                batch = doc_cls.schema.load(batch, many=True, partial=True)
+            except ma.ValidationError as exc:
+                raise ma.ValidationError(
+                    {offset + idx: messages for idx, messages in exc.messages.items()})
+        else:
+            for idx, data in enumerate(batch):
+                unknown = [name for name in data if name not in fields]
+                if unknown:
+                    errors[offset + idx] = {name: [_('Unknown field.')] for name in unknown}
+                elif attributes:
+                    batch[idx] = {attributes.get(name, name): val for name, val in data.items()}
+        payload = []
+        for idx, data in enumerate(batch):
+            if offset + idx in errors:
+                continue
+            try:
+                mongo_data = serialize(data, required=validate != 'none')
+            except ma.ValidationError as exc:
+                errors[offset + idx] = exc.messages
+            else:
+                if schema_version is not None:
+                    mongo_data[SCHEMA_VERSION_KEY] = schema_version
+                if version_key is not None:
+                    mongo_data.setdefault(version_key, 1)
+                payload.append(mongo_data)
+        if errors:
+            raise ma.ValidationError(errors)
+        yield payload
+
+
+# Number of `_id` sampled per partition to compute the partitions' bounds
+SCAN_SAMPLES_PER_PARTITION = 20
+
+
+def scan_sample_pipeline(filter, partitions):
+    """
+    Return the aggregation pipeline sampling the `_id` of the documents
+    matching the (cooked) filter to split a scan in partitions.
+    """
+    return [
+        {'$match': filter or {}},
+        {'$sample': {'size': partitions * SCAN_SAMPLES_PER_PARTITION}},
+        {'$project': {'_id': True}},
+    ]
+
+
+def scan_bounds(samples, partitions):
+    """
+    Split the `_id` space in ranges.
+
+    The ranges bounds are the quantiles of the sampled ids, the first and
+    last ranges are open (their missing bound is None) so that every
+    document belongs to a range. This requires the `_id` of the documents
+    to be of the same type (e.g. ObjectId).
+
+    :param samples: Documents returned by :func:`scan_sample_pipeline`.
+    :param partitions: Maximum number of ranges.
+    :return: List of (lower, upper) bounds.
+    """
+    ids = sorted({sample['_id'] for sample in samples})
+    bounds = []
+    for i in range(1, partitions):
+        if not ids:
+            break
+        bound = ids[len(ids) * i // partitions]
+        if not bounds or bound != bounds[-1]:
+            bounds.append(bound)
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def cook_range_filter(filter, lower, upper, last=None):
+    """
+    Restrict a (cooked) filter to a range of `_id`.
+
+    :param lower: Lower bound (included), None if open.
+    :param upper: Upper bound (excluded), None if open.
+    :param last: Last id processed in the range, the filter then starts
+        after it.
+    """
+    id_range = {}
+    if last is not None:
+        id_range['$gt'] = last
+    elif lower is not None:
+        id_range['$gte'] = lower
+    if upper is not None:
+        id_range['$lt'] = upper
+    if not id_range:
+        return filter or {}
+    if filter:
+        return {'$and': [filter, {'_id': id_range}]}
+    return {'_id': id_range}
+
+
+def cook_scan_filters(filter, samples, partitions):
+    """
+    Split a scan in filters on `_id` ranges (see :func:`scan_bounds`).
+
+    :param filter: Filter of the scan, as returned by :func:`cook_find_filter`.
+    :param samples: Documents returned by :func:`scan_sample_pipeline`.
+    :param partitions: Maximum number of partitions.
+    :return: List of filters, one per partition.
+    """
+    return [
+        cook_range_filter(filter, lower, upper)
+        for lower, upper in scan_bounds(samples, partitions)
+    ]
+
+
 def remove_cls_field_from_embedded_docs(dict_in, embedded_docs):
     """Recursively remove _cls field from nested embedded documents
 
@@ -46,3 +653,186 @@ def remove_cls_field_from_embedded_docs(dict_in, embedded_docs):
             for item in dict_in
         ]
     return dict_in
+
+
+def migrate_2_to_3_documents(batch, embedded_docs):
+    """Return the documents of the batch modified by the umongo 2 to 3 migration
+
+    See :func:`remove_cls_field_from_embedded_docs` for the parameters.
+    """
+    modified = []
+    for doc in batch:
+        migrated = remove_cls_field_from_embedded_docs(doc, embedded_docs)
+        if migrated != doc:
+            modified.append(migrated)
+    return modified
+
+
+def migration_checkpoint(collection_name, bounds):
+    """
+    Return the initial checkpoint of a collection's migration.
+
+    The progress of each range is saved as ``[lower, upper, last]`` in the
+    `partitions` list, `last` being the last id processed.
+    """
+    return {
+        '_id': collection_name,
+        'partitions': [[lower, upper, None] for lower, upper in bounds],
+        'done': False,
+    }
+
+
+class MigrationStats(namedtuple('MigrationStats', ('scanned', 'modified', 'seconds'))):
+    """Progress of a collection's migration
+
+    - scanned: number of documents read
+    - modified: number of documents written
+    - seconds: duration of the migration
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        """Number of documents read per second"""
+        return self.scanned / self.seconds if self.seconds else 0.0
+
+
+def cook_schema_upgrade_filter(doc_cls, filter=None):
+    """
+    Return the filter of the documents stored with an older schema version
+    (or without version) among the ones matching `filter`.
+    """
+    if doc_cls.opts.schema_version is None:
+        raise DocumentDefinitionError(
+            '{}: schema_version must be set to upgrade documents'.format(doc_cls.__name__))
+    outdated = {'$or': [
+        {SCHEMA_VERSION_KEY: {'$lt': doc_cls.opts.schema_version}},
+        {SCHEMA_VERSION_KEY: None},
+    ]}
+    filter = cook_find_filter(doc_cls, filter)
+    return {'$and': [filter, outdated]} if filter else outdated
+
+
+def upgrade_documents(doc_cls, batch):
+    """
+    Upgrade a batch of documents retrieved from MongoDB.
+
+    Return the ``(filter, data)`` of each document to replace, the filter
+    only matches the document if its version didn't change since it was
+    read (e.g. it has not been upgraded and committed in the meantime).
+    """
+    return [
+        ({'_id': data['_id'], SCHEMA_VERSION_KEY: data.get(SCHEMA_VERSION_KEY)},
+         doc_cls.upgrade_from_mongo(data))
+        for data in batch
+    ]
+
+
+IndexesDiff = namedtuple('IndexesDiff', ('missing', 'stale', 'conflicting'))
+IndexesDiff.__doc__ = """Result of :func:`diff_indexes`
+
+- missing: :class:`pymongo.IndexModel` of the document not found in database
+- stale: names of the indexes in database not defined by any document
+- conflicting: ``(name, IndexModel)`` of the document's indexes whose key is
+  used by the index of the database with this name, with other options
+"""
+
+
+# Index options set by the server or not relevant to compare indexes
+_IGNORED_INDEX_OPTIONS = (
+    'key', 'name', 'ns', 'v', 'background', 'textIndexVersion', '2dsphereIndexVersion')
+# Text index options set by the server when not declared
+_TEXT_INDEX_DEFAULTS = {'default_language': 'english', 'language_override': 'language'}
+
+
+def _normalize_index(index):
+    """
+    Return a comparable representation of an index document, either
+    declared or as returned by the server.
+
+    Text indexes are represented as stored by the server: the text fields
+    are replaced by the `_fts` and `_ftsx` keys and listed in the weights.
+    """
+    key = index['key']
+    if isinstance(key, Mapping):
+        key = key.items()
+    key = [(k, int(v) if isinstance(v, float) else v) for k, v in key]
+    options = {k: v for k, v in index.items() if k not in _IGNORED_INDEX_OPTIONS}
+    text_fields = [k for k, v in key if v == 'text' and k != '_fts']
+    if text_fields:
+        first = next(idx for idx, (_, v) in enumerate(key) if v == 'text')
+        key = (
+            key[:first] + [('_fts', 'text'), ('_ftsx', 1)] +
+            [(k, v) for k, v in key[first:] if v != 'text']
+        )
+        weights = dict.fromkeys(text_fields, 1)
+        weights.update(options.get('weights', {}))
+        options['weights'] = weights
+    if ('_fts', 'text') in key:
+        for option, default in _TEXT_INDEX_DEFAULTS.items():
+            if options.get(option) == default:
+                del options[option]
+    if 'weights' in options:
+        options['weights'] = dict(options['weights'])
+    return {'key': key, 'options': options}
+
+
+def documents_by_collection(instance):
+    """
+    Group the concrete documents registered in an instance by collection name
+
+    Documents whose collection depends on the tenant are only included when
+    a tenant is set, a warning is logged for the ones skipped.
+    """
+    grouped = defaultdict(list)
+    tenant = instance._tenant.get()
+    for doc_cls in instance._doc_lookup.values():
+        if doc_cls.opts.abstract:
+            continue
+        if tenant is None and callable(doc_cls.opts.collection_name):
+            logger.warning(
+                '%s collection depends on the tenant, none is set: skipped', doc_cls.__name__)
+            continue
+        grouped[doc_cls.collection_name].append(doc_cls)
+    return grouped
+
+
+def diff_indexes(doc_cls, index_information, siblings=None):
+    """
+    Compare the indexes of a document with the ones existing in database.
+
+    :param doc_cls: Document class
+    :param index_information: Indexes of the document's collection as returned
+        by the driver's ``index_information``.
+    :param siblings: Documents stored in the document's collection, as
+        grouped by :func:`documents_by_collection` (computed if not given).
+    :return: An :class:`IndexesDiff`. Indexes of the other documents stored in
+        the same collection (parent, children) are not considered stale.
+    """
+    existing = {
+        name: _normalize_index(index) for name, index in index_information.items()}
+    names_by_key = {repr(index['key']): name for name, index in existing.items()}
+    missing = []
+    conflicting = []
+    for index in doc_cls.indexes:
+        normalized = _normalize_index(index.document)
+        if normalized in existing.values():
+            continue
+        # The server rejects an index whose key is already indexed
+        name = names_by_key.get(repr(normalized['key']))
+        if name is None:
+            missing.append(index)
+        else:
+            conflicting.append((name, index))
+    if siblings is None:
+        siblings = documents_by_collection(doc_cls.opts.instance)[doc_cls.collection_name]
+    known = [
+        _normalize_index(index.document)
+        for sibling in set(siblings) | {doc_cls} for index in sibling.indexes
+    ]
+    conflicting_names = [name for name, _index in conflicting]
+    stale = [
+        name for name, index in existing.items()
+        if name != '_id_' and index not in known and name not in conflicting_names
+    ]
+    return IndexesDiff(missing, stale, conflicting)
@@ -1,8 +1,13 @@
+import itertools
+import time
+
 from twisted.internet.defer import (
     inlineCallbacks, Deferred, DeferredList, returnValue, maybeDeferred)
+from twisted.internet.task import deferLater
 from txmongo import filter as qf
 from txmongo.database import Database
 from pymongo.errors import DuplicateKeyError
+from pymongo.operations import ReplaceOne
 import marshmallow as ma
 
 from ..builder import BaseBuilder
@@ -13,7 +18,12 @@ from ..exceptions import NotCreatedError, UpdateError, DeleteError, NoneReferenc
 from ..fields import ReferenceField, ListField, DictField, EmbeddedField
 from ..query_mapper import map_query
 
-from .tools import cook_find_filter, remove_cls_field_from_embedded_docs
+from .tools import (
+    cook_find_filter, cook_update, cook_batch_delete_filter, cook_insert_many_batches,
+    cook_scan_filters, cook_range_filter, scan_sample_pipeline, scan_bounds,
+    migrate_2_to_3_documents, migration_checkpoint, MigrationStats,
+    cook_schema_upgrade_filter, upgrade_documents, retry_delay, cook_update_document,
+    RETURN_DOCUMENT, diff_indexes, documents_by_collection, unique_index_error)
 
 
 class TxMongoDocument(DocumentImplementation):
@@ -23,20 +33,25 @@ class TxMongoDocument(DocumentImplementation):
     opts = DocumentImplementation.opts
 
     @inlineCallbacks
-    def reload(self):
+    def reload(self, fields=None):
         """
         Retrieve and replace document's data by the ones in database.
 
+        :param fields: Names of the fields to reload (using a projection),
+            the other fields are left untouched and keep their modified state.
+            By default, the whole document is reloaded.
+
         Raises :class:`umongo.exceptions.NotCreatedError` if the document
         doesn't exist in database.
         """
         if not self.is_created:
             raise NotCreatedError("Document doesn't exists in database")
-        ret = yield self.collection.find_one(self.pk)
+        ret = yield self.collection.find_one(self.pk, projection=self._reload_projection(fields))
         if ret is None:
             raise NotCreatedError("Document doesn't exists in database")
-        self._data = self.DataProxy()
-        self._data.from_mongo(ret)
+        if fields is None:
+            self._data = self.DataProxy()
+        self.from_mongo(ret, fields=fields)
 
     @inlineCallbacks
     def commit(self, io_validate_all=False, conditions=None, replace=False):
@@ -59,6 +74,7 @@ class TxMongoDocument(DocumentImplementation):
                 if self.is_modified() or replace:
                     query = conditions or {}
                     query['_id'] = self.pk
+                    query.update(self._version_filter())
                     # pre_update can provide additional query filter and/or
                     # modify the fields' values
                     additional_filter = yield maybeDeferred(self.pre_update)
@@ -67,13 +83,24 @@ class TxMongoDocument(DocumentImplementation):
                     self.required_validate()
                     yield self.io_validate(validate_all=io_validate_all)
                     if replace:
-                        payload = self._data.to_mongo(update=False)
+                        payload = self._versioned_payload(self.to_mongo())
                         ret = yield self.collection.replace_one(query, payload)
                     else:
-                        payload = self._data.to_mongo(update=True)
-                        ret = yield self.collection.update_one(query, payload)
-                    if ret.matched_count != 1:
-                        raise UpdateError(ret)
+                        payload = self._versioned_payload(
+                            self.to_mongo(update=True), update=True)
+                        # No payload if `diff_updates` found no actual change,
+                        # the conditions still have to be checked
+                        ret = None
+                        if payload is not None:
+                            ret = yield self.collection.update_one(query, payload)
+                        elif len(query) > 1:
+                            found = yield self.collection.find_one(query, {'_id': True})
+                            if found is None:
+                                raise UpdateError(query)
+                    if ret is not None:
+                        if ret.matched_count != 1:
+                            raise UpdateError(ret)
+                        self._bump_version()
                     yield maybeDeferred(self.post_update, ret)
                 else:
                     ret = None
@@ -85,28 +112,20 @@ class TxMongoDocument(DocumentImplementation):
                 yield maybeDeferred(self.pre_insert)
                 self.required_validate()
                 yield self.io_validate(validate_all=io_validate_all)
-                payload = self._data.to_mongo(update=False)
+                payload = self._versioned_payload(self.to_mongo())
                 ret = yield self.collection.insert_one(payload)
                 # TODO: check ret ?
                 self._data.set(self.pk_field, ret.inserted_id)
+                self._bump_version()
                 self.is_created = True
                 yield maybeDeferred(self.post_insert, ret)
         except DuplicateKeyError as exc:
-            # Sort value to make testing easier for compound indexes
-            keys = sorted(exc.details['keyPattern'].keys())
-            try:
-                fields = [self.schema.fields[k] for k in keys]
-            except KeyError:
+            error = unique_index_error(type(self), exc.details['keyPattern'])
+            if error is None:
                 # A key in the index is unknwon from umongo
                 raise exc
-            if len(keys) == 1:
-                msg = fields[0].error_messages['unique']
-                raise ma.ValidationError({keys[0]: msg})
-            raise ma.ValidationError({
-                k: f.error_messages['unique_compound'].format(fields=keys)
-                for k, f in zip(keys, fields)
-            })
-        self._data.clear_modified()
+            raise error
+        self.clear_modified()
         return ret
 
     @inlineCallbacks
@@ -129,6 +148,7 @@ class TxMongoDocument(DocumentImplementation):
             raise NotCreatedError("Document doesn't exists in database")
         query = conditions or {}
         query['_id'] = self.pk
+        query.update(self._version_filter())
         # pre_delete can provide additional query filter
         additional_filter = yield maybeDeferred(self.pre_delete)
         if additional_filter:
@@ -164,6 +184,83 @@ class TxMongoDocument(DocumentImplementation):
             ret = cls.build_from_mongo(ret, use_cls=True)
         return ret
 
+    @classmethod
+    @inlineCallbacks
+    def find_one_and_update(cls, filter, update, return_document='after', **kwargs):
+        """
+        Atomically update a single document in database and return it.
+
+        Values are mapped and serialized like with :meth:`update_many`, no
+        hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param update: Update document using update operators (``$set``
+            values are validated and serialized by the fields).
+        :param return_document: ``'after'`` to return the document once
+            updated, ``'before'`` to return it as it was.
+        :return: The document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update_document(cls, update)
+        ret = yield cls.collection.find_one_and_update(
+            filter, update, return_document=RETURN_DOCUMENT[return_document], **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+        return ret
+
+    @classmethod
+    @inlineCallbacks
+    def find_one_and_delete(cls, filter, **kwargs):
+        """
+        Atomically delete a single document from database and return it.
+
+        No hook is run, the returned document is not created anymore.
+
+        :param filter: Query filter, using the fields' name.
+        :return: The deleted document or None if no document matched.
+        """
+        filter = cook_find_filter(cls, filter)
+        ret = yield cls.collection.find_one_and_delete(filter, **kwargs)
+        if ret is not None:
+            ret = cls.build_from_mongo(ret, use_cls=True)
+            ret.is_created = False
+        return ret
+
+    @classmethod
+    @inlineCallbacks
+    def modify_with_retry(cls, pk, fn, max_retries=5, backoff=0.01):
+        """
+        Load the document, modify it with `fn` and commit it, starting over
+        with a freshly loaded document if it was modified concurrently.
+
+        Meant to be used with the `version_field` meta option, the commit
+        raising :class:`umongo.exceptions.UpdateError` when the document
+        changed since it was loaded.
+
+        :param pk: Primary key of the document.
+        :param fn: Function modifying the document passed as argument, may
+            return a Deferred.
+        :param max_retries: Number of times to start over before letting the
+            :class:`umongo.exceptions.UpdateError` propagate.
+        :param backoff: Base delay in seconds before starting over, doubled
+            at each retry and randomized.
+        :return: The committed document, None if it doesn't exist.
+        """
+        from twisted.internet import reactor
+        for attempt in itertools.count():
+            doc = yield cls.find_one({'_id': pk})
+            if doc is None:
+                return None
+            yield maybeDeferred(fn, doc)
+            try:
+                yield doc.commit()
+            except UpdateError:
+                if attempt >= max_retries:
+                    raise
+                yield deferLater(reactor, retry_delay(backoff, attempt), lambda: None)
+            else:
+                return doc
+
     @classmethod
     @inlineCallbacks
     def find(cls, filter=None, *args, **kwargs):
@@ -195,6 +292,36 @@ class TxMongoDocument(DocumentImplementation):
 
         return wrap_raw_results(raw_cursor_or_list)
 
+    @classmethod
+    @inlineCallbacks
+    def scan(cls, callback, filter=None, partitions=4, batch_size=1000, raw=False):
+        """
+        Scan the documents matching the filter with concurrent cursors.
+
+        The documents are split in `partitions` ranges of `_id` (computed
+        from a `$sample` of the ids), each range is read concurrently.
+        The `_id` of the documents must be of the same type.
+
+        :param callback: Function called with each batch of documents (a
+            list), if it returns a Deferred the next batch of the partition
+            is read once it has fired.
+        :param filter: Query filter, using the fields' name.
+        :param partitions: Number of concurrent cursors.
+        :param batch_size: Maximum number of documents per batch.
+        :param raw: Provide the documents as returned by the driver rather
+            than Documents.
+        :return: A Deferred fired once all the documents have been scanned.
+        """
+        filter = cook_find_filter(cls, filter or {})
+        if partitions > 1:
+            samples = yield cls.collection.aggregate(scan_sample_pipeline(filter, partitions))
+            filters = cook_scan_filters(filter, samples, partitions)
+        else:
+            filters = [filter]
+        yield DeferredList(
+            [_scan_partition(cls, f, callback, batch_size, raw) for f in filters],
+            fireOnOneErrback=True, consumeErrors=True)
+
     @classmethod
     def count(cls, filter=None, **kwargs):
         """
@@ -205,15 +332,168 @@ class TxMongoDocument(DocumentImplementation):
 
     @classmethod
     @inlineCallbacks
-    def ensure_indexes(cls):
+    def insert_many(cls, documents, batch_size=1000, validate='schema', ordered=True):
+        """
+        Insert documents in database by batches without building document
+        instances, hooks and `io_validate` are not run.
+
+        Each batch is loaded at once by the document's schema and serialized
+        with a serializer specialized for the schema.
+
+        :param documents: Iterable (e.g. generator) of dicts using the
+            fields' name, consumed one batch at a time.
+        :param batch_size: Number of documents inserted per request.
+        :param validate: ``'schema'`` to deserialize and validate the values
+            and check the required fields, ``'required'`` to only check the
+            required fields of already deserialized values, ``'none'`` to
+            skip validation.
+        :param ordered: Stop at the first error (and insert the documents
+            in order) if True, otherwise insert all the documents possible.
+        :return: List of the inserted documents' ids.
+        """
+        inserted_ids = []
+        for payload in cook_insert_many_batches(cls, documents, batch_size, validate):
+            ret = yield cls.collection.insert_many(payload, ordered=ordered)
+            inserted_ids.extend(ret.inserted_ids)
+        return inserted_ids
+
+    @classmethod
+    def update_many(cls, filter, set=None, unset=None, **kwargs):
+        """
+        Update all the documents matching the filter in database.
+
+        Values are validated and serialized as with a document's fields,
+        documents are not loaded and no hook is run.
+
+        :param filter: Query filter, using the fields' name.
+        :param set: Dict of fields' values to set.
+        :param unset: List of fields' name to unset.
+        :return: A :class:`pymongo.results.UpdateResult`
+        """
+        filter = cook_find_filter(cls, filter)
+        update = cook_update(cls, set=set, unset=unset)
+        return cls.collection.update_many(filter, update, **kwargs)
+
+    @classmethod
+    @inlineCallbacks
+    def delete_many(cls, filter, hooks=False, batch_size=1000):
+        """
+        Delete all the documents matching the filter in database.
+
+        :param filter: Query filter, using the fields' name.
+        :param hooks: Load the documents to run their `pre_delete` and
+            `post_delete` hooks. Documents are deleted by batches, each
+            document's `post_delete` receives the result of its batch.
+        :param batch_size: Number of documents per batch when `hooks` is set.
+        :return: A :class:`pymongo.results.DeleteResult`, or a list of
+            the results of each batch if `hooks` is set.
+        """
+        filter = cook_find_filter(cls, filter)
+        if not hooks:
+            ret = yield cls.collection.delete_many(filter)
+            return ret
+        rets = []
+        raw_docs, next_batch = yield cls.collection.find_with_cursor(
+            filter, batch_size=batch_size)
+        while raw_docs:
+            docs = [cls.build_from_mongo(raw_doc, use_cls=True) for raw_doc in raw_docs]
+            additional_filters = []
+            for doc in docs:
+                additional_filter = yield maybeDeferred(doc.pre_delete)
+                additional_filters.append(additional_filter)
+            query = cook_batch_delete_filter(cls, filter, docs, additional_filters)
+            ret = yield cls.collection.delete_many(query)
+            for doc in docs:
+                doc.is_created = False
+                yield maybeDeferred(doc.post_delete, ret)
+            rets.append(ret)
+            raw_docs, next_batch = yield next_batch
+        return rets
+
+    @classmethod
+    @inlineCallbacks
+    def migrate_schema(cls, filter=None, batch_size=1000, progress=None):
+        """
+        Upgrade the documents stored with an older schema version in
+        database, without loading them as documents.
+
+        Documents are read and replaced by batches. The ones whose version
+        changed since they were read (e.g. upgraded on read then committed)
+        are left untouched.
+
+        :param filter: Query filter, using the fields' name, restricting
+            the documents to upgrade.
+        :param batch_size: Number of documents read and written at once.
+        :param progress: Function called after each batch with the current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A :class:`umongo.frameworks.tools.MigrationStats`
+        """
+        start = time.perf_counter()
+        scanned = modified = 0
+        batch, next_batch = yield cls.collection.find_with_cursor(
+            cook_schema_upgrade_filter(cls, filter), batch_size=batch_size)
+        while batch:
+            ret = yield cls.collection.bulk_write(
+                [ReplaceOne(query, data) for query, data in upgrade_documents(cls, batch)],
+                ordered=False)
+            scanned += len(batch)
+            modified += ret.modified_count
+            if progress:
+                progress(MigrationStats(scanned, modified, time.perf_counter() - start))
+            batch, next_batch = yield next_batch
+        return MigrationStats(scanned, modified, time.perf_counter() - start)
+
+    @classmethod
+    @inlineCallbacks
+    def ensure_indexes(cls, diff=False, drop_stale=False, siblings=None):
         """
         Check&create if needed the Document's indexes in database
+
+        :param diff: Retrieve the existing indexes first and only create the
+            missing ones (concurrently). The indexes of the database with the
+            key of a document's index but other options are reported as
+            conflicting and left as they are.
+        :param drop_stale: Drop the indexes that are not defined by any
+            document stored in the collection, and recreate the conflicting
+            ones. Implies `diff`.
+        :param siblings: Documents stored in the collection, as grouped by
+            :func:`umongo.frameworks.tools.documents_by_collection`
+            (computed if not given).
+        :return: A :class:`umongo.frameworks.tools.IndexesDiff` if `diff`
+            or `drop_stale` is set, None otherwise.
         """
+        if diff or drop_stale:
+            index_information = yield cls.collection.index_information()
+            ret = diff_indexes(cls, index_information, siblings)
+            to_create = ret.missing
+            if drop_stale:
+                for name in ret.stale:
+                    yield cls.collection.drop_index(name)
+                for name, _index in ret.conflicting:
+                    yield cls.collection.drop_index(name)
+                to_create = to_create + [index for _name, index in ret.conflicting]
+            yield DeferredList(
+                [_create_index(cls.collection, index) for index in to_create],
+                fireOnOneErrback=True, consumeErrors=True)
+            return ret
         for index in cls.indexes:
-            kwargs = index.document.copy()
-            keys = kwargs.pop('key')
-            index = qf.sort(keys.items())
-            yield cls.collection.create_index(index, **kwargs)
+            yield _create_index(cls.collection, index)
+
+
+@inlineCallbacks
+def _scan_partition(doc_cls, filter, callback, batch_size, raw):
+    batch, next_batch = yield doc_cls.collection.find_with_cursor(filter, batch_size=batch_size)
+    while batch:
+        if not raw:
+            batch = [doc_cls.build_from_mongo(elem, use_cls=True) for elem in batch]
+        yield maybeDeferred(callback, batch)
+        batch, next_batch = yield next_batch
+
+
+def _create_index(collection, index):
+    kwargs = index.document.copy()
+    keys = kwargs.pop('key')
+    return collection.create_index(qf.sort(keys.items()), **kwargs)
 
 
 def _errback_factory(errors, field=None, subkey=None):
@@ -382,29 +662,127 @@ class TxMongoInstance(Instance):
     def is_compatible_with(db):
         return isinstance(db, Database)
 
+    def _build_collection(self, name, database, read_preference, read_concern):
+        if read_preference is not None or read_concern is not None:
+            raise NotImplementedError('txmongo supports neither read preference nor read concern')
+        db = self.db if database is None else self.db.connection[database]
+        return db[name]
+
+    @inlineCallbacks
+    def ensure_all_indexes(self, diff=False, drop_stale=False):
+        """
+        Check&create if needed the indexes of all registered documents
+
+        Collections are processed concurrently, documents sharing a
+        collection are processed one after another.
+        See :meth:`TxMongoDocument.ensure_indexes` for the parameters.
+
+        :return: A dict of ``ensure_indexes`` results by document name
+        """
+        @inlineCallbacks
+        def ensure_collection_indexes(docs):
+            rets = []
+            for doc_cls in docs:
+                ret = yield doc_cls.ensure_indexes(
+                    diff=diff, drop_stale=drop_stale, siblings=docs)
+                rets.append((doc_cls.__name__, ret))
+            return rets
+
+        results = yield DeferredList([
+            ensure_collection_indexes(docs)
+            for docs in documents_by_collection(self).values()
+        ], fireOnOneErrback=True, consumeErrors=True)
+        return dict(ret for _, rets in results for ret in rets)
+
 
 class TxMongoMigrationInstance(TxMongoInstance):
     """TxMongo instance with migration features"""
 
     @inlineCallbacks
-    def migrate_2_to_3(self):
+    def migrate_2_to_3(self, partitions=4, batch_size=1000, checkpoint_collection=None,
+                       progress=None):
         """Migrate database from umongo 2 to umongo 3
 
         - EmbeddedDocument _cls field is only set if child of concrete embedded document
+
+        Each collection is read by concurrent cursors on ranges of `_id` and
+        the modified documents are written by batches.
+
+        :param partitions: Number of concurrent cursors reading each collection.
+        :param batch_size: Number of documents read and written at once.
+        :param checkpoint_collection: Name of a collection where the progress
+            is saved after each batch. If the migration is interrupted,
+            running it again resumes it where it stopped.
+        :param progress: Function called after each batch with the
+            collection's name and its current
+            :class:`umongo.frameworks.tools.MigrationStats`.
+        :return: A dict of :class:`umongo.frameworks.tools.MigrationStats`
+            by collection name.
         """
         concrete_not_children = [
             name for name, ed in self._embedded_lookup.items()
             if not ed.opts.is_child and not ed.opts.abstract
         ]
+        checkpoints = self.db[checkpoint_collection] if checkpoint_collection else None
 
+        stats = {}
         for doc_cls in self._doc_lookup.values():
             if doc_cls.opts.abstract:
                 continue
             if doc_cls.opts.is_child:
                 continue
-            res = yield doc_cls.collection.find()
-            for doc in res:
-                doc = remove_cls_field_from_embedded_docs(doc, concrete_not_children)
-                ret = yield doc_cls.collection.replace_one({"_id": doc["_id"]}, doc)
-                if ret.matched_count != 1:
+            name = doc_cls.collection_name
+            stats[name] = yield _migrate_2_to_3_collection(
+                doc_cls.collection, name, concrete_not_children,
+                partitions, batch_size, checkpoints, progress)
+        return stats
+
+
+@inlineCallbacks
+def _migrate_2_to_3_collection(collection, name, concrete_not_children,
+                               partitions, batch_size, checkpoints, progress):
+    start = time.perf_counter()
+    checkpoint = None
+    if checkpoints is not None:
+        checkpoint = yield checkpoints.find_one({'_id': name})
+    if checkpoint is None:
+        samples = []
+        if partitions > 1:
+            samples = yield collection.aggregate(scan_sample_pipeline({}, partitions))
+        checkpoint = migration_checkpoint(name, scan_bounds(samples, partitions))
+        if checkpoints is not None:
+            yield checkpoints.insert_one(checkpoint)
+    elif checkpoint['done']:
+        return MigrationStats(0, 0, 0.0)
+    counters = {'scanned': 0, 'modified': 0}
+
+    @inlineCallbacks
+    def migrate_partition(index, lower, upper, last):
+        batch, next_batch = yield collection.find_with_cursor(
+            cook_range_filter({}, lower, upper, last), sort=qf.sort(qf.ASCENDING('_id')),
+            batch_size=batch_size)
+        while batch:
+            modified = migrate_2_to_3_documents(batch, concrete_not_children)
+            if modified:
+                ret = yield collection.bulk_write(
+                    [ReplaceOne({'_id': doc['_id']}, doc) for doc in modified], ordered=False)
+                if ret.matched_count != len(modified):
                     raise UpdateError(ret)
+            if checkpoints is not None:
+                yield checkpoints.update_one(
+                    {'_id': name}, {'$set': {'partitions.%s.2' % index: batch[-1]['_id']}})
+            counters['scanned'] += len(batch)
+            counters['modified'] += len(modified)
+            if progress:
+                progress(name, MigrationStats(
+                    counters['scanned'], counters['modified'], time.perf_counter() - start))
+            batch, next_batch = yield next_batch
+
+    yield DeferredList([
+        migrate_partition(index, *partition)
+        for index, partition in enumerate(checkpoint['partitions'])
+    ], fireOnOneErrback=True, consumeErrors=True)
+    if checkpoints is not None:
+        yield checkpoints.update_one({'_id': name}, {'$set': {'done': True}})
+    return MigrationStats(
+        counters['scanned'], counters['modified'], time.perf_counter() - start)
@@ -1,4 +1,8 @@
 import abc
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
 
 from .exceptions import (
     NotRegisteredDocumentError, AlreadyRegisteredDocumentError, NoDBDefinedError)
@@ -25,26 +29,45 @@ class Instance(abc.ABC):
         # Now we can work with the implementations
         doc_cls.find()
 
+    When many documents are registered at import time, ``lazy=True`` can be
+    passed to defer the creation of the implementations' schema and data
+    proxy until their first use, which reduces startup time::
+
+        instance = MyFrameworkInstance(db, lazy=True)
+
+    Collection handles are cached, the least recently used ones being
+    dropped beyond ``collection_cache_size`` handles (e.g. with many tenants'
+    collections).
+
     .. note::
         Instance registration is divided between :class:`umongo.Document` and
         :class:`umongo.EmbeddedDocument`.
     """
     BUILDER_CLS = None
 
-    def __init__(self, db=None):
-        self.builder = self.BUILDER_CLS(self)
+    def __init__(self, db=None, *, lazy=False, collection_cache_size=128):
+        self.builder = self.BUILDER_CLS(self, lazy=lazy)
         self._doc_lookup = {}
         self._embedded_lookup = {}
         self._mixin_lookup = {}
+        self._collections = OrderedDict()
+        self._collections_lock = threading.Lock()
+        self.collection_cache_size = collection_cache_size
+        # Routing options overriding the documents' ones in the current
+        # context, see `routing`
+        self._routing = ContextVar('routing', default=None)
+        # Key of the tenant whose collections are used by the documents with
+        # a callable `collection_name` in the current context, see `tenant`
+        self._tenant = ContextVar('tenant', default=None)
         self._db = db
         if db is not None:
             self.set_db(db)
 
     @classmethod
-    def from_db(cls, db):
+    def from_db(cls, db, **kwargs):
         from .frameworks import find_instance_from_db
         instance_cls = find_instance_from_db(db)
-        instance = instance_cls()
+        instance = instance_cls(**kwargs)
         instance.set_db(db)
         return instance
 
@@ -141,6 +164,87 @@ class Instance(abc.ABC):
     def is_compatible_with(self, db):
         return NotImplemented
 
+    def get_collection(self, name, database=None, read_preference=None, read_concern=None):
+        """
+        Return a collection of the instance's database.
+
+        Handles are cached, see ``collection_cache_size``.
+
+        :param name: Name of the collection.
+        :param database: Name of another database of the same client.
+        :param read_preference: Read preference of the collection (by
+            default, the database's one).
+        :param read_concern: Read concern of the collection (by default, the
+            database's one).
+        """
+        key = (name, database, _read_option_key(read_preference), _read_option_key(read_concern))
+        with self._collections_lock:
+            collection = self._collections.get(key)
+            if collection is not None:
+                self._collections.move_to_end(key)
+                return collection
+        collection = self._build_collection(name, database, read_preference, read_concern)
+        with self._collections_lock:
+            self._collections[key] = collection
+            while len(self._collections) > self.collection_cache_size:
+                self._collections.popitem(last=False)
+        return collection
+
+    def _build_collection(self, name, database, read_preference, read_concern):
+        db = self.db if database is None else self.db.client[database]
+        if read_preference is None and read_concern is None:
+            return db[name]
+        return db.get_collection(
+            name, read_preference=read_preference, read_concern=read_concern)
+
+    @contextmanager
+    def routing(self, database=None, read_preference=None, read_concern=None):
+        """
+        Context manager overriding the database, read preference and read
+        concern of the documents' collections, e.g. to send read-heavy
+        queries to secondaries::
+
+            with instance.routing(read_preference=ReadPreference.SECONDARY):
+                report = list(Purchase.find())
+
+        The override is stored in a context variable of the instance: it
+        applies to the current thread or asyncio task, and only to the
+        documents of this instance. Options left to None keep the value of
+        the enclosing override or of the document's meta. The ``database``
+        override applies to the writes as well.
+        """
+        routing = dict(self._routing.get() or {})
+        for option, value in (
+                ('database', database),
+                ('read_preference', read_preference),
+                ('read_concern', read_concern)):
+            if value is not None:
+                routing[option] = value
+        token = self._routing.set(routing)
+        try:
+            yield
+        finally:
+            self._routing.reset(token)
+
+    @contextmanager
+    def tenant(self, key):
+        """
+        Context manager setting the tenant whose collections are used by the
+        documents with a callable ``collection_name``::
+
+            with instance.tenant('acme'):
+                Invoice.ensure_indexes()
+                invoices = list(Invoice.find())
+
+        Like :meth:`routing`, the tenant is stored in a context variable of
+        the instance.
+        """
+        token = self._tenant.set(key)
+        try:
+            yield
+        finally:
+            self._tenant.reset(token)
+
     def set_db(self, db):
         """
         Set the database to use whithin this instance.
@@ -151,3 +255,10 @@ class Instance(abc.ABC):
         """
         assert self.is_compatible_with(db)
         self._db = db
+        with self._collections_lock:
+            self._collections.clear()
+
+
+def _read_option_key(option):
+    # Read options are not hashable, compare them by their document
+    return None if option is None else (type(option), repr(option.document))
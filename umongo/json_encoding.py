@@ -0,0 +1,39 @@
+"""JSON encoding of dumped documents"""
+import base64
+import datetime as dt
+import decimal
+import json
+
+from bson import Decimal128, ObjectId
+
+
+__all__ = (
+    'json_default',
+    'json_dumps',
+)
+
+
+def json_default(obj):
+    """
+    Encode the values JSON doesn't support that may remain in dumped data
+    (e.g. in a :class:`umongo.fields.DictField` or from a
+    :class:`umongo.fields.DecimalField`), to be passed as the ``default``
+    argument of a JSON encoder.
+
+    Decimals are encoded as strings to keep their precision, bytes in
+    base64.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (dt.datetime, dt.date)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, Decimal128)):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode()
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+def json_dumps(obj):
+    """Default encoder of :meth:`umongo.document.DocumentImplementation.dump_many`"""
+    return json.dumps(obj, default=json_default, separators=(',', ':')).encode()
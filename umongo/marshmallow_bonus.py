@@ -21,6 +21,8 @@ class ObjectId(ma.fields.Field):
         return str(value)
 
     def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, bson.ObjectId):
+            return value
         try:
             return bson.ObjectId(value)
         except (TypeError, bson.errors.InvalidId):
@@ -13,8 +13,12 @@ def map_entry(entry, fields):
         - command (i.g. $eq)
         - valid field with no attribute name
         - valid field with an attribute name to use instead
+        - namespace, given as a dict of fields (e.g. the ``fullDocument``
+          of a change event)
     """
     field = fields.get(entry)
+    if isinstance(field, dict):
+        return entry, field
     if isinstance(field, ListField) and isinstance(field.inner, EmbeddedField):
         fields = field.inner.embedded_document_cls.schema.fields
     elif isinstance(field, EmbeddedField):
@@ -33,6 +37,22 @@ def map_entry_with_dots(entry, fields):
     return '.'.join(mapped), fields
 
 
+def unmap_entry_with_dots(entry, fields):
+    """
+    Replace the names within the database of a '.' separated entry by the
+    fields' name (reverse of :func:`map_entry_with_dots`).
+    """
+    unmapped = []
+    for sub_entry in entry.split('.'):
+        name = next(
+            (name for name, field in fields.items()
+             if (getattr(field, 'attribute', None) or name) == sub_entry),
+            sub_entry)
+        unmapped.append(name)
+        fields = map_entry(name, fields)[1]
+    return '.'.join(unmapped)
+
+
 def map_query(query, fields):
     """
     Retrieve given fields whithin the query and replace there name with
@@ -41,6 +61,9 @@ def map_query(query, fields):
     if isinstance(query, dict):
         mapped_query = {}
         for entry, entry_query in query.items():
+            if entry == '$expr':
+                mapped_query[entry] = map_expression(entry_query, fields)
+                continue
             mapped_entry, entry_fields = map_entry_with_dots(entry, fields)
             mapped_query[mapped_entry] = map_query(entry_query, entry_fields)
         return mapped_query
@@ -52,3 +75,75 @@ def map_query(query, fields):
     if isinstance(query, EmbeddedDocumentImplementation):
         return query.to_mongo()
     return query
+
+
+def map_expression(expression, fields):
+    """
+    Replace the field paths (i.e. ``"$field"`` strings) of an aggregation
+    expression with the name they have within the database.
+    """
+    if isinstance(expression, str):
+        # `$$` prefix is used for variables
+        if expression.startswith('$') and not expression.startswith('$$'):
+            return '$' + map_entry_with_dots(expression[1:], fields)[0]
+        return expression
+    if isinstance(expression, dict):
+        return {
+            key: value if key == '$literal' else map_expression(value, fields)
+            for key, value in expression.items()
+        }
+    if isinstance(expression, (list, tuple)):
+        return [map_expression(x, fields) for x in expression]
+    return expression
+
+
+# Aggregation stages keeping the documents as they are stored
+_SHAPE_KEEPING_STAGES = ('$match', '$sort', '$limit', '$skip', '$sample')
+
+
+def map_pipeline(pipeline, fields):
+    """
+    Retrieve given fields whithin the leading stages of an aggregation
+    pipeline and replace there name with the one they should have within
+    the database.
+
+    Mapping goes on after the `$match`, `$sort`, `$limit`, `$skip` and
+    `$sample` stages that keep the documents' shape. The first other stage
+    is mapped if it is a `$project`, `$group`, `$addFields` (or `$set`),
+    `$unwind`, `$replaceRoot` (or `$replaceWith`) or `$lookup` stage, the
+    following ones are left untouched given the documents no longer match
+    the fields.
+    """
+    mapped_pipeline = []
+    for idx, stage in enumerate(pipeline):
+        mapped_pipeline.append({
+            operator: _map_stage(operator, spec, fields) for operator, spec in stage.items()
+        })
+        if not set(stage) <= set(_SHAPE_KEEPING_STAGES):
+            return mapped_pipeline + list(pipeline[idx + 1:])
+    return mapped_pipeline
+
+
+def _map_stage(operator, spec, fields):
+    if operator == '$match':
+        return map_query(spec, fields)
+    if operator == '$sort':
+        return {map_entry_with_dots(k, fields)[0]: v for k, v in spec.items()}
+    if operator == '$project':
+        return {
+            map_entry_with_dots(k, fields)[0]: map_expression(v, fields)
+            for k, v in spec.items()
+        }
+    if operator in ('$group', '$addFields', '$set'):
+        # Keys are the names of the output fields
+        return {k: map_expression(v, fields) for k, v in spec.items()}
+    if operator in ('$unwind', '$replaceRoot', '$replaceWith'):
+        return map_expression(spec, fields)
+    if operator == '$lookup':
+        spec = dict(spec)
+        if 'localField' in spec:
+            spec['localField'] = map_entry_with_dots(spec['localField'], fields)[0]
+        if 'let' in spec:
+            spec['let'] = map_expression(spec['let'], fields)
+        return spec
+    return spec